@@ -1,21 +1,15 @@
-from groq import Groq
+from app.llm import complete, stream as stream_completion
 from app.prompt_templates import SQL_PROMPT
-import streamlit as st
-from app.schema import TAB
+from app.schema import get_tab
 
 
-client = Groq(api_key=st.secrets["GROQ_API_KEY"])
-
-def generate_sql(question: str):
-    prompt = SQL_PROMPT.format(question=question,TAB=TAB)
-
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
-
-    return response.choices[0].message.content.strip()
+def build_sql_prompt(question, schema=None):
+    return SQL_PROMPT.format(question=question,TAB=schema if schema is not None else get_tab())
 
 
+def generate_sql(question: str, schema=None, stream=False):
+    prompt = build_sql_prompt(question, schema)
 
+    if stream:
+        return stream_completion(prompt)
+    return complete(prompt)
@@ -1,25 +1,31 @@
-from groq import Groq
-import streamlit as st
 
-client = Groq(api_key=st.secrets['GROQ_API_KEY'])
+from app.llm import complete, stream as stream_completion
+from app.result_summary import summarize_result
+from app.schema_retriever import estimate_tokens
+from common.telemetry import current_span
 
-def explain_result(question, result):
+def build_explain_prompt(question, result):
 
-    prompt = f"""
+    # A bounded digest instead of the DataFrame repr, so the prompt stays
+    # the same size however many rows came back.
+    summary = summarize_result(result)
+    current = current_span()
+    if current is not None:
+        current.set(result_summary_tokens=estimate_tokens(summary))
+
+    return f"""
 User asked:
 {question}
 
-SQL result:
-{result}
+SQL result summary:
+{summary}
 
 Give business insight in 2 lines.
 """
-    
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{'role':'user','content':prompt}],
-        temperature=0,
-    )
-    return response.choices[0].message.content.strip()
 
+def explain_result(question, result, stream=False):
+    prompt = build_explain_prompt(question, result)
 
+    if stream:
+        return stream_completion(prompt)
+    return complete(prompt)
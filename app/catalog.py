@@ -0,0 +1,162 @@
+import threading
+import time
+import weakref
+
+from sqlalchemy import inspect, text
+
+from cache.keys import schema_fingerprint
+from common.telemetry import span
+
+# How often (seconds) a server database is asked whether its schema changed.
+CHECK_INTERVAL = 5.0
+
+VERSION_QUERIES = {
+    "sqlite": "PRAGMA schema_version",
+    "postgresql": """
+        SELECT count(*), md5(string_agg(table_name || '.' || column_name || ':' || data_type,
+                                        ',' ORDER BY table_name, ordinal_position))
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+    """,
+    "mysql": """
+        SELECT COUNT(*), SUM(CRC32(CONCAT(table_name, '.', column_name, ':', column_type)))
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE()
+    """,
+}
+
+
+class SchemaSnapshot:
+    """Everything the pipeline needs to know about a schema, introspected in
+    one pass: columns, primary keys, foreign keys and indexes per table."""
+
+    def __init__(self, tables, version=None):
+        # tables: {name: {"columns": [{"name", "type", "nullable"}],
+        #                 "primary_key": [...], "foreign_keys": [...], "indexes": [...]}}
+        self.tables = tables
+        self.version = version
+        self.loaded_at = time.time()
+        self.fingerprint = schema_fingerprint({
+            name: [(col["name"], col["type"]) for col in info["columns"]]
+            for name, info in tables.items()
+        })
+        self._prompt = None
+
+    @property
+    def table_names(self):
+        return list(self.tables)
+
+    def columns(self, table):
+        return [col["name"] for col in self.tables[table]["columns"]]
+
+    def prompt_string(self, tables=None):
+        if tables is None and self._prompt is not None:
+            return self._prompt
+
+        schema = ""
+        for table in tables if tables is not None else self.tables:
+            schema += f"\nTable: {table}\n"
+            for col in self.tables[table]["columns"]:
+                schema += f"{col['name']} ({col['type']})\n"
+
+        if tables is None:
+            self._prompt = schema
+        return schema
+
+
+def introspect(engine):
+    with span("schema.introspect", dialect=engine.dialect.name):
+        return _introspect(engine)
+
+
+def _introspect(engine):
+    inspector = inspect(engine)
+
+    columns = inspector.get_multi_columns()
+    pks = inspector.get_multi_pk_constraint()
+    fks = inspector.get_multi_foreign_keys()
+    indexes = inspector.get_multi_indexes()
+
+    tables = {}
+    for key in sorted(columns, key=lambda k: k[1]):
+        tables[key[1]] = {
+            "columns": [
+                {"name": col["name"], "type": str(col["type"]), "nullable": col.get("nullable", True)}
+                for col in columns[key]
+            ],
+            "primary_key": list((pks.get(key) or {}).get("constrained_columns") or []),
+            "foreign_keys": [
+                {
+                    "columns": list(fk["constrained_columns"]),
+                    "referred_table": fk["referred_table"],
+                    "referred_columns": list(fk["referred_columns"]),
+                }
+                for fk in fks.get(key, [])
+            ],
+            "indexes": [
+                {"name": idx["name"], "columns": list(idx["column_names"]), "unique": bool(idx.get("unique"))}
+                for idx in indexes.get(key, [])
+            ],
+        }
+    return tables
+
+
+class SchemaCatalog:
+    """Memoized schema for one engine. The snapshot is only re-introspected
+    when a cheap version probe says the schema changed."""
+
+    def __init__(self, engine, check_interval=CHECK_INTERVAL):
+        self.engine = engine
+        self.check_interval = 0.0 if engine.dialect.name == "sqlite" else check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def schema_version(self):
+        query = VERSION_QUERIES.get(self.engine.dialect.name)
+        if query is None:
+            return None
+        try:
+            with self.engine.connect() as conn:
+                return tuple(conn.execute(text(query)).fetchone())
+        except Exception:
+            return None
+
+    def snapshot(self):
+        with self._lock:
+            now = time.time()
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+
+            version = self.schema_version()
+            self._checked_at = now
+            if self._snapshot is not None and version is not None and version == self._snapshot.version:
+                return self._snapshot
+            if self._snapshot is not None and version is None:
+                # No cheap probe for this dialect; keep the snapshot until refresh().
+                return self._snapshot
+
+            self._snapshot = SchemaSnapshot(introspect(self.engine), version)
+            return self._snapshot
+
+    def refresh(self):
+        with self._lock:
+            self._snapshot = None
+        return self.snapshot()
+
+
+_catalogs = weakref.WeakKeyDictionary()
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(engine):
+    with _catalogs_lock:
+        catalog = _catalogs.get(engine)
+        if catalog is None:
+            catalog = SchemaCatalog(engine)
+            _catalogs[engine] = catalog
+        return catalog
+
+
+def get_snapshot(engine):
+    return get_catalog(engine).snapshot()
@@ -0,0 +1,186 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from app.result_summary import looks_like_dates
+from common.config import get_int
+
+# Hard cap on values sent to the browser per chart, across all series.
+CHART_MAX_POINTS = get_int("CHART_MAX_POINTS", 2_000)
+TOP_N = 20
+MAX_SERIES = 4
+
+KEY_COLUMN = re.compile(r"(^|_)(id|key|pk|uuid)$", re.IGNORECASE)
+
+# Time bins from finest to coarsest, with their (longest) width; the first
+# that fits the point budget wins.
+TIME_BINS = [
+    ("min", "minute", pd.Timedelta(minutes=1)),
+    ("h", "hour", pd.Timedelta(hours=1)),
+    ("D", "day", pd.Timedelta(days=1)),
+    ("W", "week", pd.Timedelta(days=7)),
+    ("MS", "month", pd.Timedelta(days=31)),
+    ("QS", "quarter", pd.Timedelta(days=92)),
+    ("YS", "year", pd.Timedelta(days=366)),
+]
+
+
+class ChartPlan:
+    def __init__(self, kind, data, note=None):
+        self.kind = kind            # "line" | "bar"
+        self.data = data            # index = x axis, one column per series
+        self.note = note
+
+    @property
+    def points(self):
+        return self.data.size
+
+
+# ---------------- COLUMNS ----------------
+
+def is_key_column(name, values):
+    # Surrogate keys chart as noise: *_id / id / *_key columns, and integer
+    # columns that are unique and sequential.
+    if KEY_COLUMN.search(str(name)):
+        return True
+    if pd.api.types.is_integer_dtype(values) and len(values) > TOP_N and values.is_unique:
+        return bool(values.is_monotonic_increasing and values.iloc[-1] - values.iloc[0] == len(values) - 1)
+    return False
+
+
+def _x_axis(frame):
+    # -> (column, "time" | "category") or (None, None)
+    text = []
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return column, "time"
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+            continue
+        if looks_like_dates(values.dropna()):
+            return column, "time"
+        if not is_key_column(column, values):
+            text.append(column)
+    return (text[0], "category") if text else (None, None)
+
+
+# ---------------- DOWNSAMPLING ----------------
+
+def lttb(x, y, n):
+    """Largest-Triangle-Three-Buckets: indices of n points that keep the
+    visual shape of (x, y). x must be sorted."""
+    size = len(y)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    y = np.where(np.isnan(y), 0.0, y)
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    picked = np.empty(n, dtype=int)
+    picked[0], picked[-1] = 0, size - 1
+
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else size
+        # Average of the next bucket is the triangle's third corner.
+        cx = x[end:next_end].mean() if next_end > end else x[-1]
+        cy = y[end:next_end].mean() if next_end > end else y[-1]
+        area = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(area.argmax())
+        picked[i + 1] = a
+    return picked
+
+
+def _downsample(data, limit):
+    if len(data) <= limit:
+        return data, None
+    x = data.index.asi8 if isinstance(data.index, pd.DatetimeIndex) else np.arange(len(data))
+    # One set of indices for every series, chosen on the first.
+    keep = lttb(x, data.iloc[:, 0].to_numpy(), limit)
+    return data.iloc[keep], f"downsampled from {len(data):,} to {len(keep):,} points (LTTB)"
+
+
+# ---------------- PLANS ----------------
+
+def _time_plan(frame, x, values, limit):
+    when = pd.to_datetime(frame[x], errors="coerce", format="ISO8601") \
+        if not pd.api.types.is_datetime64_any_dtype(frame[x]) else frame[x]
+    data = frame[values].set_axis(when).loc[when.notna().to_numpy()].sort_index()
+    if data.empty:
+        return None
+    notes = []
+
+    # Raw rows (several per timestamp) are binned; an already aggregated
+    # series is only downsampled, which keeps its values.
+    if data.index.has_duplicates:
+        span = data.index.max() - data.index.min()
+        for freq, label, width in TIME_BINS:
+            if span / width < limit:
+                break
+        data = data.resample(freq).sum(min_count=1).dropna(how="all")
+        notes.append(f"summed per {label}")
+
+    data, note = _downsample(data, limit)
+    if note:
+        notes.append(note)
+    return ChartPlan("line", data, "; ".join(notes) or None)
+
+
+def _category_plan(frame, x, values, limit):
+    if values:
+        data = frame[[x] + values].groupby(x, sort=False, dropna=False).sum(min_count=1)
+        notes = ["summed per " + str(x)] if len(data) < len(frame) else []
+    else:
+        data = frame[x].value_counts(sort=False, dropna=False).rename("count").to_frame()
+        notes = ["row count per " + str(x)]
+    data.index = data.index.astype(str)
+
+    top_n = max(1, min(TOP_N, limit - 1))
+    if len(data) > top_n + 1:
+        ranked = data.iloc[:, 0].abs().sort_values(ascending=False, kind="stable").index
+        top = data.loc[ranked[:top_n]]
+        other = data.loc[ranked[top_n:]].sum(min_count=1).to_frame("Other").T
+        notes.append(f"top {top_n} of {len(data):,}, the rest as Other")
+        data = pd.concat([top, other])
+    return ChartPlan("bar", data, "; ".join(notes) or None)
+
+
+def _index_plan(frame, values, limit):
+    data = frame[values].reset_index(drop=True)
+    data, note = _downsample(data, limit)
+    return ChartPlan("line" if len(frame) > TOP_N else "bar", data, note)
+
+
+def plan_chart(frame, max_points=CHART_MAX_POINTS):
+    """Pick an x axis and value series for a query result and reduce them
+    on the server, so at most `max_points` values reach the browser.
+    Returns None when nothing is worth charting."""
+    if not isinstance(frame, pd.DataFrame) or frame.empty:
+        return None
+
+    frame = frame.loc[:, ~frame.columns.duplicated()]
+    x, axis = _x_axis(frame)
+    values = [
+        c for c in frame.columns
+        if c != x
+        and pd.api.types.is_numeric_dtype(frame[c]) and not pd.api.types.is_bool_dtype(frame[c])
+        and not is_key_column(c, frame[c])
+    ][:MAX_SERIES]
+
+    if not values and (axis != "category" or frame[x].is_unique):
+        return None     # nothing to plot, or a count of 1 per label
+    limit = max(3, max_points // max(1, len(values)))
+
+    if axis == "time":
+        plan = _time_plan(frame, x, values, limit) if values else None
+    elif axis == "category":
+        plan = _category_plan(frame, x, values, limit)
+    else:
+        plan = _index_plan(frame, values, limit)
+
+    if plan is None or plan.data.empty:
+        return None
+    return plan
@@ -1,22 +1,341 @@
-from sqlalchemy import create_engine
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
 import pandas as pd
 
-def create_db_engine(db_type, db_path=None, host=None, user=None, password=None, database=None):
-    
-    if db_type == "sqlite":
-        connection_string = f"sqlite:///{db_path}"
+from cache.result_cache import get_result_cache
+from common.config import get_bool, get_float, get_int
+from common.telemetry import record_cache, span
+
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+
+MAX_ROWS = get_int("QUERY_MAX_ROWS", 10_000)
+TIMEOUT_SECONDS = get_float("QUERY_TIMEOUT_SECONDS", 30.0)
+CHUNK_SIZE = 2_000
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class QueryCancelled(Exception):
+    pass
+
 
-    elif db_type == "mysql":
-        connection_string = f"mysql+pymysql://{user}:{password}@{host}/{database}"
+POOL_SIZE = get_int("DB_POOL_SIZE", 5)
+MAX_OVERFLOW = get_int("DB_MAX_OVERFLOW", 5)
+POOL_TIMEOUT = get_float("DB_POOL_TIMEOUT_SECONDS", 30.0)
+POOL_RECYCLE = get_int("DB_POOL_RECYCLE_SECONDS", 1800)
+POOL_PRE_PING = get_bool("DB_POOL_PRE_PING", True)
+MAX_ENGINES = 16
 
-    elif db_type == "postgres":
-        connection_string = f"postgresql://{user}:{password}@{host}/{database}"
+
+def create_db_engine(db_type, db_path=None, host=None, user=None, password=None, database=None,
+                     read_only=False, immutable=False):
+
+    pool_options = {}
+
+    if db_type == "sqlite":
+        if immutable:
+            # Uploaded files are content-addressed and never modified, so
+            # SQLite can skip locking and change detection entirely.
+            connection_string = f"sqlite:///file:{db_path}?mode=ro&immutable=1&uri=true"
+        elif read_only:
+            connection_string = f"sqlite:///file:{db_path}?mode=ro&uri=true"
+        else:
+            connection_string = f"sqlite:///{db_path}"
+
+    elif db_type in ("mysql", "postgres"):
+        if db_type == "mysql":
+            connection_string = f"mysql+pymysql://{user}:{password}@{host}/{database}"
+        else:
+            connection_string = f"postgresql://{user}:{password}@{host}/{database}"
+        pool_options = {
+            "pool_size": POOL_SIZE,
+            "max_overflow": MAX_OVERFLOW,
+            "pool_timeout": POOL_TIMEOUT,
+            "pool_recycle": POOL_RECYCLE,
+            "pool_pre_ping": POOL_PRE_PING,
+        }
 
     else:
         raise ValueError("Unsupported DB type")
 
-    return create_engine(connection_string)
+    engine = create_engine(connection_string, **pool_options)
+    _attach_pool_metrics(engine)
+
+    if db_type == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _enable_mmap(dbapi_conn, _):
+            dbapi_conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+
+    elif read_only:
+        statement = {
+            "mysql": "SET SESSION TRANSACTION READ ONLY",
+            "postgres": "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY",
+        }[db_type]
+
+        @event.listens_for(engine, "connect")
+        def _read_only_session(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            cursor.execute(statement)
+            cursor.close()
+            dbapi_conn.commit()
+
+    return engine
+
+
+# ---------------- ENGINE REGISTRY ----------------
+
+_engines = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_type, db_path=None, host=None, user=None, password=None, database=None,
+               read_only=True, immutable=False):
+    # One pooled engine per set of connection parameters for the whole
+    # process, so Streamlit reruns and sessions share connections.
+    secret = hashlib.sha256((password or "").encode("utf-8")).hexdigest()
+    key = (db_type, db_path, host, user, secret, database, read_only, immutable)
+
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is not None:
+            _engines.move_to_end(key)
+            return engine
+
+        engine = create_db_engine(db_type, db_path=db_path, host=host, user=user, password=password,
+                                  database=database, read_only=read_only, immutable=immutable)
+        _engines[key] = engine
+        while len(_engines) > MAX_ENGINES:
+            _, evicted = _engines.popitem(last=False)
+            evicted.dispose()
+        return engine
+
+
+# ---------------- POOL METRICS ----------------
+
+class PoolMetrics:
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+
+_pool_metrics = weakref.WeakKeyDictionary()
+
+
+def _attach_pool_metrics(engine):
+    metrics = PoolMetrics()
+    _pool_metrics[engine] = metrics
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(*_):
+        metrics.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(*_):
+        metrics.checkouts += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(*_):
+        metrics.invalidations += 1
+
+
+@contextmanager
+def connect(engine):
+    # engine.connect() that records how long the pool made us wait.
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        metrics = _pool_metrics.get(engine)
+        if metrics is not None:
+            metrics.record_wait(time.perf_counter() - started)
+        yield conn
+
+
+def pool_status(engine):
+    pool = engine.pool
+    metrics = _pool_metrics.get(engine) or PoolMetrics()
+    status = {
+        "pool": type(pool).__name__,
+        "connects": metrics.connects,
+        "checkouts": metrics.checkouts,
+        "invalidations": metrics.invalidations,
+        "avg_wait_ms": metrics.wait_total / metrics.wait_count * 1000 if metrics.wait_count else 0.0,
+        "max_wait_ms": metrics.wait_max * 1000,
+    }
+    for name in ("size", "checkedout", "checkedin", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
+
+
+# ---------------- EXECUTION ----------------
+
+class CancelToken:
+    """Handed to run_query by the caller; cancel() may be called from any
+    thread and interrupts the statement on the server where possible."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def _register(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+            if self.cancelled:
+                callback()
+
+    def _unregister(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class QueryResult:
+    def __init__(self, frame, truncated, elapsed, max_rows, cached=False):
+        self.frame = frame
+        self.truncated = truncated
+        self.elapsed = elapsed
+        self.max_rows = max_rows
+        self.cached = cached
+        self.rows = len(frame)
+        self.bytes = int(frame.memory_usage(index=False, deep=True).sum()) if len(frame.columns) else 0
+
+
+def _limit_statement(conn, timeout, deadline, token):
+    # Per-dialect statement timeout plus a cancel hook; returns a cleanup callable.
+    dialect = conn.dialect.name
+    dbapi_conn = conn.connection.dbapi_connection
+    ms = int(timeout * 1000)
+
+    if dialect == "sqlite":
+        def progress():
+            return 1 if token.cancelled or time.perf_counter() > deadline else 0
+
+        dbapi_conn.set_progress_handler(progress, 10_000)
+        token._register(dbapi_conn.interrupt)
+
+        def cleanup():
+            token._unregister(dbapi_conn.interrupt)
+            dbapi_conn.set_progress_handler(None, 0)
+        return cleanup
+
+    if dialect == "postgresql":
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {ms}")
+        cancel = getattr(dbapi_conn, "cancel", None)
+        if cancel is not None:
+            token._register(cancel)
+        return lambda: cancel is not None and token._unregister(cancel)
+
+    if dialect == "mysql":
+        conn.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {ms}")
+        connection_id = conn.exec_driver_sql("SELECT CONNECTION_ID()").scalar()
+
+        def kill():
+            with conn.engine.connect() as killer:
+                killer.exec_driver_sql(f"KILL QUERY {int(connection_id)}")
+
+        token._register(kill)
+
+        def cleanup():
+            token._unregister(kill)
+            conn.exec_driver_sql("SET SESSION MAX_EXECUTION_TIME = 0")
+        return cleanup
+
+    return lambda: None
+
+
+def run_query(engine, sql, max_rows=MAX_ROWS, timeout=TIMEOUT_SECONDS, chunk_size=CHUNK_SIZE, cancel=None,
+              use_cache=True):
+    with span("db.query", dialect=engine.dialect.name) as current:
+        result = _run_query(engine, sql, max_rows, timeout, chunk_size, cancel, use_cache)
+        current.set(rows=result.rows, cached=result.cached, truncated=result.truncated)
+        return result
+
+
+def _run_query(engine, sql, max_rows, timeout, chunk_size, cancel, use_cache):
+    token = cancel or CancelToken()
+    started = time.perf_counter()
+    deadline = started + timeout
+
+    cache = get_result_cache() if use_cache else None
+    cache_key = cache.key(engine, sql, max_rows) if cache is not None else None
+    if cache_key is not None:
+        hit = cache.get(cache_key)
+        record_cache("result", hit is not None)
+        if hit is not None:
+            frame, truncated = hit
+            return QueryResult(frame, truncated, time.perf_counter() - started, max_rows, cached=True)
+
+    rows = []
+    truncated = False
+
+    with connect(engine) as conn:
+        cleanup = _limit_statement(conn, timeout, deadline, token)
+        try:
+            result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(text(sql))
+            columns = list(result.keys())
+
+            while True:
+                chunk = result.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                rows.extend(chunk)
+                if max_rows is not None and len(rows) > max_rows:
+                    del rows[max_rows:]
+                    truncated = True
+                    break
+                if token.cancelled:
+                    raise QueryCancelled("Query cancelled.")
+                if time.perf_counter() > deadline:
+                    raise QueryTimeout(f"Query exceeded {timeout:g}s while fetching rows.")
+
+            result.close()
+        except DBAPIError as e:
+            if token.cancelled:
+                raise QueryCancelled("Query cancelled.") from e
+            if time.perf_counter() > deadline or "timeout" in str(e).lower():
+                raise QueryTimeout(f"Query exceeded {timeout:g}s.") from e
+            raise
+        finally:
+            cleanup()
+            conn.rollback()
+
+    # coerce_float, as pd.read_sql did: server NUMERIC / SUM / AVG come back as Decimal.
+    frame = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    if cache_key is not None:
+        cache.put(cache_key, frame, truncated)
+    return QueryResult(frame, truncated, time.perf_counter() - started, max_rows)
 
 
-def execute(engine, sql):
-    return pd.read_sql(sql, engine)
\ No newline at end of file
+def execute(engine, sql, max_rows=MAX_ROWS):
+    return run_query(engine, sql, max_rows=max_rows).frame
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from cache.caching import get_sql_cache
+from cache.keys import make_cache_key, normalize_question
+from cache.write_behind import WriteBehind
+from common.config import get_float, get_setting
+
+HISTORY_PATH = get_setting("HISTORY_PATH", "cache/query_history.db")
+FLUSH_INTERVAL = get_float("HISTORY_FLUSH_INTERVAL", 1.0)
+FLUSH_BATCH = 1_000
+
+COLUMNS = (
+    "created_at", "question", "question_key", "fingerprint", "level", "sql", "source",
+    "rows", "error", "total_ms", "timings", "prompt_tokens", "completion_tokens",
+)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS query_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at REAL NOT NULL,
+        question TEXT NOT NULL,
+        question_key TEXT NOT NULL,
+        fingerprint TEXT,
+        level INTEGER,
+        sql TEXT,
+        source TEXT,
+        rows INTEGER,
+        error TEXT,
+        total_ms REAL,
+        timings TEXT,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER
+    )
+    """,
+    # "Recent for this schema" walks (fingerprint, id) backwards; "most
+    # frequent" groups on (fingerprint, question_key) without a sort.
+    "CREATE INDEX IF NOT EXISTS idx_query_history_fingerprint ON query_history(fingerprint, id)",
+    "CREATE INDEX IF NOT EXISTS idx_query_history_question ON query_history(fingerprint, question_key)",
+]
+
+
+class QueryHistory:
+    """Append-only log of answered questions in SQLite (WAL). record() only
+    queues the row; a writer thread inserts the queue in batches."""
+
+    def __init__(self, path=HISTORY_PATH, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().close()
+
+        self._writer = WriteBehind(self.flush, flush_interval, "history-writer")
+
+    # ---------------- WRITE ----------------
+
+    def record(self, question, fingerprint=None, sql=None, source=None, rows=None, error=None,
+               timings=None, usage=None, level=None):
+        # timings: {stage: seconds}, with the end-to-end time under "total".
+        timings = dict(timings or {})
+        usage = usage or {}
+        total = timings.pop("total", None)
+        row = (
+            time.time(), question, normalize_question(question), fingerprint, level, sql, source,
+            rows, error,
+            round(total * 1000, 3) if total is not None else None,
+            json.dumps({stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}),
+            usage.get("prompt_tokens"), usage.get("completion_tokens"),
+        )
+        with self._lock:
+            self._pending.append(row)
+            backlog = len(self._pending)
+        if backlog >= FLUSH_BATCH:
+            self._writer.wake()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO query_history ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                        pending
+                    )
+            except sqlite3.Error:
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+            finally:
+                conn.close()
+
+    def close(self):
+        self._writer.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    # ---------------- READ ----------------
+
+    def _fetch(self, sql, params):
+        # Reads never wait for the writer: rows still queued show up in
+        # recent() from memory, elsewhere once the next flush lands.
+        conn = self._connect()
+        try:
+            rows = [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+        for row in rows:
+            if row.get("timings"):
+                row["timings"] = json.loads(row["timings"])
+        return rows
+
+    def _queued(self, fingerprint=None):
+        # Not yet written rows, newest first, shaped like fetched ones (no id).
+        with self._lock:
+            pending = list(self._pending)
+        rows = []
+        for values in reversed(pending):
+            row = dict(zip(COLUMNS, values), id=None)
+            if fingerprint is None or row["fingerprint"] == fingerprint:
+                row["timings"] = json.loads(row["timings"])
+                rows.append(row)
+        return rows
+
+    def recent(self, limit=20, before=None, fingerprint=None):
+        # Keyset pagination: pass the last id of one page as `before` to
+        # get the next (older) page. The first page leads with queued rows,
+        # leaving room for at least one stored row to page from.
+        queued = self._queued(fingerprint)[:max(0, limit - 1)] if before is None else []
+        where, params = [], []
+        if fingerprint is not None:
+            where.append("fingerprint = ?")
+            params.append(fingerprint)
+        if before is not None:
+            where.append("id < ?")
+            params.append(before)
+        return queued + self._fetch(
+            "SELECT * FROM query_history"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY id DESC LIMIT ?",
+            params + [limit - len(queued)]
+        )
+
+    def frequent(self, limit=20, offset=0, fingerprint=None, successful=False):
+        # SQLite takes the bare columns from the row that holds MAX(id), so
+        # question and sql are from the latest run of each question.
+        where, params = [], []
+        if fingerprint is not None:
+            where.append("fingerprint = ?")
+            params.append(fingerprint)
+        if successful:
+            where.append("error IS NULL AND sql IS NOT NULL")
+        return self._fetch(
+            "SELECT MAX(id) AS id, fingerprint, question, sql, source, rows, "
+            "COUNT(*) AS runs, SUM(error IS NOT NULL) AS errors, AVG(total_ms) AS avg_ms, "
+            "MAX(created_at) AS last_run FROM query_history"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " GROUP BY fingerprint, question_key ORDER BY runs DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+
+    def count(self, fingerprint=None):
+        if fingerprint is None:
+            return self._fetch("SELECT COUNT(*) AS n FROM query_history", [])[0]["n"]
+        return self._fetch("SELECT COUNT(*) AS n FROM query_history WHERE fingerprint = ?", [fingerprint])[0]["n"]
+
+    def workload(self, fingerprint=None, limit=10_000):
+        # SQL of the latest successful runs, repeats kept so a consumer like
+        # the index advisor weights statements by how often they ran.
+        where = "error IS NULL AND sql IS NOT NULL"
+        params = []
+        if fingerprint is not None:
+            where += " AND fingerprint = ?"
+            params.append(fingerprint)
+        rows = self._fetch(f"SELECT sql FROM query_history WHERE {where} ORDER BY id DESC LIMIT ?", params + [limit])
+        return [row["sql"] for row in rows]
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = QueryHistory()
+    return _history
+
+
+def record_query(question, **fields):
+    get_history().record(question, **fields)
+
+
+# ---------------- CONSUMERS ----------------
+
+def warm_cache(fingerprint, limit=500):
+    """Put the SQL of the most frequent successful questions for a schema
+    back into the exact cache. Returns how many keys were added."""
+    cache = get_sql_cache()
+    added = 0
+    for entry in get_history().frequent(limit, fingerprint=fingerprint, successful=True):
+        key = make_cache_key(fingerprint, entry["question"])
+        if key not in cache:
+            cache.put(key, entry["sql"])
+            added += 1
+    return added
+
+
+def export(path, fingerprint=None, limit=1_000):
+    # .jsonl: one {"question", "sql", "runs"} per line (an index advisor
+    # workload); anything else: one question per line, which
+    # `python -m app.pipeline` replays.
+    entries = get_history().frequent(limit, fingerprint=fingerprint, successful=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            if path.endswith(".jsonl"):
+                record = {"question": entry["question"], "sql": entry["sql"], "runs": entry["runs"]}
+                f.write(json.dumps(record) + "\n")
+            else:
+                f.write(" ".join(entry["question"].split()) + "\n")
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, export or replay the query history.")
+    parser.add_argument("command", choices=["recent", "frequent", "export", "warm"])
+    parser.add_argument("--db", help="only this SQLite database's schema (required for warm)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("-o", "--output", help="export path: .jsonl workload or a question file")
+    args = parser.parse_args(argv)
+
+    fingerprint = None
+    if args.db:
+        from app.catalog import get_snapshot
+        from app.db_engine import get_engine
+        fingerprint = get_snapshot(get_engine("sqlite", db_path=args.db)).fingerprint
+
+    history = get_history()
+    if args.command == "recent":
+        entries = history.recent(args.limit, fingerprint=fingerprint)
+    elif args.command == "frequent":
+        entries = history.frequent(args.limit, fingerprint=fingerprint)
+    elif args.command == "export":
+        if not args.output:
+            parser.error("export needs -o/--output")
+        print(f"Exported {export(args.output, fingerprint, args.limit)} questions to {args.output}", file=sys.stderr)
+        return
+    else:
+        if fingerprint is None:
+            parser.error("warm needs --db")
+        print(f"Added {warm_cache(fingerprint, args.limit)} questions to the SQL cache", file=sys.stderr)
+        return
+
+    for entry in entries:
+        print(json.dumps(entry, default=str))
+
+
+if __name__ == "__main__":
+    main()
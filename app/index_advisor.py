@@ -0,0 +1,411 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from app.catalog import get_snapshot
+from app.db_engine import get_engine
+from app.history import get_history
+from app.query_analyzer import RANGE_FRACTION, SORT_WEIGHT, explain_tree, get_table_stats, table_aliases
+from cache.caching import get_sql_cache
+from common.sql_tokens import canonicalize, tokenize
+
+SAMPLE_ROWS = 100_000
+VALIDATE_REPEAT = 3
+VALIDATE_TIMEOUT = 10.0
+
+EQ_OPS = {"=", "IN", "IS"}
+RANGE_OPS = {"<", ">", "<=", ">=", "BETWEEN", "LIKE"}
+
+
+# ---------------- WORKLOAD ----------------
+
+def load_workload(path):
+    # .jsonl with a "sql" field per line (app.pipeline output), .json list
+    # of {"sql": ...} or a benchmark report, or plain ';'-separated SQL.
+    with open(path, encoding="utf-8") as f:
+        data = f.read()
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["sql"] for line in data.splitlines() if line.strip() and json.loads(line).get("sql")]
+    if path.endswith(".json"):
+        items = json.loads(data)
+        if isinstance(items, dict):
+            items = items.get("questions", [])
+        return [item["sql"] for item in items if item.get("sql")]
+    return [statement.strip() for statement in data.split(";") if statement.strip()]
+
+
+def cached_workload():
+    return [sql for _, sql in get_sql_cache().items()]
+
+
+def history_workload(fingerprint=None):
+    # One entry per recorded run, so frequent queries weigh more.
+    return get_history().workload(fingerprint)
+
+
+# ---------------- COLUMN MINING ----------------
+
+def column_uses(sql, snapshot):
+    """Columns of one statement by role: eq / range filters, join keys and
+    GROUP BY / ORDER BY columns, as {table: {role: [column, ...]}}."""
+    tables = {t.lower(): t for t in snapshot.table_names}
+    aliases = {a: t for a, t in table_aliases(sql).items() if t.lower() in tables}
+    in_query = {tables[t.lower()] for t in aliases.values()}
+    owners = defaultdict(list)
+    for table in in_query:
+        for column in snapshot.columns(table):
+            owners[column.lower()].append((table, column))
+
+    tokens = tokenize(sql)
+    refs = []                       # (start, end, table, column, clause)
+    stack = ["SELECT"]
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.value == "(":
+            window = i > 0 and tokens[i - 1].upper == "OVER"
+            stack.append("WINDOW" if window else stack[-1])
+        elif token.value == ")":
+            if len(stack) > 1:
+                stack.pop()
+        elif token.kind == "keyword" and stack[-1] != "WINDOW":
+            if token.upper in ("SELECT", "FROM", "WHERE", "HAVING", "ON", "LIMIT", "USING"):
+                stack[-1] = token.upper
+            elif token.upper in ("GROUP", "ORDER"):
+                stack[-1] = token.upper
+            elif token.upper == "JOIN":
+                stack[-1] = "FROM"
+        elif token.kind == "ident" and not (i > 0 and tokens[i - 1].value == "."):
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+            if nxt is not None and nxt.value == "(":
+                pass    # function call
+            elif nxt is not None and nxt.value == "." and i + 2 < len(tokens):
+                table = aliases.get(token.value.lower())
+                column = tokens[i + 2].value
+                if table and column.lower() in {c.lower() for c in snapshot.columns(tables[table.lower()])}:
+                    refs.append((i, i + 2, tables[table.lower()], column, stack[-1]))
+                i += 2
+            else:
+                candidates = owners.get(token.value.lower(), [])
+                if len(candidates) == 1:
+                    refs.append((i, i, candidates[0][0], candidates[0][1], stack[-1]))
+        i += 1
+
+    ref_at = {ref[0]: ref for ref in refs}
+    ref_end = {ref[1]: ref for ref in refs}
+
+    uses = defaultdict(lambda: defaultdict(list))
+    for start, end, table, column, clause in refs:
+        if clause in ("GROUP", "ORDER"):
+            uses[table][clause.lower()].append(column)
+            continue
+        if clause not in ("WHERE", "ON"):
+            continue
+
+        after = tokens[end + 1] if end + 1 < len(tokens) else None
+        before = tokens[start - 1] if start > 0 else None
+        if after is not None and after.upper in EQ_OPS:
+            op, other = after.upper, ref_at.get(end + 2)
+        elif after is not None and after.upper in RANGE_OPS:
+            op, other = after.upper, None
+        elif before is not None and before.upper in EQ_OPS | RANGE_OPS:
+            op, other = before.upper, ref_end.get(start - 2)
+        else:
+            continue
+
+        if op == "=" and other is not None and other[2] != table:
+            uses[table]["join"].append(column)
+        elif op in EQ_OPS:
+            uses[table]["eq"].append(column)
+        else:
+            uses[table]["range"].append(column)
+
+    return {table: {role: list(dict.fromkeys(cols)) for role, cols in roles.items()} for table, roles in uses.items()}
+
+
+def _candidates(uses):
+    # -> [(table, columns, kind)] for one statement.
+    found = []
+    for table, roles in uses.items():
+        eq, rng = roles.get("eq", []), [c for c in roles.get("range", []) if c not in roles.get("eq", [])]
+        if eq or rng:
+            found.append((table, tuple(eq + rng[:1]), "filter"))
+        for column in roles.get("join", []):
+            found.append((table, (column,), "join"))
+        if roles.get("group"):
+            found.append((table, tuple(roles["group"]), "group"))
+        elif roles.get("order"):
+            found.append((table, tuple(eq + [c for c in roles["order"] if c not in eq]), "order"))
+    return found
+
+
+def _covered(snapshot, table, columns):
+    # An existing index (or the rowid primary key) whose leading columns
+    # already are the candidate.
+    wanted = [c.lower() for c in columns]
+    info = snapshot.tables[table]
+    existing = [[c.lower() for c in idx["columns"] if c] for idx in info["indexes"]]
+    existing.append([c.lower() for c in info["primary_key"]])
+    return any(cols and cols[:len(wanted)] == wanted for cols in existing)
+
+
+# ---------------- BENEFIT ----------------
+
+class Proposal:
+    def __init__(self, table, columns, kind):
+        self.table = table
+        self.columns = columns
+        self.kinds = {kind}
+        self.benefit = 0.0
+        self.statements = []
+        self.validation = None
+
+    @property
+    def name(self):
+        return "idx_" + "_".join([self.table] + list(self.columns)).lower()
+
+    @property
+    def statement(self):
+        def quote(name):
+            return name if name.isidentifier() else f'"{name}"'
+        return f"CREATE INDEX {self.name} ON {quote(self.table)} ({', '.join(quote(c) for c in self.columns)});"
+
+
+class _Distinct:
+    """Sampled distinct-value counts, for the selectivity of a new index."""
+
+    def __init__(self, engine, stats):
+        self.engine = engine
+        self.stats = stats
+        self._cache = {}
+
+    def __call__(self, table, column):
+        key = (table, column)
+        if key not in self._cache:
+            quote = self.engine.dialect.identifier_preparer.quote
+            with self.engine.connect() as conn:
+                total, distinct = conn.exec_driver_sql(
+                    f"SELECT COUNT(*), COUNT(DISTINCT {quote(column)}) "
+                    f"FROM (SELECT {quote(column)} FROM {quote(table)} LIMIT {SAMPLE_ROWS}) AS s"
+                ).fetchone()
+            rows = self.stats.rows(table) or total
+            if total < SAMPLE_ROWS or distinct < total * 0.1:
+                self._cache[key] = max(1, distinct)
+            else:
+                self._cache[key] = max(1, int(distinct * rows / max(total, 1)))
+        return self._cache[key]
+
+
+def _benefit(plan, proposal, kind, uses, stats, distinct):
+    rows = stats.rows(proposal.table) or 0
+    roles = uses[proposal.table]
+    selectivity = 1.0
+    for column in proposal.columns:
+        if column in roles.get("eq", []) or column in roles.get("join", []):
+            selectivity /= distinct(proposal.table, column)
+        elif column in roles.get("range", []):
+            selectivity *= RANGE_FRACTION
+    after_rows = max(1.0, rows * selectivity)
+
+    benefit = 0.0
+    for node in plan.walk():
+        if node.table is None or node.table.lower() != proposal.table.lower():
+            continue
+        if node.op == "BUILD":
+            benefit += node.rows or 0             # automatic index no longer needed
+        elif node.access == "scan" and kind in ("filter", "join"):
+            if kind == "join" and node.loops <= 1:
+                continue
+            benefit += max(0.0, (node.rows or 0) - after_rows) * node.loops
+        elif node.access == "range" and kind == "filter" and len(proposal.columns) > 1:
+            benefit += max(0.0, (node.rows or 0) - after_rows) * node.loops
+
+    if kind in ("group", "order"):
+        label = "GROUP BY" if kind == "group" else "ORDER BY"
+        tables_used = {n.table.lower() for n in plan.walk() if n.access and n.table}
+        if tables_used == {proposal.table.lower()}:
+            for node in plan.walk():
+                if node.sort and label in node.detail:
+                    benefit += SORT_WEIGHT * (node.rows or 0) * node.loops
+    return benefit
+
+
+def advise(engine, statements, top=10):
+    snapshot = get_snapshot(engine)
+    stats = get_table_stats(engine)
+    distinct = _Distinct(engine, stats)
+
+    weights = Counter()
+    originals = {}
+    for sql in statements:
+        key = canonicalize(sql)
+        weights[key] += 1
+        originals.setdefault(key, sql)
+
+    proposals = {}
+    analyzed = 0
+    for key, weight in weights.items():
+        sql = originals[key]
+        try:
+            plan = explain_tree(engine, sql, stats)
+            uses = column_uses(sql, snapshot)
+        except Exception:
+            continue    # other schema, or not valid here
+        analyzed += 1
+
+        seen = set()
+        for table, columns, kind in _candidates(uses):
+            if not columns or (table, columns) in seen or _covered(snapshot, table, columns):
+                continue
+            seen.add((table, columns))
+            proposal = proposals.get((table, columns)) or Proposal(table, columns, kind)
+            benefit = _benefit(plan, proposal, kind, uses, stats, distinct)
+            if benefit <= 0:
+                continue
+            proposals[(table, columns)] = proposal
+            proposal.kinds.add(kind)
+            proposal.benefit += benefit * weight
+            proposal.statements.append(sql)
+
+    ranked = sorted(proposals.values(), key=lambda p: p.benefit, reverse=True)
+    return ranked[:top], {"statements": sum(weights.values()), "distinct": len(weights), "analyzed": analyzed}
+
+
+# ---------------- VALIDATION (SQLite) ----------------
+
+def _time(conn, sql, repeat, timeout):
+    best = None
+    for _ in range(repeat):
+        deadline = time.perf_counter() + timeout
+        conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, 10_000)
+        started = time.perf_counter()
+        try:
+            conn.execute(sql).fetchall()
+        except sqlite3.OperationalError:
+            return None     # interrupted: slower than the timeout
+        finally:
+            conn.set_progress_handler(None, 0)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def validate(db_path, proposals, repeat=VALIDATE_REPEAT, timeout=VALIDATE_TIMEOUT):
+    # Builds each index on a scratch copy, one at a time, and re-times the
+    # statements it was proposed for. The original file is never written.
+    scratch_dir = tempfile.mkdtemp(prefix="text2sql_advisor_")
+    scratch = os.path.join(scratch_dir, "scratch.db")
+    try:
+        source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        target = sqlite3.connect(scratch)
+        source.backup(target)
+        source.close()
+
+        baseline = {}
+        for proposal in proposals:
+            for sql in proposal.statements:
+                if sql not in baseline:
+                    baseline[sql] = _time(target, sql, repeat, timeout)
+
+            started = time.perf_counter()
+            target.execute(proposal.statement)
+            target.execute(f"ANALYZE {proposal.name}")
+            build = time.perf_counter() - started
+
+            before = after = 0.0
+            used = 0
+            for sql in proposal.statements:
+                plan = " ".join(str(row[-1]) for row in target.execute(f"EXPLAIN QUERY PLAN {sql}"))
+                used += proposal.name in plan
+                timed = _time(target, sql, repeat, timeout)
+                before += baseline[sql] if baseline[sql] is not None else timeout
+                after += timed if timed is not None else timeout
+
+            proposal.validation = {
+                "before_ms": round(before * 1000, 2),
+                "after_ms": round(after * 1000, 2),
+                "used_by": used,
+                "build_s": round(build, 2),
+            }
+            target.execute(f"DROP INDEX {proposal.name}")
+            target.execute("DELETE FROM sqlite_stat1 WHERE idx = ?", (proposal.name,))
+        target.close()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return proposals
+
+
+# ---------------- REPORT ----------------
+
+def format_report(proposals, summary):
+    lines = [
+        f"Index advisor: {summary['statements']} statements "
+        f"({summary['distinct']} distinct, {summary['analyzed']} analyzed), {len(proposals)} proposals",
+        "Nothing below has been applied.",
+        "",
+    ]
+    for n, proposal in enumerate(proposals, 1):
+        lines.append(f"{n:2}. {proposal.statement}")
+        lines.append(
+            f"    ~{int(proposal.benefit):,} fewer rows read per workload run, "
+            f"{len(proposal.statements)} statement(s), {'/'.join(sorted(proposal.kinds))}"
+        )
+        check = proposal.validation
+        if check is not None:
+            helped = check["used_by"] and check["after_ms"] < check["before_ms"] * 0.9
+            lines.append(
+                f"    validated: {check['before_ms']:,.1f} ms -> {check['after_ms']:,.1f} ms, used by "
+                f"{check['used_by']}/{len(proposal.statements)}, built in {check['build_s']:.2f}s"
+                + ("" if helped else "  (no measurable gain)")
+            )
+    if not proposals:
+        lines.append("No missing indexes found for this workload.")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Propose indexes for a SQL workload. Report only; nothing is applied.")
+    parser.add_argument("--db", default="database/data.db", help="SQLite database to analyze")
+    parser.add_argument("--workload", action="append", default=[],
+                        help="SQL workload file (.sql, pipeline .jsonl, or .json); repeatable")
+    parser.add_argument("--no-cache", action="store_true", help="ignore SQL from the query cache")
+    parser.add_argument("--no-history", action="store_true", help="ignore SQL from the query history")
+    parser.add_argument("--top", type=int, default=10, help="number of proposals")
+    parser.add_argument("--validate", action="store_true", help="build each index on a scratch copy and re-time")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of text")
+    args = parser.parse_args(argv)
+
+    engine = get_engine("sqlite", db_path=args.db)
+
+    statements = [] if args.no_cache else cached_workload()
+    if not args.no_history:
+        statements += history_workload(get_snapshot(engine).fingerprint)
+    for path in args.workload:
+        statements += load_workload(path)
+
+    proposals, summary = advise(engine, statements, top=args.top)
+    if args.validate and proposals:
+        validate(args.db, proposals)
+
+    if args.json:
+        print(json.dumps({
+            "summary": summary,
+            "proposals": [
+                {"statement": p.statement, "benefit_rows": int(p.benefit), "kinds": sorted(p.kinds),
+                 "statements": len(p.statements), "validation": p.validation}
+                for p in proposals
+            ],
+        }, indent=2))
+    else:
+        print(format_report(proposals, summary))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from cache.llm_cache import ENABLED as LLM_CACHE_ENABLED, CachedClient
+from common.config import get_int, get_setting
+from common.telemetry import current_span, record_llm, span, traced
+
+MODEL = "llama-3.3-70b-versatile"
+
+_client = None
+_client_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Caps in-flight Groq requests across the whole process (batch runs fan out
+# from many threads); 429s are retried by the SDK, which honours retry-after.
+MAX_CONCURRENCY = get_int("LLM_MAX_CONCURRENCY", 4)
+MAX_RETRIES = get_int("LLM_MAX_RETRIES", 6)
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+# Usage totals of every track_usage() block currently open in this context.
+_usage_scopes = ContextVar("usage_scopes", default=())
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from groq import Groq
+
+                api_key = get_setting("GROQ_API_KEY")
+                if not api_key:
+                    raise RuntimeError(
+                        "GROQ_API_KEY is not set (environment, .env or Streamlit secrets)."
+                    )
+                _client = Groq(api_key=api_key, max_retries=MAX_RETRIES)
+                if LLM_CACHE_ENABLED:
+                    _client = CachedClient(_client)
+    return _client
+
+
+def set_client(client, cache=False):
+    # Stand-ins are not cached by default: their answers would be stored
+    # under the real model's name.
+    global _client
+    with _client_lock:
+        _client = CachedClient(client) if cache else client
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_int("LLM_MAX_WORKERS", 8),
+                    thread_name_prefix="llm"
+                )
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    # Run in the shared pool with the caller's context, so track_usage()
+    # scopes opened by the caller also see calls made by the worker.
+    context = copy_context()
+    return get_executor().submit(context.run, fn, *args, **kwargs)
+
+
+@contextmanager
+def track_usage():
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    token = _usage_scopes.set(_usage_scopes.get() + (totals,))
+    try:
+        yield totals
+    finally:
+        _usage_scopes.reset(token)
+
+
+def record_usage(usage):
+    record_llm(usage)
+    for totals in _usage_scopes.get():
+        totals["calls"] += 1
+        if usage is None:
+            continue
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            totals[field] += getattr(usage, field, 0) or 0
+
+
+def complete(prompt, model=MODEL, temperature=0):
+    with span("llm.complete", model=model):
+        with _slots:
+            response = get_client().chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature
+            )
+        if not getattr(response, "cached", False):
+            record_usage(getattr(response, "usage", None))
+    return response.choices[0].message.content.strip()
+
+
+def stream(prompt, model=MODEL, temperature=0):
+    return traced("llm.stream", _stream_tokens(prompt, model, temperature), model=model)
+
+
+def _stream_tokens(prompt, model, temperature):
+    # Runs under the llm.stream span that traced() makes current.
+    current = current_span()
+    usage = None
+    with _slots:
+        response = get_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            stream=True
+        )
+
+        for chunk in response:
+            # Groq reports usage on the last chunk, under x_groq.
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None) or usage
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if "first_token_ms" not in current.attrs:
+                        current.set(first_token_ms=round((time.perf_counter() - current.started) * 1000, 3))
+                    yield delta
+    if not getattr(response, "cached", False):
+        record_usage(usage)
+
+
+class BackgroundStream:
+    """Consumes a token iterator on the shared pool while the caller does
+    other work; iterating yields what has arrived so far, then blocks for the
+    rest. started/first_token_at/finished_at are perf_counter timestamps."""
+
+    _DONE = object()
+
+    def __init__(self, tokens_factory, *args, **kwargs):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.text = ""
+        self._queue = queue.Queue()
+        self._error = None
+        self.future = submit(self._run, tokens_factory, args, kwargs)
+
+    def _run(self, tokens_factory, args, kwargs):
+        try:
+            for token in tokens_factory(*args, **kwargs):
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                self.text += token
+                self._queue.put(token)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.finished_at = time.perf_counter()
+            self._queue.put(self._DONE)
+
+    def __iter__(self):
+        while True:
+            token = self._queue.get()
+            if token is self._DONE:
+                self._queue.put(self._DONE)
+                break
+            yield token
+        if self._error is not None:
+            raise self._error
+
+    def result(self):
+        for _ in self:
+            pass
+        return self.text.strip()
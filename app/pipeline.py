@@ -0,0 +1,339 @@
+import argparse
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from app.agent import generate_sql
+from app.analyst import explain_result
+from app.catalog import get_snapshot
+from app.db_engine import MAX_ROWS, get_engine, run_query
+from app.history import record_query
+from app.llm import track_usage
+from app.planner_agent import generate_sql_from_plan
+from app.query_analyzer import QueryTooExpensive, assess_query
+from app.schema_retriever import get_retriever
+from app.sql_validator import validate_sql
+
+from cache.caching import get_cached_sql, store_sql
+from cache.keys import make_cache_key
+from cache.semantic_cache import get_semantic_sql, store_semantic_sql
+from cache.template_cache import get_template_sql, same_literals
+from common.config import get_int
+from common.telemetry import record_cache, span, traced, write_prometheus
+
+SCHEMA_TOP_K = get_int("SCHEMA_TOP_K", 4)
+
+LEVEL_HEADING = re.compile(r"LEVEL\s+(\d+)\s*[—-]\s*(.*)")
+
+
+class PipelineResult:
+    def __init__(self, question, level=None):
+        self.question = question
+        self.level = level
+        self.sql = None
+        self.source = None          # "exact" | "template" | "semantic" | "llm"
+        self.plan = None
+        self.corrected = False
+        self.cost = None            # QueryAssessment
+        self.result = None          # QueryResult
+        self.insight = None
+        self.error = None
+        self.timings = {}
+        self.usage = {}
+
+    @property
+    def frame(self):
+        return self.result.frame if self.result is not None else None
+
+    def to_dict(self, sample_rows=5):
+        data = {
+            "question": self.question,
+            "level": self.level,
+            "sql": self.sql,
+            "source": self.source,
+            "plan": self.plan,
+            "corrected": self.corrected,
+            "cost_action": self.cost.action if self.cost is not None else None,
+            "estimated_rows": self.cost.estimate.cost if self.cost is not None and self.cost.estimate else None,
+            "rows": self.result.rows if self.result is not None else None,
+            "truncated": self.result.truncated if self.result is not None else None,
+            "insight": self.insight,
+            "error": self.error,
+            "timings": {k: round(v, 6) for k, v in self.timings.items()},
+            "usage": self.usage,
+        }
+        if self.result is not None and sample_rows:
+            sample = self.result.frame.head(sample_rows)
+            data["sample"] = json.loads(sample.to_json(orient="records", date_format="iso"))
+        return data
+
+
+class Text2SQLPipeline:
+    """question -> cache -> generate -> validate -> execute -> explain, for
+    one engine. The step methods are what app2 drives interactively; run()
+    and run_many() chain them for headless and batch use."""
+
+    def __init__(self, engine, use_planner=False, explain=True, schema_top_k=SCHEMA_TOP_K,
+                 max_rows=MAX_ROWS, sample_values=None, cost_check=True, history=True):
+        self.engine = engine
+        self.use_planner = use_planner
+        self.explain_results = explain
+        self.schema_top_k = schema_top_k
+        self.max_rows = max_rows
+        self.sample_values = engine.dialect.name == "sqlite" if sample_values is None else sample_values
+        self.cost_check = cost_check
+        self.history = history
+
+    # ---------------- STEPS ----------------
+
+    @property
+    def snapshot(self):
+        return get_snapshot(self.engine)
+
+    def question_schema(self, question, snapshot=None):
+        snapshot = snapshot or self.snapshot
+        with span("schema_retrieval"):
+            retriever = get_retriever(snapshot, self.engine if self.sample_values else None)
+            return retriever.prompt_string(question, self.schema_top_k)
+
+    def lookup(self, question, snapshot=None):
+        snapshot = snapshot or self.snapshot
+        with span("cache_lookup"):
+            sql = get_cached_sql(make_cache_key(snapshot.fingerprint, question))
+            record_cache("exact", bool(sql))
+            if sql:
+                return sql, "exact"
+
+            # Same question with other literals: the cached SQL, rebound.
+            values = get_retriever(snapshot, self.engine if self.sample_values else None).sample_values
+            sql = get_template_sql(question, snapshot.fingerprint, values, tables=snapshot.table_names)
+            record_cache("template", bool(sql))
+            if sql:
+                return sql, "template"
+
+            sql = get_semantic_sql(
+                question, snapshot.fingerprint, tables=snapshot.table_names,
+                guard=lambda matched: same_literals(question, matched, snapshot.fingerprint, values),
+            )
+            record_cache("semantic", bool(sql))
+            if sql:
+                return sql, "semantic"
+            return None, None
+
+    def generate(self, question, question_schema, stream=False):
+        if self.use_planner:
+            with span("generation", planner=True):
+                return generate_sql_from_plan(question, question_schema)
+        if stream:
+            return None, self._stream("generation", generate_sql, question, question_schema)
+        with span("generation"):
+            return None, generate_sql(question, question_schema)
+
+    def validate(self, question, sql, question_schema, snapshot=None):
+        snapshot = snapshot or self.snapshot
+        with span("validation") as current:
+            verdict = validate_sql(question, sql, question_schema, snapshot, self.engine)
+            current.set(corrected=verdict != "VALID")
+        if verdict != "VALID":
+            return verdict, True
+        return sql, False
+
+    def store(self, question, sql, snapshot=None):
+        snapshot = snapshot or self.snapshot
+        with span("cache_store"):
+            store_sql(make_cache_key(snapshot.fingerprint, question), sql)
+            store_semantic_sql(question, sql, snapshot.fingerprint)
+
+    def assess(self, sql):
+        # EXPLAIN-based cost gate: may append a LIMIT ("limit") or refuse
+        # the query ("block") before anything runs.
+        with span("cost_check") as current:
+            assessment = assess_query(self.engine, sql)
+            current.set(action=assessment.action)
+        return assessment
+
+    def execute(self, sql):
+        with span("execution"):
+            return run_query(self.engine, sql, max_rows=self.max_rows)
+
+    def explain(self, question, frame, stream=False):
+        if stream:
+            return self._stream("explanation", explain_result, question, frame)
+        with span("explanation"):
+            return explain_result(question, frame)
+
+    def _stream(self, stage, fn, *args):
+        # The span stays open until whoever drains the tokens is done; the
+        # prompt is built on the first read, inside it.
+        def tokens():
+            yield from fn(*args, stream=True)
+        return traced(stage, tokens(), stream=True)
+
+    # ---------------- RUN ----------------
+
+    def run(self, question, level=None, executor=None):
+        outcome = PipelineResult(question, level)
+        timings = outcome.timings
+        started = time.perf_counter()
+
+        def timed(stage, fn, *args):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t0
+
+        with track_usage() as usage, span("question", level=level) as root:
+            snapshot = None
+            try:
+                snapshot = self.snapshot
+                sql, source = timed("cache_lookup", self.lookup, question, snapshot)
+
+                if sql is None:
+                    question_schema = self.question_schema(question, snapshot)
+                    outcome.plan, sql = timed("generation", self.generate, question, question_schema)
+                    sql, outcome.corrected = timed("validation", self.validate, question, sql, question_schema, snapshot)
+                    self.store(question, sql, snapshot)
+                    source = "llm"
+
+                outcome.sql, outcome.source = sql, source
+
+                if self.cost_check:
+                    outcome.cost = timed("cost_check", self.assess, sql)
+                    if outcome.cost.action == "block":
+                        raise QueryTooExpensive(outcome.cost.message)
+                    sql = outcome.cost.sql
+
+                if executor is not None:
+                    # Carry the trace over to the DB worker thread.
+                    run_in_trace = copy_context().run
+                    outcome.result = timed("execution", lambda: executor.submit(run_in_trace, self.execute, sql).result())
+                else:
+                    outcome.result = timed("execution", self.execute, sql)
+
+                if self.explain_results:
+                    outcome.insight = timed("explanation", self.explain, question, outcome.result.frame)
+            except Exception as e:
+                outcome.error = f"{type(e).__name__}: {e}"
+            root.set(source=outcome.source, failed=outcome.error is not None)
+
+        timings["total"] = time.perf_counter() - started
+        outcome.usage = dict(usage)
+        if self.history:
+            self.record(outcome, snapshot)
+        return outcome
+
+    def record(self, outcome, snapshot=None):
+        record_query(
+            outcome.question,
+            fingerprint=snapshot.fingerprint if snapshot is not None else None,
+            sql=outcome.sql,
+            source=outcome.source,
+            rows=outcome.result.rows if outcome.result is not None else None,
+            error=outcome.error,
+            timings=outcome.timings,
+            usage=outcome.usage,
+            level=outcome.level,
+        )
+
+    def run_many(self, questions, max_workers=4, db_workers=2, on_result=None):
+        # questions: iterable of str or (level, question) pairs. LLM calls are
+        # further capped process-wide by LLM_MAX_CONCURRENCY.
+        items = [q if isinstance(q, tuple) else (None, q) for q in questions]
+        results = [None] * len(items)
+        if self.sample_values:
+            # Same schema context for every question of the batch.
+            get_retriever(self.snapshot, self.engine, wait=True)
+
+        with ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="sql") as db_pool, \
+                ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="question") as pool:
+            futures = {
+                pool.submit(self.run, question, level, db_pool): i
+                for i, (level, question) in enumerate(items)
+            }
+            for future in futures:
+                i = futures[future]
+                results[i] = future.result()
+                if on_result is not None:
+                    on_result(results[i])
+
+        return results
+
+
+# ---------------- QUESTION FILES ----------------
+
+def load_questions(path):
+    # queries.txt layout: "LEVEL n — title" headings, a "These ..." blurb,
+    # then one question per non-empty line. The shipped file holds 50
+    # questions, 10 per level 1-5; the "These ..." line after the last one
+    # is a blurb too.
+    questions = []
+    level = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            heading = LEVEL_HEADING.search(line)
+            if heading:
+                level = int(heading.group(1))
+                continue
+            if line.startswith("These "):
+                continue
+            questions.append((level, line))
+    return questions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a question file through the Text2SQL pipeline.")
+    parser.add_argument("questions", help="question file, e.g. queries.txt")
+    parser.add_argument("--db", default="database/data.db", help="SQLite database to query")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output path (default: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="questions in flight")
+    parser.add_argument("--db-workers", type=int, default=2, help="concurrent query executions")
+    parser.add_argument("--planner", action="store_true", help="use the multi-step planner")
+    parser.add_argument("--no-explain", action="store_true", help="skip the analyst explanation")
+    parser.add_argument("--level", type=int, action="append", help="only run these levels")
+    parser.add_argument("--no-cost-check", action="store_true", help="skip the EXPLAIN cost gate")
+    parser.add_argument("--metrics", help="write Prometheus text metrics here when done")
+    parser.add_argument("--no-history", action="store_true", help="do not record the run in the query history")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    if args.level:
+        questions = [(lvl, q) for lvl, q in questions if lvl in args.level]
+
+    pipeline = Text2SQLPipeline(
+        get_engine("sqlite", db_path=args.db),
+        use_planner=args.planner,
+        explain=not args.no_explain,
+        cost_check=not args.no_cost_check,
+        history=not args.no_history,
+    )
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        def write(result):
+            out.write(json.dumps(result.to_dict(), default=str) + "\n")
+            out.flush()
+
+        started = time.perf_counter()
+        results = pipeline.run_many(questions, max_workers=args.workers, db_workers=args.db_workers, on_result=write)
+        failed = sum(1 for r in results if r.error)
+        print(
+            f"{len(results)} questions from {args.questions}, {failed} failed, "
+            f"{time.perf_counter() - started:.1f}s",
+            file=sys.stderr
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if args.metrics:
+            write_prometheus(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from app.agent import generate_sql
+from app.llm import complete
 
 def plan_query(question, schema):
     planning_prompt = f"""
@@ -16,7 +17,7 @@ For each step, describe what needs to be computed.
 Return in numbered format.
 """
 
-    plan = generate_sql(planning_prompt)
+    plan = complete(planning_prompt)
     return plan
 
 def generate_sql_from_plan(question, schema):
@@ -29,12 +30,9 @@ User question:
 Execution Plan:
 {plan}
 
-Schema:
-{schema}
-
 Now generate the final optimized SQL query.
 Return only SQL.
 """
 
-    sql = generate_sql(final_prompt)
+    sql = generate_sql(final_prompt, schema)
     return plan, sql
\ No newline at end of file
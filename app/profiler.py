@@ -0,0 +1,277 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from sqlalchemy import text
+
+from app.catalog import get_snapshot
+from app.db_engine import run_query
+from app.query_analyzer import get_table_stats, peek_table_stats
+from cache.result_cache import data_version, expired
+from common.config import get_float, get_int
+from common.telemetry import span
+
+# Tables with up to this many rows are profiled whole; larger ones from a
+# sample of about this size.
+PROFILE_SAMPLE_ROWS = get_int("PROFILE_SAMPLE_ROWS", 20_000)
+# Contiguous rowid ranges read per SQLite sample (SQLite has no TABLESAMPLE).
+SAMPLE_BLOCKS = 20
+# A sample returning less than this share of its target is redone as LIMIT n.
+MIN_SAMPLE_FRACTION = 0.5
+PREVIEW_ROWS = 100
+PROFILE_WORKERS = get_int("PROFILE_WORKERS", 1)
+PROFILE_TIMEOUT = get_float("PROFILE_TIMEOUT_SECONDS", 30.0)
+MAX_ENTRIES = 512
+TOP_VALUES = 3
+SEED = 42
+
+
+class TableProfile:
+    def __init__(self, table, rows, rows_estimated, sample_rows, method, columns, elapsed, error=None):
+        self.table = table
+        self.rows = rows                    # row count (estimate for sampled tables)
+        self.rows_estimated = rows_estimated
+        self.sample_rows = sample_rows
+        self.method = method                # "full" | "rowid ranges" | "TABLESAMPLE SYSTEM" | "first rows"
+        self.columns = columns              # DataFrame, one row per column
+        self.elapsed = elapsed
+        self.error = error
+
+
+# ---------------- SAMPLING ----------------
+
+def _rowid_bounds(engine, quoted):
+    # Two queries: MIN and MAX are each a B-tree seek, together a scan.
+    with engine.connect() as conn:
+        low = conn.execute(text(f"SELECT MIN(rowid) FROM {quoted}")).scalar()
+        high = conn.execute(text(f"SELECT MAX(rowid) FROM {quoted}")).scalar()
+    return low, high
+
+
+def _sample_sql(engine, quoted, rows, n):
+    dialect = engine.dialect.name
+
+    if dialect == "sqlite":
+        # Block sampling over the rowid range: one window per stratum, so the
+        # sample spans the whole table and each window is a B-tree seek.
+        # Keys need not start at 1 or be dense; windows widen with the gaps.
+        low, high = _rowid_bounds(engine, quoted)
+        if low is not None:
+            span = high - low + 1
+            block = max(1, int(n / SAMPLE_BLOCKS * span / max(rows, 1)))
+            stride = max(block, span // SAMPLE_BLOCKS)
+            rng = random.Random(SEED)
+            windows = []
+            for i in range(SAMPLE_BLOCKS):
+                start = low + i * stride + rng.randrange(max(1, stride - block + 1))
+                windows.append(f"rowid BETWEEN {start} AND {start + block - 1}")
+            return f"SELECT * FROM {quoted} WHERE {' OR '.join(windows)}", "rowid ranges"
+
+    if dialect == "postgresql":
+        percent = min(100.0, 100.0 * n / max(rows, 1))
+        return f"SELECT * FROM {quoted} TABLESAMPLE SYSTEM ({percent:.6f}) REPEATABLE ({SEED})", "TABLESAMPLE SYSTEM"
+
+    return f"SELECT * FROM {quoted} LIMIT {n}", "first rows"
+
+
+def load_sample(engine, table, sample_rows=PROFILE_SAMPLE_ROWS):
+    # -> (frame, rows, rows_estimated, method)
+    quoted = engine.dialect.identifier_preparer.quote(table)
+    estimate = get_table_stats(engine).rows(table)
+
+    if estimate is None or estimate <= sample_rows:
+        result = run_query(engine, f"SELECT * FROM {quoted}", max_rows=sample_rows,
+                           timeout=PROFILE_TIMEOUT, use_cache=False)
+        if not result.truncated:
+            return result.frame, result.rows, False, "full"
+        estimate = estimate or result.rows
+
+    try:
+        sql, method = _sample_sql(engine, quoted, estimate, sample_rows)
+        result = run_query(engine, sql, max_rows=sample_rows, timeout=PROFILE_TIMEOUT, use_cache=False)
+    except Exception:
+        # WITHOUT ROWID tables, views, or no TABLESAMPLE on this server.
+        result = None
+    if result is None or result.rows < sample_rows * MIN_SAMPLE_FRACTION:
+        # Also when the windows or pages missed most rows (clustered gaps).
+        sql, method = f"SELECT * FROM {quoted} LIMIT {sample_rows}", "first rows"
+        result = run_query(engine, sql, max_rows=sample_rows, timeout=PROFILE_TIMEOUT, use_cache=False)
+    return result.frame, estimate, True, method
+
+
+# ---------------- COLUMN STATS ----------------
+
+def profile_columns(frame, rows):
+    """Per-column stats of a (possibly sampled) table, vectorized per column.
+    Distinct counts are scaled up only when the sample looks unique."""
+    records = []
+    for column in frame.columns:
+        values = frame[column]
+        present = values.dropna()
+        distinct = int(present.nunique())
+        sampled = len(frame) < rows
+        unique_like = len(present) > 0 and distinct >= 0.9 * len(present)
+
+        if sampled and unique_like:
+            shown_distinct = f"~{int(rows * len(present) / len(frame)):,}"
+        else:
+            shown_distinct = f"{distinct:,}" + ("+" if sampled else "")
+
+        record = {
+            "column": column,
+            "dtype": str(values.dtype),
+            "nulls": f"{values.isna().mean():.1%}",
+            "distinct": shown_distinct,
+            "min": "",
+            "max": "",
+            "mean": "",
+            "top": "",
+        }
+        if not present.empty:
+            numeric = pd.api.types.is_numeric_dtype(present) and not pd.api.types.is_bool_dtype(present)
+            try:
+                record["min"], record["max"] = str(present.min()), str(present.max())
+            except TypeError:
+                pass    # mixed types in one SQLite column
+            if numeric:
+                record["mean"] = f"{present.mean():,.4g}"
+            if not unique_like:
+                counts = present.value_counts(normalize=True).head(TOP_VALUES)
+                record["top"] = ", ".join(f"{value} ({share:.0%})" for value, share in counts.items())
+        records.append(record)
+    return pd.DataFrame.from_records(records, columns=["column", "dtype", "nulls", "distinct", "min", "max", "mean", "top"])
+
+
+def profile_table(engine, table, sample_rows=PROFILE_SAMPLE_ROWS):
+    started = time.perf_counter()
+    with span("profile.table", table=table) as current:
+        frame, rows, estimated, method = load_sample(engine, table, sample_rows)
+        columns = profile_columns(frame, rows)
+        current.set(rows=rows, sample_rows=len(frame), method=method)
+    return TableProfile(table, rows, estimated, len(frame), method, columns, time.perf_counter() - started)
+
+
+# ---------------- CACHE + WORKER ----------------
+
+class Profiler:
+    """Previews and profiles keyed by schema fingerprint and data version.
+    Profiles are computed on a worker thread; get() never waits for one."""
+
+    def __init__(self, workers=PROFILE_WORKERS, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()       # key -> (DataFrame | TableProfile, stored_at)
+        self._inflight = {}                 # key -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="profiler")
+
+    def key(self, engine, kind, table):
+        return (
+            engine.url.render_as_string(hide_password=True),
+            get_snapshot(engine).fingerprint,
+            data_version(engine),
+            kind,
+            table,
+        )
+
+    def _cached(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if expired(key[2], item[1]):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def _store(self, key, item):
+        with self._lock:
+            self._entries[key] = (item, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def preview(self, engine, table, limit=PREVIEW_ROWS):
+        # LIMIT n is cheap enough to run inline the first time.
+        key = self.key(engine, ("preview", limit), table)
+        frame = self._cached(key)
+        if frame is None:
+            quoted = engine.dialect.identifier_preparer.quote(table)
+            frame = run_query(engine, f"SELECT * FROM {quoted} LIMIT {limit}", max_rows=limit, use_cache=False).frame
+            self._store(key, frame)
+        return frame
+
+    def peek(self, engine, table):
+        return self._cached(self.key(engine, "profile", table))
+
+    def get(self, engine, table, wait=False):
+        """The cached profile, or None after scheduling it on the worker.
+        wait=True blocks until it is ready instead."""
+        key = self.key(engine, "profile", table)
+        profile = self._cached(key)
+        if profile is not None:
+            return profile
+
+        with self._lock:
+            stored = self._entries.get(key)     # finished since the check above
+            if stored is not None:
+                return stored[0]
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._compute, key, engine, table)
+                self._inflight[key] = future
+        return future.result() if wait else None
+
+    def _compute(self, key, engine, table):
+        started = time.perf_counter()
+        try:
+            profile = profile_table(engine, table)
+        except Exception as e:
+            # Cached like a result, so a broken table is not retried on
+            # every poll; a new data version retries it.
+            profile = TableProfile(table, None, True, 0, None, None, time.perf_counter() - started,
+                                   error=f"{type(e).__name__}: {e}")
+        self._store(key, profile)
+        with self._lock:
+            self._inflight.pop(key, None)
+        return profile
+
+    def table_stats(self, engine):
+        """Row counts for labels: the cached stats, or None after scheduling
+        their load (possibly exact COUNT(*)s) on the worker."""
+        stats = peek_table_stats(engine)
+        if stats is not None:
+            return stats
+
+        key = self.key(engine, "stats", None)
+        with self._lock:
+            if key not in self._inflight:
+                future = self._executor.submit(get_table_stats, engine)
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._finished(key))
+        return None
+
+    def _finished(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def warm(self, engine, tables=None):
+        # Queue every table (or the given ones) without waiting.
+        for table in tables or get_snapshot(engine).table_names:
+            self.get(engine, table)
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = Profiler()
+    return _profiler
@@ -1,5 +1,36 @@
+import json
+import re
+import threading
+import time
+import weakref
+
 from sqlalchemy import text
 
+from app.catalog import get_snapshot
+from cache.result_cache import data_version, expired
+from common.config import get_int
+from common.sql_tokens import AGGREGATES, tokenize, with_depth
+from common.telemetry import span
+
+# Estimated rows touched (scanned + sorted) at which a query is flagged,
+# gets a LIMIT appended, or is refused outright.
+WARN_ROWS = get_int("QUERY_COST_WARN_ROWS", 1_000_000)
+LIMIT_ROWS = get_int("QUERY_COST_LIMIT_ROWS", 10_000_000)
+BLOCK_ROWS = get_int("QUERY_COST_BLOCK_ROWS", 1_000_000_000)
+AUTO_LIMIT = get_int("QUERY_AUTO_LIMIT", 1_000)
+
+# SQLite's own guesses when sqlite_stat1 has nothing better.
+INDEX_EQ_ROWS = 10
+RANGE_FRACTION = 0.25
+UNKNOWN_TABLE_ROWS = 1_000
+# A row through a temp B-tree / sort costs about this many scanned rows.
+SORT_WEIGHT = 2
+
+
+class QueryTooExpensive(Exception):
+    pass
+
+
 def get_explain_plan(engine, sql, db_type):
     try:
         if db_type == "sqlite":
@@ -19,14 +50,461 @@ def get_explain_plan(engine, sql, db_type):
 
     except Exception as e:
         return f"Explain failed: {str(e)}"
-    
-def detect_heavy_query(plan_rows):
-    warning_keywords = ["SCAN", "ALL", "SEQUENTIAL"]
 
-    for row in plan_rows:
-        row_str = str(row).upper()
-        for keyword in warning_keywords:
-            if keyword in row_str:
-                return True
 
-    return False
\ No newline at end of file
+# ---------------- PLAN TREE ----------------
+
+class PlanNode:
+    """One step of a query plan, normalized across dialects.
+
+    access is "scan" (every row), "range", "index" (equality lookup),
+    "unique" (at most one row) or None for non-table steps. rows is what
+    one execution of the step reads; loops is how often it runs."""
+
+    def __init__(self, op, detail="", table=None, access=None, rows=None, children=None):
+        self.op = op
+        self.detail = detail
+        self.table = table
+        self.access = access
+        self.rows = rows
+        self.loops = 1
+        self.sort = False
+        self.children = children or []
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def lines(self, depth=0):
+        estimate = ""
+        if self.access or self.sort:
+            estimate = f"  [~{_count(self.rows)} rows" + (f" x {_count(self.loops)} loops]" if self.loops > 1 else "]")
+        yield "  " * depth + (self.detail or self.op) + estimate
+        for child in self.children:
+            yield from child.lines(depth + 1)
+
+    def __str__(self):
+        return "\n".join(line for child in self.children for line in child.lines())
+
+
+def _count(n):
+    return f"{int(n or 0):,}"
+
+
+# ---------------- TABLE STATISTICS ----------------
+
+class TableStats:
+    def __init__(self, rows=None, indexes=None):
+        self.row_counts = rows or {}
+        self.index_stats = indexes or {}     # SQLite sqlite_stat1: index -> [rows, rows per key prefix...]
+
+    def rows(self, table):
+        return self.row_counts.get((table or "").lower())
+
+
+_stats = weakref.WeakKeyDictionary()
+_stats_lock = threading.Lock()
+
+
+def _load_stats(engine):
+    dialect = engine.dialect.name
+    rows, indexes = {}, {}
+
+    with engine.connect() as conn:
+        if dialect == "sqlite":
+            try:
+                for table, index, stat in conn.execute(text("SELECT tbl, idx, stat FROM sqlite_stat1")):
+                    numbers = [int(n) for n in str(stat).split() if n.isdigit()]
+                    if numbers:
+                        rows.setdefault(table.lower(), numbers[0])
+                        if index:
+                            indexes[index.lower()] = numbers
+            except Exception:
+                pass    # never ANALYZEd
+            for table in get_snapshot(engine).table_names:
+                if table.lower() in rows:
+                    continue
+                # Exact: MAX(rowid) says nothing about sparse keys, and
+                # COUNT(*) walks the smallest index; cached per data version.
+                count = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+                rows[table.lower()] = int(count or 0)
+
+        elif dialect == "postgresql":
+            result = conn.execute(text("""
+                SELECT c.relname, c.reltuples
+                FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relkind IN ('r', 'p', 'm') AND n.nspname = current_schema()
+            """))
+            rows = {name.lower(): int(count) for name, count in result if count is not None and count >= 0}
+
+        elif dialect == "mysql":
+            result = conn.execute(text("""
+                SELECT table_name, table_rows FROM information_schema.tables
+                WHERE table_schema = DATABASE()
+            """))
+            rows = {name.lower(): int(count) for name, count in result if count is not None}
+
+    return TableStats(rows, indexes)
+
+
+def peek_table_stats(engine, version=None):
+    # The cached stats if still current, else None; never touches the database
+    # beyond reading the data version.
+    version = version if version is not None else data_version(engine)
+    with _stats_lock:
+        cached = _stats.get(engine)
+        if cached is not None and cached[0] == version and version is not None \
+                and not expired(version, cached[2]):
+            return cached[1]
+    return None
+
+
+def get_table_stats(engine):
+    # Reloaded whenever the data version moves (file change for SQLite) or
+    # the result cache TTL has passed (servers). May COUNT(*) tables that
+    # were never ANALYZEd, so UI code goes through Profiler.table_stats.
+    version = data_version(engine)
+    stats = peek_table_stats(engine, version)
+    if stats is not None:
+        return stats
+
+    stats = _load_stats(engine)
+    with _stats_lock:
+        _stats[engine] = (version, stats, time.time())
+    return stats
+
+
+# ---------------- SQLITE ----------------
+
+_SQLITE_ACCESS = re.compile(r"^(SCAN|SEARCH) (?:TABLE |SUBQUERY )?(\S+)(?: AS (\S+))?(.*)$")
+_SQLITE_NAMED = re.compile(r"^(MATERIALIZE|CO-ROUTINE) (\S+)")
+
+
+def table_aliases(sql):
+    # alias (lowercase) -> table, for every "FROM/JOIN/, name [AS] alias".
+    aliases = {}
+    tokens = tokenize(sql)
+    in_from = False
+    for i, token in enumerate(tokens):
+        if token.kind == "keyword":
+            if token.upper in ("FROM", "JOIN"):
+                in_from = True
+            elif token.upper in ("WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "ON", "USING", "SELECT"):
+                in_from = False
+            if token.upper not in ("FROM", "JOIN"):
+                continue
+        elif not (in_from and token.value == ","):
+            continue
+        if i + 1 >= len(tokens) or tokens[i + 1].kind != "ident":
+            continue
+        table = tokens[i + 1].value
+        j = i + 2
+        while j + 1 < len(tokens) and tokens[j].value == ".":
+            table = tokens[j + 1].value
+            j += 2
+        if j < len(tokens) and tokens[j].upper == "AS":
+            j += 1
+        alias = tokens[j].value if j < len(tokens) and tokens[j].kind == "ident" else table
+        aliases[alias.lower()] = table
+        aliases.setdefault(table.lower(), table)
+    return aliases
+
+
+def _sqlite_access(node, rest, stats):
+    rest = rest.strip()
+    if "INTEGER PRIMARY KEY" in rest or "USING PRIMARY KEY" in rest:
+        if any(op in rest for op in (">", "<")):
+            return "range", None
+        return "unique", 1
+    if not rest.startswith("USING") or node.op == "SCAN":
+        return "scan", None
+
+    index = re.search(r"INDEX (\S+)", rest)
+    condition = re.search(r"\((.*)\)", rest)
+    terms = condition.group(1).split(" AND ") if condition else []
+    equalities = sum(1 for term in terms if term.endswith("=?"))
+    if any(op in rest for op in (">", "<")) and equalities == len(terms):
+        equalities = len(terms) - 1
+
+    if equalities < len(terms):
+        return "range", None
+    stat = stats.index_stats.get(index.group(1).lower()) if index else None
+    if stat and len(stat) > equalities:
+        return "index", stat[equalities]
+    return "index", INDEX_EQ_ROWS
+
+
+def _sqlite_tree(rows, aliases, stats):
+    root = PlanNode("QUERY PLAN")
+    nodes = {0: root}
+    for row in rows:
+        node_id, parent, detail = row[0], row[1], str(row[-1])
+        node = PlanNode(detail.split(" ", 1)[0], detail)
+
+        access = _SQLITE_ACCESS.match(detail)
+        named = _SQLITE_NAMED.match(detail)
+        if access:
+            node.op = access.group(1)
+            name = access.group(3) or access.group(2)
+            node.table = aliases.get(name.lower(), name)
+            node.access, node.rows = _sqlite_access(node, access.group(4), stats)
+            if "AUTOMATIC" in detail:
+                node.op = "AUTOMATIC INDEX"
+        elif named:
+            node.op, node.table = named.group(1), named.group(2)
+        elif detail.startswith("USE TEMP B-TREE"):
+            node.op, node.sort = "TEMP B-TREE", True
+        elif detail.startswith("CORRELATED"):
+            node.op = "CORRELATED SUBQUERY"
+
+        nodes[node_id] = node
+        nodes.get(parent, root).children.append(node)
+    return root
+
+
+def _sqlite_estimate(children, loops, stats, materialized):
+    # SQLite lists the tables of one join as siblings, outermost loop first.
+    # Returns the rows produced by the block (an over-estimate: filters that
+    # are not index lookups are ignored).
+    outer = loops
+    produced = 1
+    for node in children:
+        if node.access:
+            if node.rows is None:
+                table_rows = stats.rows(node.table)
+                if table_rows is None:
+                    table_rows = materialized.get((node.table or "").lower(), UNKNOWN_TABLE_ROWS)
+                node.rows = table_rows if node.access == "scan" else max(1, int(table_rows * RANGE_FRACTION))
+            node.loops = outer
+            produced *= max(node.rows, 1)
+            outer = loops * produced
+            if node.op == "AUTOMATIC INDEX":
+                # Building the transient index reads the whole table once.
+                node.children.append(PlanNode("BUILD", "build automatic index", node.table, "scan",
+                                              stats.rows(node.table) or UNKNOWN_TABLE_ROWS))
+        elif node.sort:
+            node.rows, node.loops = produced, loops
+        elif node.op in ("MATERIALIZE", "CO-ROUTINE"):
+            node.loops = loops
+            materialized[(node.table or "").lower()] = _sqlite_estimate(node.children, 1, stats, materialized)
+        else:
+            node.loops = outer if node.op == "CORRELATED SUBQUERY" else loops
+            _sqlite_estimate(node.children, node.loops, stats, materialized)
+    return produced
+
+
+def _plan_sqlite(conn, sql, stats):
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    root = _sqlite_tree(rows, table_aliases(sql), stats)
+    _sqlite_estimate(root.children, 1, stats, {})
+    return root
+
+
+# ---------------- POSTGRES ----------------
+
+PG_SCANS = {
+    "Seq Scan": "scan", "Index Scan": "index", "Index Only Scan": "index",
+    "Bitmap Heap Scan": "range", "Tid Scan": "unique",
+}
+
+
+def _pg_node(plan, loops, stats):
+    op = plan.get("Node Type", "?")
+    table = plan.get("Relation Name")
+    access = PG_SCANS.get(op)
+    rows = plan.get("Plan Rows")
+    if access == "scan":
+        rows = stats.rows(table) or rows
+    detail = op + (f" on {table}" if table else "") + (f" using {plan['Index Name']}" if plan.get("Index Name") else "")
+
+    node = PlanNode(op, detail, table, access, rows)
+    node.loops = loops
+    node.sort = op in ("Sort", "Incremental Sort")
+
+    children = plan.get("Plans", [])
+    for i, child in enumerate(children):
+        # The inner side of a nested loop runs once per outer row.
+        child_loops = loops
+        if op == "Nested Loop" and i > 0:
+            child_loops = loops * max(1, int(children[0].get("Plan Rows", 1)))
+        node.children.append(_pg_node(child, child_loops, stats))
+    return node
+
+
+def _plan_postgres(conn, sql, stats):
+    raw = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    data = json.loads(raw) if isinstance(raw, str) else raw
+    root = PlanNode("QUERY PLAN")
+    root.children.append(_pg_node(data[0]["Plan"], 1, stats))
+    return root
+
+
+# ---------------- MYSQL ----------------
+
+MYSQL_ACCESS = {
+    "ALL": "scan", "index": "scan", "range": "range", "ref": "index", "ref_or_null": "index",
+    "fulltext": "index", "index_merge": "range", "eq_ref": "unique", "const": "unique", "system": "unique",
+}
+
+
+def _mysql_block(block, loops, stats, parent):
+    # Walks one query_block (or any nested operation object) of EXPLAIN
+    # FORMAT=JSON. Returns the rows the block produces.
+    produced = 1
+    for key, value in block.items():
+        if key == "nested_loop":
+            outer = 1
+            for item in value:
+                outer = _mysql_table(item["table"], loops * outer, stats, parent)
+            produced = outer
+        elif key == "table":
+            produced = _mysql_table(value, loops, stats, parent)
+        elif key in ("ordering_operation", "grouping_operation", "duplicates_removal"):
+            node = PlanNode(key.replace("_", " "), key)
+            node.loops = loops
+            parent.children.append(node)
+            produced = _mysql_block(value, loops, stats, node)
+            if value.get("using_filesort") or value.get("using_temporary_table"):
+                node.sort, node.rows = True, produced
+        elif key in ("attached_subqueries", "optimized_away_subqueries", "query_specifications"):
+            for sub in value:
+                node = PlanNode("subquery", "dependent subquery" if sub.get("dependent") else "subquery")
+                node.loops = loops * (produced if sub.get("dependent") else 1)
+                parent.children.append(node)
+                _mysql_block(sub.get("query_block", sub), node.loops, stats, node)
+        elif key == "query_block" or key == "union_result":
+            produced = _mysql_block(value, loops, stats, parent)
+    return produced
+
+
+def _mysql_table(info, loops, stats, parent):
+    table = info.get("table_name")
+    access = MYSQL_ACCESS.get(info.get("access_type"), "scan")
+    rows = info.get("rows_examined_per_scan")
+    if rows is None and access == "scan":
+        rows = stats.rows(table)
+    detail = f"{info.get('access_type', '?')} on {table}" + (f" using {info['key']}" if info.get("key") else "")
+
+    node = PlanNode(info.get("access_type", "table"), detail, table, access, int(rows or 1))
+    node.loops = loops
+    parent.children.append(node)
+    if "materialized_from_subquery" in info:
+        _mysql_block(info["materialized_from_subquery"].get("query_block", {}), 1, stats, node)
+    return int(info.get("rows_produced_per_join") or node.rows * loops)
+
+
+def _plan_mysql(conn, sql, stats):
+    raw = conn.execute(text(f"EXPLAIN FORMAT=JSON {sql}")).scalar()
+    data = json.loads(raw) if isinstance(raw, str) else raw
+    root = PlanNode("QUERY PLAN")
+    _mysql_block(data.get("query_block", {}), 1, stats, root)
+    return root
+
+
+PLANNERS = {"sqlite": _plan_sqlite, "postgresql": _plan_postgres, "mysql": _plan_mysql}
+
+
+def explain_tree(engine, sql, stats=None):
+    planner = PLANNERS.get(engine.dialect.name)
+    if planner is None:
+        raise ValueError(f"No plan parser for {engine.dialect.name}")
+    stats = stats or get_table_stats(engine)
+    with span("db.explain", dialect=engine.dialect.name), engine.connect() as conn:
+        return planner(conn, sql.strip().rstrip(";"), stats)
+
+
+# ---------------- COST MODEL ----------------
+
+class CostEstimate:
+    def __init__(self, rows_scanned, rows_sorted, reasons):
+        self.rows_scanned = rows_scanned
+        self.rows_sorted = rows_sorted
+        self.reasons = reasons
+        self.cost = rows_scanned + SORT_WEIGHT * rows_sorted
+
+
+def estimate_cost(root, warn_rows=WARN_ROWS):
+    scanned = sorted_rows = 0
+    reasons = []
+    for node in root.walk():
+        if node.access:
+            touched = (node.rows or 0) * node.loops
+            scanned += touched
+            if node.access == "scan" and node.loops > 1 and touched >= warn_rows:
+                reasons.append(f"Nested loop scans {node.table} ({_count(node.rows)} rows) {_count(node.loops)} times")
+            elif node.access == "scan" and touched >= warn_rows:
+                reasons.append(f"Full scan of {node.table} (~{_count(touched)} rows)")
+            if node.op == "AUTOMATIC INDEX":
+                reasons.append(f"SQLite builds a temporary index on {node.table}")
+        if node.sort:
+            touched = (node.rows or 0) * node.loops
+            sorted_rows += touched
+            if touched >= warn_rows:
+                reasons.append(f"Sort / temp B-tree over ~{_count(touched)} rows")
+    return CostEstimate(scanned, sorted_rows, reasons)
+
+
+class QueryAssessment:
+    def __init__(self, action, sql, plan=None, estimate=None, message=""):
+        self.action = action        # "ok" | "warn" | "limit" | "block" | "unknown"
+        self.sql = sql
+        self.plan = plan
+        self.estimate = estimate
+        self.message = message
+
+
+def _has_limit(sql):
+    return any(depth == 0 and token.upper in ("LIMIT", "OFFSET", "FETCH") for depth, token in with_depth(tokenize(sql)))
+
+
+def _returns_rows(sql):
+    # Plain row-returning query: a LIMIT stops the scan early. On grouped or
+    # aggregated ones it scans just as much and silently drops groups.
+    # Grouping anywhere (CTEs, derived tables) counts; aggregate calls only
+    # at the top, as scalar subqueries still return one value per row.
+    items = list(with_depth(tokenize(sql)))
+    for i, (depth, token) in enumerate(items):
+        if token.kind == "keyword" and token.upper in ("GROUP", "HAVING", "DISTINCT"):
+            return False
+        if depth:
+            continue
+        if token.upper in AGGREGATES and i + 1 < len(items) and items[i + 1][1].value == "(":
+            j = i + 2
+            while j < len(items) and not (items[j][0] == 0 and items[j][1].value == ")"):
+                j += 1
+            if not (j + 1 < len(items) and items[j + 1][1].upper == "OVER"):
+                return False
+    return True
+
+
+def add_limit(sql, limit=AUTO_LIMIT):
+    sql = sql.strip().rstrip(";").rstrip()
+    return sql if _has_limit(sql) else f"{sql}\nLIMIT {int(limit)}"
+
+
+def assess_query(engine, sql, warn_rows=WARN_ROWS, limit_rows=LIMIT_ROWS, block_rows=BLOCK_ROWS,
+                 auto_limit=AUTO_LIMIT):
+    try:
+        plan = explain_tree(engine, sql)
+    except Exception as e:
+        return QueryAssessment("unknown", sql, message=f"Explain failed: {e}")
+
+    estimate = estimate_cost(plan, warn_rows=warn_rows)
+    summary = f"~{_count(estimate.cost)} rows touched"
+    details = "; ".join(estimate.reasons)
+    message = f"{summary}: {details}" if details else summary
+
+    if block_rows and estimate.cost >= block_rows:
+        return QueryAssessment("block", sql, plan, estimate,
+                               f"Query blocked, estimated {message} (limit {_count(block_rows)}).")
+    if limit_rows and estimate.cost >= limit_rows and auto_limit and not _has_limit(sql):
+        if _returns_rows(sql):
+            return QueryAssessment("limit", add_limit(sql, auto_limit), plan, estimate,
+                                   f"Expensive query ({message}); added LIMIT {auto_limit:,}.")
+        return QueryAssessment("warn", sql, plan, estimate,
+                               f"Expensive aggregate query ({message}); not limited, as a LIMIT would "
+                               "truncate its result without scanning less.")
+    if warn_rows and estimate.cost >= warn_rows:
+        return QueryAssessment("warn", sql, plan, estimate, f"Potentially expensive query: {message}.")
+    return QueryAssessment("ok", sql, plan, estimate, message)
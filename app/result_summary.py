@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+from app.schema_retriever import estimate_tokens
+from common.config import get_int
+
+# Upper bound for the digest that replaces the raw result in the analyst
+# prompt, in estimated tokens.
+SUMMARY_TOKEN_BUDGET = get_int("SUMMARY_TOKEN_BUDGET", 800)
+
+# Results this small are sent whole when they fit the budget.
+FULL_RESULT_ROWS = 25
+SAMPLE_ROWS = 12
+HEAD_ROWS = 3
+TOP_K = 5
+MAX_CELL_CHARS = 40
+# Quantiles and top-k are computed on a uniform sample above this size;
+# min / max / mean / null counts always cover every row.
+STATS_SAMPLE_ROWS = 100_000
+SEED = 0
+
+# (sample rows, top-k, columns) tried in order until the digest fits.
+SHRINK_STEPS = [
+    (SAMPLE_ROWS, TOP_K, None),
+    (6, 3, None),
+    (3, 3, 24),
+    (0, 2, 12),
+    (0, 0, 8),
+]
+
+
+# ---------------- COLUMN STATS ----------------
+
+def _number(value):
+    if pd.isna(value):
+        return "NA"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return f"{int(value):,}"
+    return f"{value:,.4g}" if abs(value) < 1e4 else f"{value:,.0f}"
+
+
+def _clip(value, limit=MAX_CELL_CHARS):
+    text = str(value)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def looks_like_dates(values):
+    probe = values.head(50)
+    if probe.empty or not all(isinstance(v, str) for v in probe):
+        return False
+    parsed = pd.to_datetime(probe, errors="coerce", format="ISO8601")
+    return parsed.notna().mean() >= 0.9
+
+
+def describe_column(name, full, sampled, distinct, top_k):
+    nulls = int(full.isna().sum())
+    present = full.dropna()
+    parts = []
+
+    if present.empty:
+        parts.append("all null")
+
+    elif pd.api.types.is_bool_dtype(present):
+        parts.append(f"true {present.mean():.1%}")
+
+    elif pd.api.types.is_numeric_dtype(present):
+        q = sampled.dropna().quantile([0.25, 0.5, 0.75]).to_numpy()
+        parts.append(
+            f"min {_number(present.min())}, p25 {_number(q[0])}, median {_number(q[1])}, "
+            f"p75 {_number(q[2])}, max {_number(present.max())}, mean {_number(present.mean())}"
+        )
+        if distinct <= top_k:
+            parts.append(_top_values(sampled, top_k))
+
+    elif pd.api.types.is_datetime64_any_dtype(present) or looks_like_dates(present):
+        # ISO-8601 strings order the same way as the dates they spell.
+        parts.append(f"from {present.min()} to {present.max()}")
+
+    else:
+        parts.append(f"{distinct:,} distinct" + ("+" if len(sampled) < len(full) else ""))
+        # Top values of a near-unique column are all ~0% and say nothing.
+        if top_k and distinct <= len(sampled) // 2:
+            parts.append(_top_values(sampled, top_k))
+
+    if nulls:
+        parts.append(f"{nulls:,} nulls")
+    return f"- {name} ({full.dtype}): " + "; ".join(parts)
+
+
+def _top_values(values, top_k):
+    shares = values.value_counts(normalize=True, dropna=True).head(top_k)
+    return "top: " + ", ".join(f"{_clip(v, 24)} {share:.0%}" for v, share in shares.items())
+
+
+# ---------------- SAMPLE ROWS ----------------
+
+def _strata_column(frame, distinct):
+    # Lowest-cardinality text column with at least two groups.
+    best = None
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            continue
+        if 2 <= distinct[column] <= SAMPLE_ROWS and (best is None or distinct[column] < distinct[best]):
+            best = column
+    return best
+
+
+def sample_rows(frame, n, distinct):
+    """First HEAD_ROWS rows (ORDER BY results lead with what matters), then
+    a spread over the rest: one group at a time by the lowest-cardinality
+    text column when there is one, otherwise evenly spaced rows."""
+    if n <= 0:
+        return frame.iloc[:0], None
+    if len(frame) <= n:
+        return frame, None
+
+    head = min(HEAD_ROWS, n)
+    rest = frame.iloc[head:]
+    want = n - head
+    strata = _strata_column(rest, distinct)
+
+    if strata is not None:
+        # Group by factorized codes, not the values: NULLs in a mixed-type
+        # object column would otherwise come back as a NaN key that the
+        # groupby cannot look up again.
+        codes, _ = pd.factorize(rest[strata], use_na_sentinel=False)
+        groups = rest.groupby(codes, sort=False)
+        per_group = max(1, want // groups.ngroups)
+        picked = groups.sample(n=per_group, replace=False, random_state=SEED) \
+            if groups.size().min() >= per_group else groups.head(per_group)
+        picked = picked.sort_index().head(want)
+    else:
+        positions = np.linspace(0, len(rest) - 1, num=want).round().astype(int)
+        picked = rest.iloc[np.unique(positions)]
+
+    return pd.concat([frame.iloc[:head], picked]), strata
+
+
+def _render_rows(rows):
+    return rows.map(_clip).to_string(index=False, max_colwidth=MAX_CELL_CHARS)
+
+
+# ---------------- DIGEST ----------------
+
+def _unique_columns(frame):
+    # JOIN ... SELECT * repeats names (customer_id, customer_id); number the
+    # repeats like pandas' CSV reader does, so every name is one column.
+    seen = {}
+    names = []
+    for name in map(str, frame.columns):
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(f"{name}.{count}" if count else name)
+    return frame.set_axis(names, axis=1)
+
+
+def summarize_result(result, budget=SUMMARY_TOKEN_BUDGET):
+    """Fixed-size text digest of a query result for the analyst prompt:
+    shape, per-column stats, top values and a sample of rows, shrunk until
+    it fits `budget` estimated tokens. Cost does not grow with the row
+    count beyond a few vectorized passes."""
+    if not isinstance(result, pd.DataFrame):
+        return _clip(result, budget * 4)
+
+    if result.columns.has_duplicates:
+        result = _unique_columns(result)
+
+    rows, cols = result.shape
+    if rows <= FULL_RESULT_ROWS:
+        full = f"{rows:,} rows x {cols} columns (complete result):\n{_render_rows(result)}"
+        if estimate_tokens(full) <= budget:
+            return full
+
+    sampled = result
+    if rows > STATS_SAMPLE_ROWS:
+        sampled = result.sample(n=STATS_SAMPLE_ROWS, random_state=SEED)
+    distinct = {c: sampled[c].nunique() for c in result.columns}
+
+    described = {}
+    digest = None
+    for sample_n, top_k, max_columns in SHRINK_STEPS:
+        columns = list(result.columns)[:max_columns]
+        lines = [f"{rows:,} rows x {cols} columns. Statistics cover every row"
+                 + (f" (quantiles and top values from a {STATS_SAMPLE_ROWS:,}-row sample)" if sampled is not result else "")
+                 + "."]
+        lines.append("Columns:")
+        for c in columns:
+            if (c, top_k) not in described:
+                described[c, top_k] = describe_column(c, result[c], sampled[c], distinct[c], top_k)
+            lines.append(described[c, top_k])
+        if len(columns) < cols:
+            lines.append(f"- ... {cols - len(columns)} more columns")
+
+        picked, strata = sample_rows(result[columns], sample_n, distinct)
+        if len(picked):
+            how = f"first {min(HEAD_ROWS, len(picked))}, then spread across {strata}" if strata else "first rows, then evenly spaced"
+            lines.append(f"Sample rows ({how}):")
+            lines.append(_render_rows(picked))
+
+        digest = "\n".join(lines)
+        if estimate_tokens(digest) <= budget:
+            return digest
+
+    return digest[:budget * 4]
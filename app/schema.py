@@ -1,24 +1,23 @@
-import sqlite3
+from functools import lru_cache
 
-conn = sqlite3.connect('database/data.db')
-cursor = conn.cursor()
+DB_PATH = 'database/data.db'
 
-cursor.execute("SELECT name FROM sqlite_schema WHERE type='table'")
-tables = cursor.fetchall()
 
+@lru_cache(maxsize=1)
+def get_tab():
+    from app.catalog import get_snapshot
+    from app.db_engine import get_engine
 
+    snapshot = get_snapshot(get_engine('sqlite', db_path=DB_PATH))
 
-tables_dict = {}
-for i in tables:
-    if i[0] != 'sqlite_sequence':
-        cursor.execute(f"PRAGMA table_info({i[0]})")
-        columns = cursor.fetchall()
-        tables_dict[i[0]]=[]
-        for col in columns:
-            tables_dict[i[0]].append(col[1])
+    tab = ''
+    for table in snapshot.table_names:
+        tab += table+f'{tuple(snapshot.columns(table))}'+'\n'
+    return tab
 
-TAB = ''
-for key,val in tables_dict.items():
-    TAB += key+f'{tuple(val)}'+'\n'
-print(TAB)
-conn.close()
\ No newline at end of file
+
+def __getattr__(name):
+    # Keep `from app.schema import TAB` working without loading at import time.
+    if name == 'TAB':
+        return get_tab()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
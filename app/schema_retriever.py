@@ -0,0 +1,185 @@
+import math
+import re
+import threading
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.profiler import load_sample
+
+TOP_K = 4
+MAX_SAMPLE_VALUES = 50
+MAX_RETRIEVERS = 32
+
+TABLE_WEIGHT = 3.0
+COLUMN_WEIGHT = 1.0
+VALUE_WEIGHT = 2.0
+
+TEXT_TYPES = ("CHAR", "TEXT", "STRING", "CLOB")
+
+
+def tokenize(value):
+    value = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(value))
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", value.lower()):
+        tokens.append(stem(token))
+    return tokens
+
+
+def stem(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ses", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def estimate_tokens(value):
+    return max(1, len(value) // 4) if value else 0
+
+
+def load_sample_values(engine, snapshot, limit=MAX_SAMPLE_VALUES):
+    # Distinct values of text columns, read from the profiler's bounded table
+    # sample rather than a SELECT DISTINCT (a full scan) per column.
+    values = {}
+    for table, info in snapshot.tables.items():
+        columns = [col["name"] for col in info["columns"] if any(t in col["type"].upper() for t in TEXT_TYPES)]
+        if not columns:
+            continue
+        try:
+            frame = load_sample(engine, table)[0]
+        except Exception:
+            continue
+        for column in columns:
+            if column not in frame.columns:
+                continue
+            distinct = frame[column].dropna().unique()
+            # Free-text columns (names, descriptions) are not categorical.
+            if len(distinct) <= limit:
+                values[(table, column)] = [str(v) for v in distinct]
+    return values
+
+
+class SchemaRetriever:
+    """Lexical index over table names, column names and (optionally) sample
+    values of one schema snapshot, plus the foreign-key graph used to pull in
+    the tables needed to join the matches together."""
+
+    def __init__(self, snapshot, sample_values=None, sampled=False):
+        self.snapshot = snapshot
+        self.sample_values = sample_values or {}    # (table, column) -> [value, ...]
+        self.sampled = sampled                      # sample values were looked up
+        self.postings = defaultdict(lambda: defaultdict(float))  # token -> table -> weight
+        self.neighbors = defaultdict(set)
+
+        for table, info in snapshot.tables.items():
+            for token in tokenize(table):
+                self.postings[token][table] += TABLE_WEIGHT
+            for col in info["columns"]:
+                for token in tokenize(col["name"]):
+                    self.postings[token][table] += COLUMN_WEIGHT
+            for fk in info["foreign_keys"]:
+                if fk["referred_table"] in snapshot.tables:
+                    self.neighbors[table].add(fk["referred_table"])
+                    self.neighbors[fk["referred_table"]].add(table)
+
+        for (table, _), values in (sample_values or {}).items():
+            for value in values:
+                for token in tokenize(value):
+                    self.postings[token][table] = max(self.postings[token][table], VALUE_WEIGHT)
+
+        n_tables = max(len(snapshot.tables), 1)
+        self.idf = {
+            token: math.log(1 + n_tables / len(tables))
+            for token, tables in self.postings.items()
+        }
+
+    def score(self, question):
+        scores = defaultdict(float)
+        for token in set(tokenize(question)):
+            for table, weight in self.postings.get(token, {}).items():
+                scores[table] += weight * self.idf[token]
+        return scores
+
+    def join_path(self, source, target):
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return path[::-1]
+            for nxt in sorted(self.neighbors[node]):
+                if nxt not in previous:
+                    previous[nxt] = node
+                    queue.append(nxt)
+        return None
+
+    def retrieve(self, question, k=TOP_K):
+        tables = self.snapshot.table_names
+        if len(tables) <= k:
+            return tables
+
+        scores = self.score(question)
+        ranked = sorted(scores, key=lambda t: (-scores[t], t))[:k]
+        if not ranked:
+            return tables
+
+        selected = list(ranked)
+        anchor = ranked[0]
+        for table in ranked[1:]:
+            path = self.join_path(anchor, table)
+            for step in path or []:
+                if step not in selected:
+                    selected.append(step)
+
+        return [t for t in tables if t in selected]
+
+    def prompt_string(self, question, k=TOP_K):
+        return self.snapshot.prompt_string(self.retrieve(question, k))
+
+
+_retrievers = OrderedDict()     # (fingerprint, version) -> SchemaRetriever, LRU
+_loading = {}                   # (fingerprint, version) -> Future
+_retrievers_lock = threading.Lock()
+_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sample-values")
+
+
+def _store(key, retriever):
+    _retrievers[key] = retriever
+    _retrievers.move_to_end(key)
+    while len(_retrievers) > MAX_RETRIEVERS:
+        _retrievers.popitem(last=False)
+
+
+def _load_values(key, snapshot, engine):
+    try:
+        retriever = SchemaRetriever(snapshot, load_sample_values(engine, snapshot), sampled=True)
+    except Exception:
+        retriever = SchemaRetriever(snapshot, sampled=True)     # not retried for this version
+    with _retrievers_lock:
+        _loading.pop(key, None)
+        _store(key, retriever)
+    return retriever
+
+
+def get_retriever(snapshot, engine=None, wait=False):
+    """Retriever for a snapshot. With an engine, sample values are read on
+    a worker thread and a retriever using them replaces this one when they
+    are ready; wait=True blocks for them instead."""
+    key = (snapshot.fingerprint, snapshot.version)
+    with _retrievers_lock:
+        retriever = _retrievers.get(key)
+        if retriever is None:
+            retriever = SchemaRetriever(snapshot)
+        _store(key, retriever)
+        future = None
+        if engine is not None and not retriever.sampled:
+            future = _loading.get(key)
+            if future is None:
+                future = _loading[key] = _loader.submit(_load_values, key, snapshot, engine)
+    return future.result() if future is not None and wait else retriever
@@ -1,22 +1,18 @@
-from sqlalchemy import inspect
 import graphviz
 
-def generate_er_diagram(engine):
-    inspector = inspect(engine)
-    dot = graphviz.Digraph()
+from app.catalog import get_snapshot
 
-    tables = inspector.get_table_names()
+def generate_er_diagram(engine, snapshot=None):
+    snapshot = snapshot or get_snapshot(engine)
+    dot = graphviz.Digraph()
 
-    for table in tables:
-        columns = inspector.get_columns(table)
-        col_names = [col["name"] for col in columns]
+    for table, info in snapshot.tables.items():
+        col_names = [col["name"] for col in info["columns"]]
 
         label = f"{table}|" + "\\l".join(col_names) + "\\l"
         dot.node(table, label=label, shape="record")
 
-        fks = inspector.get_foreign_keys(table)
-
-        for fk in fks:
+        for fk in info["foreign_keys"]:
             referred_table = fk["referred_table"]
             dot.edge(table, referred_table)
 
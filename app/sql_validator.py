@@ -1,6 +1,356 @@
-from app.agent import generate_sql
+from app.llm import complete
+from app.query_analyzer import get_explain_plan
+from common.sql_tokens import AGGREGATES, Token, tokenize, with_depth, split_statements
 
-def validate_sql(question, sql, schema):
+READ_ONLY_STARTS = {"SELECT", "WITH", "VALUES"}
+WRITE_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "REPLACE", "TRUNCATE",
+    "ATTACH", "DETACH", "PRAGMA", "GRANT", "REVOKE", "MERGE", "VACUUM", "REINDEX",
+}
+CLAUSES = {"FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "WINDOW", "OFFSET"}
+JOIN_END = {"JOIN", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "UNION", "INTERSECT", "EXCEPT", "WINDOW"}
+# Bare words that are legal in expressions but are not column references.
+NON_COLUMN_WORDS = {
+    "YEAR", "MONTH", "DAY", "HOUR", "MINUTE", "SECOND", "WEEK", "QUARTER", "EPOCH", "DOW", "DOY",
+    "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "LOCALTIME", "LOCALTIMESTAMP",
+    "INTEGER", "INT", "REAL", "TEXT", "NUMERIC", "DECIMAL", "FLOAT", "DATE", "TIMESTAMP",
+    "VARCHAR", "CHAR", "BIGINT", "DOUBLE", "PRECISION", "SIGNED", "UNSIGNED", "BOOLEAN",
+}
+
+DB_TYPES = {"sqlite": "sqlite", "mysql": "mysql", "postgresql": "postgres"}
+
+
+class UnsafeSQLError(ValueError):
+    pass
+
+
+# ---------------- STRUCTURE ----------------
+
+def _select_scopes(items):
+    scopes = []
+    for i, (depth, token) in enumerate(items):
+        if token.kind != "keyword" or token.upper != "SELECT":
+            continue
+        j = i + 1
+        while j < len(items) and items[j][0] >= depth:
+            if items[j][0] == depth and items[j][1].upper in ("UNION", "INTERSECT", "EXCEPT"):
+                break
+            j += 1
+        scopes.append((depth, items[i:j]))
+    return scopes
+
+
+def _clauses(depth, scope):
+    clauses = {"SELECT": []}
+    current = "SELECT"
+    for d, token in scope[1:]:
+        if d == depth and token.kind == "keyword" and token.upper in CLAUSES:
+            current = token.upper
+            clauses.setdefault(current, [])
+            continue
+        clauses[current].append((d, token))
+    return clauses
+
+
+def _split_top(items, depth):
+    parts = [[]]
+    for d, token in items:
+        if d == depth and token.value == ",":
+            parts.append([])
+        else:
+            parts[-1].append((d, token))
+    return [p for p in parts if p]
+
+
+def _cte_names(items):
+    names = set()
+    for i, (depth, token) in enumerate(items[:-2]):
+        if depth == 0 and token.kind == "ident" and items[i + 1][1].upper == "AS" and items[i + 2][1].value == "(":
+            names.add(token.value.lower())
+    return names
+
+
+def _table_refs(depth, from_items):
+    # -> [(name or None for derived tables, alias, join keyword or ',' or None)]
+    refs = []
+    i = 0
+    pending_join = None
+    while i < len(from_items):
+        d, token = from_items[i]
+        if d != depth:
+            i += 1
+            continue
+
+        if token.value == ",":
+            pending_join = ","
+            i += 1
+            continue
+        if token.kind == "keyword" and token.upper in ("JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL"):
+            pending_join = "JOIN"
+            i += 1
+            continue
+
+        if (token.kind == "ident" or token.value == "(") and (not refs or pending_join):
+            name = None
+            if token.value == "(":
+                # Derived table: skip to the matching close paren.
+                i += 1
+                while i < len(from_items) and from_items[i][0] > depth:
+                    i += 1
+                i += 1
+            else:
+                name = token.value
+                i += 1
+                while i + 1 < len(from_items) and from_items[i][1].value == ".":
+                    name = from_items[i + 1][1].value
+                    i += 2
+
+            alias = None
+            if i < len(from_items) and from_items[i][1].upper == "AS":
+                i += 1
+            if i < len(from_items) and from_items[i][1].kind == "ident" and from_items[i][0] == depth:
+                alias = from_items[i][1].value
+                i += 1
+
+            refs.append((name, alias or name, pending_join))
+            pending_join = None
+            continue
+
+        i += 1
+    return refs
+
+
+def _join_has_condition(depth, from_items, join_index):
+    for d, token in from_items[join_index + 1:]:
+        if d != depth:
+            continue
+        if token.upper in ("ON", "USING"):
+            return True
+        if token.value == "," or token.upper in JOIN_END:
+            return False
+    return False
+
+
+def _item_columns(item):
+    # Column-like identifiers of one select item that sit outside aggregate
+    # calls, plus whether the item aggregates at all. Scalar subqueries are
+    # their own scope and are left out: (SELECT COUNT(*) ...) is one value
+    # per row, not an outer aggregate.
+    tokens = []
+    i = 0
+    while i < len(item):
+        depth, token = item[i]
+        if token.value == "(" and i + 1 < len(item) and item[i + 1][1].upper == "SELECT":
+            i += 1
+            while i < len(item) and not (item[i][0] == depth and item[i][1].value == ")"):
+                i += 1
+            tokens.append(Token("number", "0", "0"))    # stands in for the subquery's value
+        else:
+            tokens.append(token)
+        i += 1
+    if len(tokens) >= 2 and tokens[-2].upper == "AS":
+        tokens = tokens[:-2]
+    elif len(tokens) >= 2 and tokens[-1].kind == "ident" and (
+            tokens[-2].kind in ("ident", "number", "string") or tokens[-2].value == ")" or tokens[-2].upper == "END"):
+        tokens = tokens[:-1]
+
+    aggregated = False
+    columns = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        followed_by_paren = i + 1 < len(tokens) and tokens[i + 1].value == "("
+        if followed_by_paren:
+            # Skip over the call's arguments when it is an aggregate or a window function.
+            j, level = i + 1, 0
+            while j < len(tokens):
+                if tokens[j].value == "(":
+                    level += 1
+                elif tokens[j].value == ")":
+                    level -= 1
+                    if level == 0:
+                        break
+                j += 1
+            windowed = j + 1 < len(tokens) and tokens[j + 1].upper == "OVER"
+            if windowed or token.upper in AGGREGATES:
+                aggregated = aggregated or not windowed
+                i = j + 1
+                if windowed:
+                    i += 1
+                    level = 0
+                    while i < len(tokens):
+                        if tokens[i].value == "(":
+                            level += 1
+                        elif tokens[i].value == ")":
+                            level -= 1
+                            if level == 0:
+                                break
+                        i += 1
+                i += 1
+                continue
+            i += 1
+            continue
+        if token.value == "*":
+            if i == 0 or tokens[i - 1].value in (",", "."):
+                columns.append("*")
+        elif token.kind == "ident" and token.upper not in NON_COLUMN_WORDS:
+            if not (i + 1 < len(tokens) and tokens[i + 1].value == "."):
+                columns.append(token.value)
+        i += 1
+    return aggregated, columns
+
+
+# ---------------- CHECKS ----------------
+
+def is_read_only(sql):
+    return not _safety_issues(tokenize(sql))
+
+
+def _safety_issues(tokens):
+    issues = []
+    statements = split_statements(tokens)
+    if not statements:
+        return ["Empty SQL statement."]
+    if len(statements) > 1:
+        issues.append("Multiple SQL statements; only a single SELECT is allowed.")
+
+    for statement in statements:
+        first = statement[0]
+        if first.value != "(" and first.upper not in READ_ONLY_STARTS:
+            issues.append(f"Statement starts with {first.value!r}; only SELECT queries are allowed.")
+        for i, token in enumerate(statement):
+            followed_by_paren = i + 1 < len(statement) and statement[i + 1].value == "("
+            if token.kind == "keyword" and token.upper in WRITE_KEYWORDS and not followed_by_paren:
+                issues.append(f"Dangerous operation: {token.upper}.")
+    return list(dict.fromkeys(issues))
+
+
+def check_sql(sql, snapshot=None, engine=None):
+    tokens = tokenize(sql)
+    issues = _safety_issues(tokens)
+    if issues:
+        return issues
+
+    items = list(with_depth(tokens))
+    ctes = _cte_names(items)
+
+    tables = {}
+    if snapshot is not None:
+        tables = {
+            name.lower(): {col["name"].lower() for col in info["columns"]}
+            for name, info in snapshot.tables.items()
+        }
+
+    aliases = {}      # alias -> base table (or None for derived tables / CTEs)
+    scopes = _select_scopes(items)
+    parsed = []
+    for depth, scope in scopes:
+        clauses = _clauses(depth, scope)
+        refs = _table_refs(depth, clauses.get("FROM", []))
+        parsed.append((depth, clauses, refs))
+        for name, alias, _ in refs:
+            base = name.lower() if name and name.lower() not in ctes else None
+            aliases[alias.lower() if alias else None] = base
+            if name and snapshot is not None and name.lower() not in tables and name.lower() not in ctes:
+                issues.append(f"Unknown table: {name}.")
+
+    for depth, clauses, refs in parsed:
+        from_items = clauses.get("FROM", [])
+
+        # -------- CARTESIAN JOINS --------
+        base_refs = [r for r in refs if r[0]]
+        comma_joined = [r for r in refs if r[2] == ","]
+        if comma_joined:
+            where = clauses.get("WHERE", [])
+            if not where:
+                issues.append("Cartesian join: tables listed with commas but no WHERE predicate joins them.")
+            else:
+                qualifiers = {
+                    where[i - 1][1].value.lower()
+                    for i in range(1, len(where))
+                    if where[i][1].value == "." and where[i - 1][1].kind == "ident"
+                }
+                first_alias = refs[0][1]
+                missing = [a for _, a, _ in [refs[0]] + comma_joined if a and a.lower() not in qualifiers]
+                if qualifiers and missing:
+                    issues.append(
+                        "Cartesian join: no WHERE predicate references "
+                        + ", ".join(missing) + f" (joined with {first_alias})."
+                    )
+        for index, (d, token) in enumerate(from_items):
+            if d == depth and token.upper == "JOIN":
+                previous = from_items[index - 1][1].upper if index else ""
+                if previous in ("CROSS", "NATURAL"):
+                    if previous == "CROSS" and len(base_refs) == len(refs):
+                        issues.append("Cartesian join: CROSS JOIN between tables.")
+                    continue
+                if not _join_has_condition(depth, from_items, index):
+                    issues.append("Cartesian join: JOIN without ON/USING condition.")
+
+        # -------- GROUP BY --------
+        if "GROUP" not in clauses:
+            select_items = _split_top(clauses["SELECT"], depth)
+            analysed = [_item_columns(item) for item in select_items]
+            has_aggregate = any(agg for agg, _ in analysed)
+            bare = [cols for agg, cols in analysed if not agg and cols]
+            if has_aggregate and bare:
+                issues.append(
+                    "Missing GROUP BY: aggregate selected together with "
+                    + ", ".join(sorted({c for cols in bare for c in cols})) + "."
+                )
+
+    # -------- QUALIFIED COLUMNS --------
+    if snapshot is not None:
+        for i in range(1, len(items) - 1):
+            if items[i][1].value != ".":
+                continue
+            qualifier, column = items[i - 1][1], items[i + 1][1]
+            if qualifier.kind != "ident" or column.value == "*" or column.kind != "ident":
+                continue
+            key = qualifier.value.lower()
+            if key in aliases:
+                base = aliases[key]
+            elif key in tables:
+                base = key
+            elif key in ctes:
+                continue
+            else:
+                if i + 2 < len(items) and items[i + 2][1].value == "(":
+                    continue  # schema-qualified function call
+                issues.append(f"Unknown table or alias: {qualifier.value}.")
+                continue
+            if base and base in tables and column.value.lower() not in tables[base]:
+                if not (i + 2 < len(items) and items[i + 2][1].value == "."):
+                    issues.append(f"Unknown column: {qualifier.value}.{column.value}.")
+
+    # -------- SYNTAX / NAME RESOLUTION --------
+    if engine is not None and not issues:
+        db_type = DB_TYPES.get(engine.dialect.name)
+        if db_type:
+            plan = get_explain_plan(engine, sql, db_type)
+            if isinstance(plan, str):
+                issues.append(plan.splitlines()[0])
+
+    return list(dict.fromkeys(issues))
+
+
+def _strip_fences(sql):
+    sql = sql.strip()
+    if sql.startswith("```"):
+        sql = sql.split("\n", 1)[1] if "\n" in sql else ""
+        if sql.rstrip().endswith("```"):
+            sql = sql.rstrip()[:-3]
+    return sql.strip()
+
+
+def validate_sql(question, sql, schema, snapshot=None, engine=None):
+    issues = check_sql(sql, snapshot, engine)
+
+    # Only a failed local check costs an LLM round trip.
+    if not issues:
+        return "VALID"
+
+    problems = "\n".join(f"- {issue}" for issue in issues)
     validation_prompt = f"""
 You are a strict SQL validator.
 
@@ -13,6 +363,9 @@ User question:
 Generated SQL:
 {sql}
 
+A static check found these problems:
+{problems}
+
 Check for:
 - Non-existent tables
 - Non-existent columns
@@ -26,5 +379,11 @@ VALID
 If invalid, return corrected SQL only.
 """
 
-    result = generate_sql(validation_prompt)
-    return result.strip()
\ No newline at end of file
+    result = complete(validation_prompt)
+    result = _strip_fences(result)
+
+    final_sql = sql if result == "VALID" else result
+    if not is_read_only(final_sql):
+        raise UnsafeSQLError("Refusing to run a non read-only statement: " + "; ".join(_safety_issues(tokenize(final_sql))))
+
+    return result
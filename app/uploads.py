@@ -0,0 +1,66 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "text2sql_uploads")
+MAX_UPLOADS = 8
+
+# Streamlit hands back the same UploadedFile.file_id on every rerun, so the
+# content hash only has to be computed once per upload.
+_digests = {}
+_lock = threading.Lock()
+
+
+def _digest(buffer):
+    return hashlib.sha256(buffer).hexdigest()
+
+
+def store_upload(uploaded_file):
+    file_id = getattr(uploaded_file, "file_id", None)
+    digest = _digests.get(file_id) if file_id else None
+
+    buffer = None
+    if digest is None:
+        buffer = uploaded_file.getbuffer()
+        digest = _digest(buffer)
+        if file_id:
+            _digests[file_id] = digest
+
+    path = os.path.join(UPLOAD_DIR, f"{digest}.db")
+
+    with _lock:
+        if not os.path.exists(path):
+            if buffer is None:
+                buffer = uploaded_file.getbuffer()
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(buffer)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            prune_uploads(keep=path)
+        else:
+            os.utime(path)
+
+    return digest, path
+
+
+def prune_uploads(keep=None, max_uploads=MAX_UPLOADS):
+    if not os.path.isdir(UPLOAD_DIR):
+        return
+
+    paths = [os.path.join(UPLOAD_DIR, name) for name in os.listdir(UPLOAD_DIR)]
+    paths = [p for p in paths if p.endswith(".db") and p != keep]
+    paths.sort(key=os.path.getmtime, reverse=True)
+
+    limit = max_uploads - 1 if keep else max_uploads
+    for path in paths[max(limit, 0):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
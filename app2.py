@@ -1,19 +1,21 @@
+import time
+
 import streamlit as st
 import pandas as pd
-import tempfile
 
-from app.agent import generate_sql
-from app.sql_validator import validate_sql
-from app.db_engine import create_db_engine, execute
+from app.sql_validator import UnsafeSQLError
+from app.db_engine import get_engine, pool_status
 from app.schema_visualizer import generate_er_diagram
-from app.analyst import explain_result
-from app.planner_agent import generate_sql_from_plan
-from app.query_analyzer import get_explain_plan, detect_heavy_query
-
-from cache.caching import get_cached_sql, store_sql
-from cache.semantic_cache import get_semantic_sql, store_semantic_sql
-
-from sqlalchemy import inspect
+from app.pipeline import Text2SQLPipeline
+from app.chart_planner import plan_chart
+from app.uploads import store_upload
+from app.catalog import get_snapshot
+from app.profiler import get_profiler
+from app.schema_retriever import estimate_tokens
+from app.llm import track_usage, submit, BackgroundStream
+from app.index_advisor import advise, cached_workload, format_report, history_workload
+from app.history import get_history, record_query
+from common.telemetry import get_metrics, span
 
 
 # ---------------- CONFIG ----------------
@@ -25,8 +27,12 @@ st.caption("Natural language → Planning → Validation → Cost Analysis → E
 
 # ---------------- SESSION ----------------
 
-if "history" not in st.session_state:
-    st.session_state.history = []
+HISTORY_PAGE_SIZE = 10
+
+if "history_pages" not in st.session_state:
+    # Last id of each history page visited so far (None = first page). The
+    # recent view pages by id; the frequent view only needs the page number.
+    st.session_state.history_pages = [None]
 
 
 # ---------------- DATABASE SELECTION ----------------
@@ -39,7 +45,6 @@ db_type = st.sidebar.selectbox(
 )
 
 engine = None
-db_identifier = None
 
 
 # -------- SQLITE --------
@@ -51,12 +56,8 @@ if db_type == "sqlite":
     )
 
     if uploaded_file:
-        temp_db = tempfile.NamedTemporaryFile(delete=False)
-        temp_db.write(uploaded_file.read())
-        db_path = temp_db.name
-
-        engine = create_db_engine("sqlite", db_path=db_path)
-        db_identifier = db_path
+        _, db_path = store_upload(uploaded_file)
+        engine = get_engine("sqlite", db_path=db_path, immutable=True)
 
 
 # -------- MYSQL --------
@@ -68,14 +69,13 @@ elif db_type == "mysql":
     database = st.sidebar.text_input("Database")
 
     if host and user and password and database:
-        engine = create_db_engine(
+        engine = get_engine(
             "mysql",
             host=host,
             user=user,
             password=password,
             database=database
         )
-        db_identifier = f"{host}_{database}"
 
 
 # -------- POSTGRES --------
@@ -87,14 +87,13 @@ elif db_type == "postgres":
     database = st.sidebar.text_input("Database")
 
     if host and user and password and database:
-        engine = create_db_engine(
+        engine = get_engine(
             "postgres",
             host=host,
             user=user,
             password=password,
             database=database
         )
-        db_identifier = f"{host}_{database}"
 
 
 # ---------------- STOP IF NO ENGINE ----------------
@@ -104,35 +103,66 @@ if not engine:
     st.stop()
 
 
+with st.sidebar.expander("Connection Pool"):
+    st.json(pool_status(engine))
+
+
 # ---------------- SCHEMA + TABLES ----------------
 
-inspector = inspect(engine)
-tables = inspector.get_table_names()
+snapshot = get_snapshot(engine)
+tables = snapshot.table_names
+
+profiler = get_profiler()
+# Counts may need a COUNT(*) per table; until the profiler's worker has
+# them the labels go without.
+table_stats = profiler.table_stats(engine)
 
 st.sidebar.subheader("Tables")
-selected_table = st.sidebar.selectbox("Preview Table", tables)
+selected_table = st.sidebar.selectbox(
+    "Preview Table", tables,
+    format_func=lambda t: f"{t} (~{table_stats.rows(t):,} rows)"
+    if table_stats is not None and table_stats.rows(t) is not None else t
+)
+
+
+def show_profile(table):
+    # Never waits on the profiler: shows what is cached and polls until the
+    # worker has finished.
+    profile = profiler.get(engine, table)
+    if profile is not None and table_stats is None and profiler.table_stats(engine) is not None:
+        st.rerun()      # row counts arrived; redraw the sidebar labels
+    if profile is None:
+        st.caption("Profiling columns in the background…")
+    elif profile.error:
+        st.caption(f"Profile unavailable: {profile.error}")
+    else:
+        st.caption(
+            f"{'~' if profile.rows_estimated else ''}{profile.rows:,} rows · stats from "
+            f"{profile.sample_rows:,} rows ({profile.method}) in {profile.elapsed:.2f}s"
+        )
+        st.dataframe(profile.columns, use_container_width=True, hide_index=True)
+
 
 if selected_table:
-    preview_df = execute(engine, f"SELECT * FROM {selected_table} LIMIT 100")
+    preview_df = profiler.preview(engine, selected_table)
     st.subheader(f"Preview: {selected_table}")
     st.dataframe(preview_df, use_container_width=True)
 
+    with st.expander("Column profile"):
+        pending = profiler.peek(engine, selected_table) is None
+        st.fragment(show_profile, run_every=1.0 if pending else None)(selected_table)
+
 
 # ---------------- ER DIAGRAM ----------------
 
 if st.sidebar.button("Show ER Diagram"):
-    er = generate_er_diagram(engine)
+    er = generate_er_diagram(engine, snapshot)
     st.graphviz_chart(er)
 
 
 # ---------------- BUILD SCHEMA STRING ----------------
 
-schema = ""
-for table in tables:
-    columns = inspector.get_columns(table)
-    schema += f"\nTable: {table}\n"
-    for col in columns:
-        schema += f"{col['name']} ({str(col['type'])})\n"
+schema = snapshot.prompt_string()
 
 
 # ---------------- QUESTION INPUT ----------------
@@ -143,106 +173,237 @@ question = st.text_input("Ask a question about your data")
 
 use_planner = st.checkbox("Use Multi-Step Planner Agent")
 show_explain = st.checkbox("Show Query Execution Plan")
+stream_llm = st.checkbox("Stream LLM output", value=True)
+
+pipeline = Text2SQLPipeline(engine, use_planner=use_planner)
 
 
 # ---------------- QUERY PIPELINE ----------------
 
 if st.button("Run Query") and question:
 
-    cache_key = question + str(db_identifier)
+    started = time.perf_counter()
+    first_byte = None
 
-    # -------- EXACT CACHE --------
-    cached_sql = get_cached_sql(cache_key)
+    with track_usage() as usage, span("question") as trace:
 
-    if cached_sql:
-        st.info("Using exact cached SQL")
-        sql = cached_sql
+        def remember(sql, rows=None, error=None):
+            # Queued for the history writer thread; nothing waits on the write.
+            record_query(
+                question, fingerprint=snapshot.fingerprint, sql=sql, source=source, rows=rows, error=error,
+                timings={**trace.stages, "total": time.perf_counter() - started}, usage=usage,
+            )
 
-    else:
-        # -------- SEMANTIC CACHE --------
-        semantic_sql = get_semantic_sql(cache_key)
+        # Only the tables relevant to the question (plus their join path)
+        # are sent to the LLM; the full schema is the fallback.
+        question_schema = pipeline.question_schema(question, snapshot)
+
+        # -------- EXACT / TEMPLATE / SEMANTIC CACHE --------
+        sql, source = pipeline.lookup(question, snapshot)
+
+        if source == "exact":
+            st.info("Using exact cached SQL")
+
+        elif source == "template":
+            st.info("Using cached SQL with this question's values")
 
-        if semantic_sql:
+        elif source == "semantic":
             st.info("Using semantic cached SQL")
-            sql = semantic_sql
 
         else:
+            source = "llm"
+
             # -------- PLANNER (OPTIONAL) --------
             if use_planner:
-                plan, sql = generate_sql_from_plan(question, schema)
+                plan, sql = pipeline.generate(question, question_schema)
 
                 st.subheader("Multi-Step Plan")
                 st.write(plan)
+            elif stream_llm:
+                _, tokens = pipeline.generate(question, question_schema, stream=True)
+                sql = ""
+                draft = st.empty()
+                for token in tokens:
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                    sql += token
+                    draft.code(sql, language="sql")
+                sql = sql.strip()
+                draft.empty()
             else:
-                sql = generate_sql(
-                    question + f"\nSCHEMA:\n{schema}"
-                )
+                _, sql = pipeline.generate(question, question_schema)
 
             # -------- VALIDATION --------
-            validation_result = validate_sql(question, sql, schema)
-
-            if validation_result != "VALID":
+            try:
+                sql, corrected = pipeline.validate(question, sql, question_schema, snapshot)
+            except UnsafeSQLError as e:
+                remember(sql, error=f"UnsafeSQLError: {e}")
+                st.error(str(e))
+                st.stop()
+
+            if corrected:
                 st.warning("SQL corrected by validator")
-                sql = validation_result
 
             # -------- STORE CACHE --------
-            store_sql(cache_key, sql)
-            store_semantic_sql(cache_key, sql)
+            pipeline.store(question, sql, snapshot)
+
+        # -------- DISPLAY SQL --------
+        if first_byte is None:
+            first_byte = time.perf_counter()
+        st.subheader("Generated SQL")
+        st.code(sql, language="sql")
+
+        # -------- EXPLAIN PLAN (COST ANALYZER) --------
+        assessment = pipeline.assess(sql)
+
+        if show_explain:
+            st.subheader("Execution Plan")
+            st.code(str(assessment.plan) if assessment.plan is not None else assessment.message)
+
+        if assessment.action == "block":
+            remember(sql, error=f"QueryTooExpensive: {assessment.message}")
+            st.error(f"⛔ {assessment.message}")
+            st.stop()
+        elif assessment.action == "limit":
+            st.warning(f"⚠️ {assessment.message}")
+        elif assessment.action == "warn":
+            st.warning(f"⚠️ {assessment.message}")
+
+        # -------- EXECUTE --------
+        try:
+            query_result = pipeline.execute(assessment.sql)
+            result = query_result.frame
+
+            # The analyst runs on the shared LLM pool while the table and
+            # chart render; its tokens are shown once they are drawn.
+            if stream_llm:
+                insight = BackgroundStream(pipeline.explain, question, result, stream=True)
+            else:
+                insight = submit(pipeline.explain, question, result)
+
+            if isinstance(result, pd.DataFrame):
+                st.subheader("Query Result")
+                if query_result.truncated:
+                    st.warning(f"Result truncated to the first {query_result.max_rows:,} rows.")
+                st.dataframe(result, use_container_width=True)
+                st.caption(
+                    f"{query_result.rows:,} rows · {query_result.bytes / 1024:,.1f} KiB · "
+                    + (f"served from result cache in {query_result.elapsed * 1000:.1f} ms"
+                       if query_result.cached else f"executed in {query_result.elapsed:.2f}s")
+                )
 
-    # -------- DISPLAY SQL --------
-    st.subheader("Generated SQL")
-    st.code(sql, language="sql")
+                # -------- AUTO VISUALIZATION --------
+                # Aggregated and downsampled here; the browser never gets
+                # more than CHART_MAX_POINTS values.
+                chart = plan_chart(result)
 
-    # -------- EXPLAIN PLAN (COST ANALYZER) --------
-    if show_explain:
-        plan_rows = get_explain_plan(engine, sql, db_type)
+                if chart is not None:
+                    st.subheader("Auto Chart")
+                    if chart.kind == "line":
+                        st.line_chart(chart.data)
+                    else:
+                        st.bar_chart(chart.data)
+                    if chart.note:
+                        st.caption(f"Chart: {chart.note}.")
 
-        st.subheader("Execution Plan")
-        st.write(plan_rows)
+            else:
+                st.write(result)
+
+            # -------- ANALYST EXPLANATION --------
+            # The query already succeeded; an explanation failure must not
+            # turn it into a failed run.
+            st.subheader("AI Analyst Explanation")
+            try:
+                if stream_llm:
+                    st.write_stream(iter(insight))
+                else:
+                    st.write(insight.result())
+            except Exception as e:
+                st.warning(f"Explanation unavailable: {e}")
+
+            # -------- HISTORY --------
+            remember(sql, rows=query_result.rows)
+
+        except Exception as e:
+            remember(sql, error=f"{type(e).__name__}: {e}")
+            st.error(f"Query failed: {str(e)}")
+
+        finished = time.perf_counter()
+        st.caption(
+            f"Time to first SQL: {first_byte - started:.2f}s · End to end: {finished - started:.2f}s · "
+            f"Schema context: ~{estimate_tokens(question_schema)} tokens "
+            f"(full schema ~{estimate_tokens(schema)}) · "
+            f"LLM usage: {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens "
+            f"over {usage['calls']} calls"
+        )
 
-        if isinstance(plan_rows, list) and detect_heavy_query(plan_rows):
-            st.warning("⚠️ Potential Full Table Scan Detected — Query May Be Expensive for huge databases.")
 
-    # -------- EXECUTE --------
-    try:
-        result = execute(engine, sql)
+# ---------------- SIDEBAR HISTORY ----------------
 
-        if isinstance(result, pd.DataFrame):
-            st.subheader("Query Result")
-            st.dataframe(result, use_container_width=True)
+st.sidebar.subheader("Query History")
 
-            # -------- AUTO VISUALIZATION --------
-            numeric_cols = result.select_dtypes(include=["number"]).columns
+history = get_history()
+history_view = st.sidebar.radio("History view", ["Recent", "Most frequent"], horizontal=True,
+                                label_visibility="collapsed",
+                                on_change=lambda: st.session_state.update(history_pages=[None]))
+pages = st.session_state.history_pages
 
-            if len(numeric_cols) >= 1:
-                st.subheader("Auto Chart")
-                st.bar_chart(result[numeric_cols])
+if history_view == "Recent":
+    entries = history.recent(HISTORY_PAGE_SIZE, before=pages[-1], fingerprint=snapshot.fingerprint)
+else:
+    entries = history.frequent(HISTORY_PAGE_SIZE, offset=(len(pages) - 1) * HISTORY_PAGE_SIZE,
+                               fingerprint=snapshot.fingerprint)
 
-        else:
-            st.write(result)
+for item in entries:
+    st.sidebar.markdown(f"**Q:** {item['question']}")
+    details = [f"Rows: {item['rows'] if item['rows'] is not None else 'NA'}", f"source: {item['source'] or '-'}"]
+    if history_view == "Recent":
+        if item["total_ms"] is not None:
+            details.append(f"{item['total_ms']:,.0f} ms")
+    else:
+        details.append(f"{item['runs']} runs ({item['errors']} failed), avg {item['avg_ms'] or 0:,.0f} ms")
+    st.sidebar.caption(" · ".join(details))
+    if item.get("error"):
+        st.sidebar.caption(f"❌ {item['error']}")
+    if item["sql"]:
+        st.sidebar.code(item["sql"], language="sql")
 
-        # -------- ANALYST EXPLANATION --------
-        review = explain_result(question, result)
+newer, older = st.sidebar.columns(2)
+if newer.button("← Newer", disabled=len(pages) == 1):
+    pages.pop()
+    st.rerun()
+if older.button("Older →", disabled=len(entries) < HISTORY_PAGE_SIZE):
+    pages.append(entries[-1]["id"])
+    st.rerun()
 
-        st.subheader("AI Analyst Explanation")
-        st.write(review)
 
-        # -------- HISTORY --------
-        st.session_state.history.append({
-            "question": question,
-            "sql": sql,
-            "rows": len(result) if isinstance(result, pd.DataFrame) else "NA"
-        })
+# ---------------- INDEX ADVISOR ----------------
 
-    except Exception as e:
-        st.error(f"Query failed: {str(e)}")
+with st.sidebar.expander("Index Advisor"):
+    st.caption("Mines the query history and the SQL cache for missing indexes. Nothing is applied.")
+    if st.button("Analyze workload"):
+        workload = history_workload(snapshot.fingerprint) + cached_workload()
+        proposals, summary = advise(engine, workload)
+        st.code(format_report(proposals, summary), language="sql")
 
 
-# ---------------- SIDEBAR HISTORY ----------------
+# ---------------- METRICS ----------------
 
-st.sidebar.subheader("Query History")
+with st.sidebar.expander("Metrics"):
+    metrics = get_metrics()
+    latency = metrics.latency()
 
-for item in reversed(st.session_state.history[-10:]):
-    st.sidebar.markdown(f"**Q:** {item['question']}")
-    st.sidebar.caption(f"Rows: {item['rows']}")
-    st.sidebar.code(item["sql"], language="sql")
\ No newline at end of file
+    if latency:
+        st.caption("Stage latency (rolling window, ms)")
+        st.dataframe(pd.DataFrame.from_dict(latency, orient="index").round(1), use_container_width=True)
+
+    for tier, rate in metrics.cache_rates().items():
+        st.caption(f"{tier} cache: {rate['hits']} hits / {rate['misses']} misses ({rate['hit_rate']:.0%})")
+
+    for site, rate in metrics.cache_rates("llm_cache_lookups_total", by="site").items():
+        st.caption(f"LLM cache ({site}): {rate['hits']} hits / {rate['misses']} misses ({rate['hit_rate']:.0%})")
+
+    for labels, value in metrics.counter_values("llm_tokens_total"):
+        st.caption(f"LLM {labels['kind']} tokens from {labels['site']}: {int(value):,}")
+
+    st.download_button("Prometheus metrics", metrics.prometheus(), file_name="text2sql.prom")
@@ -0,0 +1,87 @@
+import datetime
+import decimal
+import math
+from collections import Counter
+
+FLOAT_DIGITS = 6
+
+
+def normalize_value(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()        # numpy / pandas scalars
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float, decimal.Decimal)):
+        number = round(float(value), FLOAT_DIGITS)
+        return int(number) if number.is_integer() else number
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def _rows(frame):
+    return [tuple(normalize_value(v) for v in row) for row in frame.itertuples(index=False, name=None)]
+
+
+def _columns(rows, width):
+    return [[row[i] for row in rows] for i in range(width)]
+
+
+def _sort_key(value):
+    return (value is None, type(value).__name__, value if value is not None else 0)
+
+
+def _column_signature(values):
+    return tuple(sorted(values, key=_sort_key))
+
+
+def _match_columns(gold_columns, pred_columns):
+    # Map every gold column onto a distinct predicted column holding the same
+    # multiset of values; None if some gold column has no partner.
+    used = set()
+    mapping = []
+    pred_signatures = [_column_signature(c) for c in pred_columns]
+    for column in gold_columns:
+        signature = _column_signature(column)
+        for j, candidate in enumerate(pred_signatures):
+            if j not in used and candidate == signature:
+                used.add(j)
+                mapping.append(j)
+                break
+        else:
+            return None
+    return mapping
+
+
+def compare_results(gold, predicted):
+    """Order-insensitive execution match of two result frames.
+
+    "exact"    same rows as a multiset, columns matched by content rather
+               than name or position;
+    "superset" the prediction carries every gold column (plus extras) with
+               the same rows once projected onto them;
+    None       anything else."""
+    gold_rows, pred_rows = _rows(gold), _rows(predicted)
+    if len(gold_rows) != len(pred_rows):
+        return None
+
+    gold_width, pred_width = len(gold.columns), len(predicted.columns)
+    if gold_width > pred_width:
+        return None
+    if not gold_rows:
+        return "exact" if gold_width == pred_width else "superset"
+
+    mapping = _match_columns(_columns(gold_rows, gold_width), _columns(pred_rows, pred_width))
+    if mapping is None:
+        return None
+
+    projected = Counter(tuple(row[j] for j in mapping) for row in pred_rows)
+    if projected != Counter(gold_rows):
+        return None
+    return "exact" if gold_width == pred_width else "superset"
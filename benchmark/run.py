@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from app import llm
+from app.db_engine import get_engine, run_query
+from app.pipeline import Text2SQLPipeline, load_questions
+from cache.caching import get_sql_cache
+from cache.llm_cache import get_llm_cache
+
+from benchmark.compare import compare_results
+from benchmark.stand_in import STAND_IN_MODEL, StandInClient
+
+GOLD_PATH = "benchmark/gold.json"
+STAGES = ("cache_lookup", "generation", "validation", "cost_check", "execution", "explanation", "total")
+SOURCES = ("exact", "template", "semantic", "llm")
+DEFAULT_TOLERANCE = 0.25
+# Latency changes smaller than this are timer noise on a warm laptop.
+MIN_LATENCY_DELTA_MS = 5.0
+
+
+def load_gold(path=GOLD_PATH):
+    # gold.json: [{level, question, sql, ambiguous?}] for the bundled data.db.
+    with open(path, encoding="utf-8") as f:
+        return {item["question"]: item for item in json.load(f)}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+# ---------------- RUN ----------------
+
+def gold_frames(engine, gold):
+    frames = {}
+    for question, item in gold.items():
+        frames[question] = run_query(engine, item["sql"], max_rows=None, use_cache=False).frame
+    return frames
+
+
+def evaluate(pipeline, questions, gold, frames, passes=2, workers=1, db_workers=1):
+    records = []
+    for n in range(1, passes + 1):
+        results = pipeline.run_many(questions, max_workers=workers, db_workers=db_workers)
+        for result in results:
+            item = gold.get(result.question)
+            match = None
+            if item is not None and result.error is None:
+                match = compare_results(frames[result.question], result.frame)
+            records.append({
+                "pass": n,
+                "level": result.level,
+                "question": result.question,
+                "ambiguous": bool(item and item.get("ambiguous")),
+                "has_gold": item is not None,
+                "source": result.source,
+                "sql": result.sql,
+                "match": match,
+                "error": result.error,
+                "rows": result.result.rows if result.result is not None else None,
+                "result_cached": result.result.cached if result.result is not None else None,
+                "timings": {k: _ms(v) for k, v in sorted(result.timings.items())},
+                "usage": result.usage,
+            })
+    return records
+
+
+# ---------------- REPORT ----------------
+
+def summarize(records):
+    n = len(records)
+    graded = [r for r in records if r["has_gold"]]
+    clear = [r for r in graded if not r["ambiguous"]]
+
+    def rate(count, total):
+        return round(count / total, 4) if total else None
+
+    def exact(rows):
+        return sum(1 for r in rows if r["match"] == "exact")
+
+    def lenient(rows):
+        return sum(1 for r in rows if r["match"] is not None)
+
+    sources = {s: sum(1 for r in records if r["source"] == s) for s in SOURCES}
+    latency = {}
+    for stage in STAGES:
+        values = [r["timings"][stage] for r in records if stage in r["timings"]]
+        if values:
+            latency[stage] = {
+                "p50": round(percentile(values, 0.5), 3),
+                "p95": round(percentile(values, 0.95), 3),
+                "mean": round(sum(values) / len(values), 3),
+            }
+
+    total_tokens = sum(r["usage"].get("total_tokens", 0) for r in records)
+    return {
+        "questions": n,
+        "graded": len(graded),
+        "errors": sum(1 for r in records if r["error"]),
+        "accuracy": rate(exact(graded), len(graded)),
+        "lenient_accuracy": rate(lenient(graded), len(graded)),
+        "unambiguous_accuracy": rate(exact(clear), len(clear)),
+        "sources": sources,
+        "cache_hit_rate": rate(sources["exact"] + sources["template"] + sources["semantic"], n),
+        "result_cache_hit_rate": rate(sum(1 for r in records if r["result_cached"]), n),
+        "latency_ms": latency,
+        "tokens": {
+            "llm_calls": sum(r["usage"].get("calls", 0) for r in records),
+            "prompt": sum(r["usage"].get("prompt_tokens", 0) for r in records),
+            "completion": sum(r["usage"].get("completion_tokens", 0) for r in records),
+            "total": total_tokens,
+            "per_question": round(total_tokens / n, 1) if n else None,
+        },
+    }
+
+
+def build_report(records, meta):
+    passes = []
+    for n in sorted({r["pass"] for r in records}):
+        in_pass = [r for r in records if r["pass"] == n]
+        levels = sorted({r["level"] for r in in_pass}, key=lambda lvl: (lvl is None, lvl))
+        passes.append({
+            "pass": n,
+            "overall": summarize(in_pass),
+            "levels": {str(lvl): summarize([r for r in in_pass if r["level"] == lvl]) for lvl in levels},
+        })
+    return {"meta": meta, "passes": passes, "questions": records}
+
+
+def write_report(report, path):
+    # Stable key order and no wall-clock fields, so two reports diff cleanly.
+    text = json.dumps(report, indent=2, sort_keys=True, default=str) + "\n"
+    if path == "-":
+        sys.stdout.write(text)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+# ---------------- BASELINE DIFF ----------------
+
+def diff_reports(baseline, report, tolerance=DEFAULT_TOLERANCE):
+    # Returns (lines, regressions): lines describe every change worth
+    # reading, regressions is the subset that should fail a run.
+    lines, regressions = [], []
+
+    def check(label, old, new, worse_when_higher, relative, floor=0.0):
+        if old is None or new is None or old == new:
+            return
+        change = (new - old) / old if relative and old else new - old
+        line = f"{label}: {old} -> {new}"
+        lines.append(line)
+        worse = change > 0 if worse_when_higher else change < 0
+        if worse and abs(new - old) > floor and (abs(change) > tolerance if relative else True):
+            regressions.append(line)
+
+    old_passes = {p["pass"]: p for p in baseline.get("passes", [])}
+    for new_pass in report["passes"]:
+        old_pass = old_passes.get(new_pass["pass"])
+        if old_pass is None:
+            continue
+        groups = [("overall", old_pass["overall"], new_pass["overall"])]
+        groups += [
+            (f"level {lvl}", old_pass["levels"][lvl], summary)
+            for lvl, summary in new_pass["levels"].items() if lvl in old_pass["levels"]
+        ]
+        for name, old, new in groups:
+            prefix = f"pass {new_pass['pass']} {name}"
+            check(f"{prefix} accuracy", old["accuracy"], new["accuracy"], False, False)
+            check(f"{prefix} cache_hit_rate", old["cache_hit_rate"], new["cache_hit_rate"], False, False)
+            check(f"{prefix} tokens", old["tokens"]["total"], new["tokens"]["total"], True, True)
+            old_total = old["latency_ms"].get("total", {}).get("p50")
+            new_total = new["latency_ms"].get("total", {}).get("p50")
+            check(f"{prefix} p50 total ms", old_total, new_total, True, True, MIN_LATENCY_DELTA_MS)
+
+    old_matches = {(r["pass"], r["question"]): r["match"] for r in baseline.get("questions", [])}
+    for record in report["questions"]:
+        key = (record["pass"], record["question"])
+        if key in old_matches and old_matches[key] and not record["match"]:
+            line = f"pass {record['pass']} no longer matches: {record['question']}"
+            lines.append(line)
+            regressions.append(line)
+
+    return lines, regressions
+
+
+# ---------------- CLI ----------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Execution-accuracy and latency benchmark over a question file.")
+    parser.add_argument("questions", nargs="?", default="queries.txt", help="question file (default: queries.txt)")
+    parser.add_argument("--gold", default=GOLD_PATH, help="gold SQL file")
+    parser.add_argument("--db", default="database/data.db", help="SQLite database to query")
+    parser.add_argument("-o", "--output", default="-", help="JSON report path (default: stdout)")
+    parser.add_argument("--model", choices=("stand-in", "groq"), default="stand-in",
+                        help="answer with the deterministic gold stand-in (default) or the real LLM")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated stand-in latency per call")
+    parser.add_argument("--passes", type=int, default=2, help="runs over the question set; later passes measure warm caches")
+    parser.add_argument("--shared-cache", action="store_true",
+                        help="read and write the app's ./cache stores instead of empty ones in a scratch directory")
+    parser.add_argument("--workers", type=int, default=1, help="questions in flight")
+    parser.add_argument("--db-workers", type=int, default=1, help="concurrent query executions")
+    parser.add_argument("--planner", action="store_true", help="use the multi-step planner")
+    parser.add_argument("--no-explain", action="store_true", help="skip the analyst explanation")
+    parser.add_argument("--level", type=int, action="append", help="only run these levels")
+    parser.add_argument("--baseline", help="earlier report to diff against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="relative latency/token increase tolerated against the baseline")
+    args = parser.parse_args(argv)
+
+    gold = load_gold(args.gold)
+    questions = load_questions(args.questions)
+    if args.level:
+        questions = [(lvl, q) for lvl, q in questions if lvl in args.level]
+
+    db_path = os.path.abspath(args.db)
+    output = args.output if args.output == "-" else os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    original_cwd = os.getcwd()
+    scratch = None
+    if not args.shared_cache:
+        # The caches live under ./cache relative to the working directory;
+        # a scratch one keeps gold SQL out of the app's stores and makes
+        # every run start from the same (empty) state.
+        scratch = tempfile.TemporaryDirectory(prefix="text2sql_bench_")
+        os.makedirs(os.path.join(scratch.name, "cache"))
+        os.chdir(scratch.name)
+
+    try:
+        if args.model == "stand-in":
+            llm.set_client(StandInClient({q: item["sql"] for q, item in gold.items()}, args.latency_ms / 1000))
+
+        engine = get_engine("sqlite", db_path=db_path)
+        frames = gold_frames(engine, gold)
+        pipeline = Text2SQLPipeline(engine, use_planner=args.planner, explain=not args.no_explain, history=False)
+
+        started = time.perf_counter()
+        records = evaluate(pipeline, questions, gold, frames, passes=args.passes,
+                           workers=args.workers, db_workers=args.db_workers)
+        elapsed = time.perf_counter() - started
+
+        report = build_report(records, {
+            "model": STAND_IN_MODEL if args.model == "stand-in" else llm.MODEL,
+            "db": os.path.basename(db_path),
+            "questions": len(questions),
+            "passes": args.passes,
+            "planner": args.planner,
+            "explain": not args.no_explain,
+            "fresh_cache": not args.shared_cache,
+        })
+        write_report(report, output)
+
+        for summary in report["passes"]:
+            overall = summary["overall"]
+            print(
+                f"pass {summary['pass']}: accuracy {overall['accuracy']}, "
+                f"cache hits {overall['cache_hit_rate']}, errors {overall['errors']}, "
+                f"p50 {overall['latency_ms'].get('total', {}).get('p50')} ms",
+                file=sys.stderr
+            )
+        print(f"{len(records)} runs in {elapsed:.1f}s", file=sys.stderr)
+
+        if baseline is not None:
+            lines, regressions = diff_reports(baseline, report, args.tolerance)
+            for line in lines:
+                print(("REGRESSION " if line in regressions else "") + line, file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+    finally:
+        if scratch is not None:
+            # Drain the write-behind queues now; their atexit flush would
+            # find the directory gone.
+            get_sql_cache().close()
+            get_llm_cache().close()
+            os.chdir(original_cwd)
+            scratch.cleanup()
+
+if __name__ == "__main__":
+    main()
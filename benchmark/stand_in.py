@@ -0,0 +1,64 @@
+import time
+from types import SimpleNamespace
+
+STAND_IN_MODEL = "gold-stand-in"
+FALLBACK_SQL = "SELECT 1"
+
+
+def _question_from(prompt):
+    # SQL_PROMPT and the planner's final prompt both carry the question on
+    # the first non-empty line after the last "User question:" header.
+    lines = prompt.splitlines()
+    headers = [i for i, line in enumerate(lines) if line.strip() == "User question:"]
+    if not headers:
+        return None
+    for line in lines[headers[-1] + 1:]:
+        if line.strip():
+            return line.strip()
+    return None
+
+
+def _usage(prompt, text):
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = max(1, len(text) // 4)
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class StandInClient:
+    """Deterministic, Groq-shaped chat client for offline benchmark runs.
+
+    SQL prompts are answered with the gold SQL for the question, so a run
+    measures everything around the model: caches, validation, execution and
+    result comparison. Token counts are estimated from prompt length."""
+
+    def __init__(self, gold, latency=0.0):
+        self.gold = dict(gold)
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def answer(self, prompt):
+        if "Generate ONLY" in prompt:
+            return self.gold.get(_question_from(prompt), FALLBACK_SQL)
+        if "database planning agent" in prompt:
+            return "1. Answer the question with a single query."
+        if "strict SQL validator" in prompt:
+            return "VALID"
+        return "Stand-in insight."
+
+    def create(self, model, messages, temperature=0, stream=False, **_):
+        prompt = messages[-1]["content"]
+        text = self.answer(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        usage = _usage(prompt, text)
+
+        if stream:
+            delta = SimpleNamespace(content=text)
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=usage)])
+
+        message = SimpleNamespace(content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage, model=STAND_IN_MODEL)
@@ -1,32 +1,225 @@
 import json
-import os 
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 
+from cache.write_behind import WriteBehind
+
+# Legacy store, imported into STORE_PATH the first time the cache is opened.
 CACHE_PATH = 'cache/sql_cache.json'
+STORE_PATH = 'cache/sql_cache.db'
+
+MAX_ENTRIES = 100_000
+TTL_SECONDS = None
+FLUSH_INTERVAL = 2.0
+
+
+class SQLCache:
+    """Process-wide exact cache: an in-memory LRU dict in front of a SQLite
+    table that is written behind the request path by a flusher thread."""
+
+    def __init__(self, path=STORE_PATH, max_entries=MAX_ENTRIES,
+                 ttl=TTL_SECONDS, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()   # key -> (sql, stored_at)
+        self._pending = {}              # key -> (sql, stored_at) or None (delete)
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+
+        self._load()
+
+        self._writer = WriteBehind(self.flush, flush_interval, "sql-cache-flusher")
+
+    # ---------------- LOOKUP ----------------
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            sql, stored_at = item
+            if self._expired(stored_at):
+                del self._entries[key]
+                self._pending[key] = None
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sql
+
+    def put(self, key, sql):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (sql, now)
+            self._entries.move_to_end(key)
+            self._pending[key] = (sql, now)
+            self._evict()
+        if len(self._pending) >= 1000:
+            self._writer.wake()
+
+    def items(self):
+        # Snapshot of the live (key, sql) pairs, oldest first.
+        with self._lock:
+            return [(key, sql) for key, (sql, stored_at) in self._entries.items() if not self._expired(stored_at)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            return item is not None and not self._expired(item[1])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "pending_writes": len(self._pending),
+            }
+
+    # ---------------- EVICTION ----------------
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self._pending[key] = None
+            self.evictions += 1
+
+    # ---------------- PERSISTENCE ----------------
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                key TEXT PRIMARY KEY,
+                sql TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+        """)
+        return conn
+
+    def _load(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            count = conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+            if count == 0:
+                self._import_legacy(conn)
+
+            rows = conn.execute("""
+                SELECT key, sql, stored_at FROM (
+                    SELECT key, sql, stored_at FROM sql_cache
+                    ORDER BY stored_at DESC LIMIT ?
+                ) ORDER BY stored_at
+            """, (self.max_entries,))
+
+            for key, sql, stored_at in rows:
+                if not self._expired(stored_at):
+                    self._entries[key] = (sql, stored_at)
+        finally:
+            conn.close()
+
+    def _import_legacy(self, conn):
+        if not os.path.exists(CACHE_PATH) or os.path.getsize(CACHE_PATH) == 0:
+            return
+
+        try:
+            with open(CACHE_PATH, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if not isinstance(data, dict):
+            return
+
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sql_cache (key, sql, stored_at) VALUES (?, ?, ?)",
+                [(k, v, now) for k, v in data.items() if isinstance(v, str)]
+            )
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            upserts = [(k, v[0], v[1]) for k, v in pending.items() if v is not None]
+            deletes = [(k,) for k, v in pending.items() if v is None]
+
+            conn = self._connect()
+            try:
+                with conn:
+                    if upserts:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO sql_cache (key, sql, stored_at) VALUES (?, ?, ?)",
+                            upserts
+                        )
+                    if deletes:
+                        conn.executemany("DELETE FROM sql_cache WHERE key = ?", deletes)
+            except sqlite3.Error:
+                # Put the batch back so the next flush retries it, without
+                # clobbering anything written in the meantime.
+                with self._lock:
+                    for k, v in pending.items():
+                        self._pending.setdefault(k, v)
+                raise
+            finally:
+                conn.close()
+
+    def close(self):
+        self._writer.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_sql_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLCache()
+    return _cache
+
 
-def load_cache():
-    if not os.path.exists(CACHE_PATH):
-        with open(CACHE_PATH,'w') as f:
-            json.dump({},f)
-        return {}
-    if os.path.getsize(CACHE_PATH) == 0:
-        return {}
-    
-    with open(CACHE_PATH,'r') as f:
-        data=json.load(f)
-        if isinstance(data,dict):
-            return data
-        else:
-            return {}
-        
-def save_cache(cache):
-    with open(CACHE_PATH,'w') as f:
-        json.dump(cache,f,indent=4)
-        
 def get_cached_sql(question):
-    cache = load_cache()
-    return cache.get(question)
+    return get_sql_cache().get(question)
+
+
+def store_sql(question, query):
+    get_sql_cache().put(question, query)
+
 
-def store_sql(question,query):
-    cache=load_cache()
-    cache[question] = query 
-    save_cache(cache)
\ No newline at end of file
+def cache_stats():
+    return get_sql_cache().stats()
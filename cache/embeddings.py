@@ -0,0 +1,89 @@
+import os
+import threading
+
+import numpy as np
+
+from cache.vector_index import normalize
+
+EMBEDDER = os.environ.get("SEMANTIC_EMBEDDER", "hashing")
+
+# An embedder is any object with `name` (stored next to the vectors, so a
+# model change rebuilds the index), `dim` and embed(texts) -> float32
+# array of unit rows; set_embedder() accepts any such object.
+
+
+class HashingEmbedder:
+    """Offline default: hashed word 1-2 grams plus char 3-5 grams, sublinear
+    TF weighted and folded into one fixed-width dense vector.
+
+    Stateless, so there is nothing to download or fit and vectors stored
+    yesterday stay comparable with vectors computed today."""
+
+    def __init__(self, n_features=512):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.dim = n_features
+        self.name = f"hashing-{n_features}"
+        self._word = HashingVectorizer(
+            analyzer="word", ngram_range=(1, 2), stop_words="english",
+            n_features=n_features, norm=None, alternate_sign=True,
+        )
+        self._char = HashingVectorizer(
+            analyzer="char_wb", ngram_range=(3, 5),
+            n_features=n_features, norm=None, alternate_sign=True,
+        )
+
+    def _block(self, vectorizer, texts):
+        matrix = vectorizer.transform(texts).astype(np.float32)
+        matrix.data = np.sign(matrix.data) * np.log1p(np.abs(matrix.data))
+        return normalize(matrix.toarray())
+
+    def embed(self, texts):
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return normalize(self._block(self._word, texts) + self._block(self._char, texts))
+
+
+class SentenceTransformerEmbedder:
+    """Optional heavier model; needs sentence-transformers and a model download."""
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", batch_size=64):
+        from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts):
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return normalize(self._model.encode(texts, batch_size=self.batch_size))
+
+
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+    "sentence-transformers": SentenceTransformerEmbedder,
+}
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                if EMBEDDER not in EMBEDDERS:
+                    raise ValueError(f"Unsupported embedder: {EMBEDDER}")
+                _embedder = EMBEDDERS[EMBEDDER]()
+    return _embedder
+
+
+def set_embedder(embedder):
+    global _embedder
+    with _embedder_lock:
+        _embedder = embedder
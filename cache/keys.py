@@ -0,0 +1,43 @@
+import hashlib
+import json
+import re
+
+# Legacy cache keys had the uploaded database's temp path glued to the end of
+# the question, e.g. "Top 5 customers.C:\Users\...\Temp\tmprb2zr2ya".
+LEGACY_PATH_SUFFIX = re.compile(r"(?:[A-Za-z]:\\|/tmp/|/var/folders/)\S*$")
+
+
+def normalize_question(question):
+    q = question.lower()
+    # Drop sentence punctuation but keep it inside literals like 50,000 / 2.5
+    q = re.sub(r"(?<!\d)[.,]|[.,](?!\d)", " ", q)
+    q = re.sub(r"[^\w\s.,%:/-]", " ", q)
+    return re.sub(r"\s+", " ", q).strip()
+
+
+def strip_legacy_suffix(question):
+    return LEGACY_PATH_SUFFIX.sub("", question)
+
+
+def schema_fingerprint(tables, extra=None):
+    # tables: {table_name: [(column_name, column_type), ...]}
+    canonical = {
+        table.lower(): sorted((str(name).lower(), str(col_type).upper()) for name, col_type in columns)
+        for table, columns in tables.items()
+    }
+    payload = json.dumps(canonical, sort_keys=True)
+    if extra:
+        payload += "|" + extra
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(fingerprint, question):
+    return f"{fingerprint}:{normalize_question(question)}"
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from cache.write_behind import WriteBehind
+from common.config import get_bool, get_float, get_int
+from common.telemetry import record_llm_cache
+
+STORE_PATH = 'cache/llm_cache.db'
+
+ENABLED = get_bool("LLM_CACHE", True)
+MAX_ENTRIES = get_int("LLM_CACHE_MAX_ENTRIES", 20_000)
+TTL_SECONDS = get_float("LLM_CACHE_TTL_SECONDS", 7 * 86_400)
+MEMORY_ENTRIES = 1_000
+FLUSH_INTERVAL = 2.0
+
+
+def request_key(params):
+    # Model, messages and sampling parameters; stream on/off shares a key.
+    payload = {k: v for k, v in params.items() if k != "stream"}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cacheable(params):
+    # Only deterministic requests: temperature 0 and a single choice.
+    return params.get("temperature", 1) == 0 and params.get("n", 1) == 1
+
+
+class LLMCache:
+    """Responses by request hash: a small in-memory LRU in front of a SQLite
+    table bounded by entry count and TTL, written behind the request path."""
+
+    def __init__(self, path=STORE_PATH, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS,
+                 memory_entries=MEMORY_ENTRIES, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.flush_interval = flush_interval
+
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()    # key -> (text, stored_at)
+        self._pending = {}              # key -> (model, text, stored_at)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().close()
+
+        self._writer = WriteBehind(self.flush, flush_interval, "llm-cache-flusher")
+
+    # ---------------- LOOKUP ----------------
+
+    def get(self, key):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None and key in self._pending:
+                item = self._pending[key][1:]
+        if item is None:
+            item = self._read(key)
+
+        if item is None or self._expired(item[1]):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._remember(key, item)
+        return item[0]
+
+    def put(self, key, model, text):
+        now = time.time()
+        with self._lock:
+            self._remember(key, (text, now))
+            self._pending[key] = (model, text, now)
+        if len(self._pending) >= 100:
+            self._writer.wake()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "in_memory": len(self._memory),
+                "pending_writes": len(self._pending),
+            }
+
+    def _remember(self, key, item):
+        self._memory[key] = item
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    # ---------------- PERSISTENCE ----------------
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_stored_at ON llm_cache(stored_at)")
+        return conn
+
+    def _read(self, key):
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            return None
+        try:
+            row = conn.execute("SELECT response, stored_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            row = None
+        finally:
+            conn.close()
+        return tuple(row) if row else None
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO llm_cache (key, model, response, stored_at) VALUES (?, ?, ?, ?)",
+                        [(k, model, text, stored_at) for k, (model, text, stored_at) in pending.items()]
+                    )
+                    if self.ttl:
+                        conn.execute("DELETE FROM llm_cache WHERE stored_at < ?", (time.time() - self.ttl,))
+                    # Oldest entries beyond the bound go first.
+                    conn.execute("""
+                        DELETE FROM llm_cache WHERE stored_at <= (
+                            SELECT stored_at FROM llm_cache ORDER BY stored_at DESC LIMIT 1 OFFSET ?
+                        )
+                    """, (self.max_entries,))
+            except sqlite3.Error:
+                with self._lock:
+                    for k, v in pending.items():
+                        self._pending.setdefault(k, v)
+                raise
+            finally:
+                conn.close()
+
+    def close(self):
+        self._writer.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+# ---------------- CLIENT WRAPPER ----------------
+
+def _cached_response(text, model):
+    message = SimpleNamespace(role="assistant", content=text)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+        model=model,
+        usage=None,
+        cached=True,
+    )
+
+
+def _cached_chunks(text, model):
+    delta = SimpleNamespace(role="assistant", content=text)
+    chunk = SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason="stop")],
+                            model=model, usage=None, x_groq=None)
+    return _Replay([chunk])
+
+
+class _Replay(list):
+    cached = True
+
+
+class _Completions:
+    def __init__(self, completions, cache):
+        self._completions = completions
+        self._cache = cache
+
+    def create(self, **params):
+        if not cacheable(params):
+            return self._completions.create(**params)
+
+        key = request_key(params)
+        text = self._cache.get(key)
+        record_llm_cache(text is not None)
+        model = params.get("model")
+        if text is not None:
+            return _cached_chunks(text, model) if params.get("stream") else _cached_response(text, model)
+
+        response = self._completions.create(**params)
+        if params.get("stream"):
+            return self._store_stream(key, model, response)
+        text = response.choices[0].message.content
+        if text is not None:
+            self._cache.put(key, model, text)
+        return response
+
+    def _store_stream(self, key, model, chunks):
+        # Stored only when the stream runs to the end.
+        parts = []
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._cache.put(key, model, "".join(parts))
+
+
+class CachedClient:
+    """Wraps a Groq-style client so chat.completions.create() answers
+    repeated deterministic requests from the LLM cache. Anything else is
+    passed through to the wrapped client."""
+
+    def __init__(self, client, cache=None):
+        self._client = client
+        self.chat = SimpleNamespace(completions=_Completions(client.chat.completions, cache or get_llm_cache()))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
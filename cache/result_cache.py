@@ -0,0 +1,160 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from common.config import get_float, get_int
+from common.sql_tokens import canonicalize
+
+MEMORY_BUDGET = get_int("RESULT_CACHE_BYTES", 256 * 1024 * 1024)
+# Server databases have no cheap "has anything changed" probe, so their
+# results are only trusted for this long after they were stored.
+SERVER_TTL = get_float("RESULT_CACHE_TTL_SECONDS", 300.0)
+SERVER_VERSION = "server"
+
+
+def _encode(frame):
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            return ("arrow", table), table.nbytes
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+    blob = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+    return ("pickle", blob), len(blob)
+
+
+def _decode(payload):
+    kind, value = payload
+    if kind == "arrow":
+        return value.to_pandas()
+    return pickle.loads(value)
+
+
+def _sqlite_file(engine):
+    database = engine.url.database or ""
+    if database.startswith("file:"):
+        database = database[len("file:"):].split("?", 1)[0]
+    return database if database and database != ":memory:" else None
+
+
+def data_version(engine):
+    if engine.dialect.name == "sqlite":
+        path = _sqlite_file(engine)
+        if path is None:
+            return None
+        # Content-addressed uploads are opened immutable and never change.
+        if "immutable=1" in str(engine.url):
+            return "immutable"
+        version = []
+        for suffix in ("", "-wal"):
+            try:
+                stat = os.stat(path + suffix)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                version.append(None)
+        return tuple(version)
+
+    # One constant version; whatever is cached for a server ages out after
+    # SERVER_TTL instead (see expired()).
+    return SERVER_VERSION if SERVER_TTL > 0 else None
+
+
+def expired(version, stored_at, ttl=SERVER_TTL):
+    return version == SERVER_VERSION and time.time() - stored_at > ttl
+
+
+class ResultCache:
+    """In-memory LRU of query results, stored as Arrow tables (or pickles
+    when pyarrow is missing) and bounded by their encoded size. Server
+    results expire `ttl` seconds after they were stored; a SQLite result is
+    dropped once a result for a newer version of its file is stored."""
+
+    def __init__(self, budget=MEMORY_BUDGET, ttl=SERVER_TTL):
+        self.budget = budget
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # key -> (payload, size, truncated, stored_at)
+        self._lock = threading.Lock()
+
+    def key(self, engine, sql, max_rows):
+        version = data_version(engine)
+        if version is None:
+            return None
+        return (engine.url.render_as_string(hide_password=True), canonicalize(sql), max_rows, version)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and expired(key[3], item[3], self.ttl):
+                self._drop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        payload, _, truncated, _ = item
+        return _decode(payload), truncated
+
+    def put(self, key, frame, truncated):
+        payload, size = _encode(frame)
+        if size > self.budget:
+            return
+        with self._lock:
+            # Expired entries, and those of an older version of the same
+            # database, can never be hit again.
+            url, version = key[0], key[3]
+            for old_key, old in list(self._entries.items()):
+                if old_key == key or expired(old_key[3], old[3], self.ttl) \
+                        or (old_key[0] == url and old_key[3] != version):
+                    self._drop(old_key)
+            self._entries[key] = (payload, size, truncated, time.time())
+            self.bytes += size
+            while self.bytes > self.budget and self._entries:
+                _, (_, evicted_size, _, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
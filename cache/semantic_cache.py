@@ -1,82 +1,230 @@
 import os
 import json
-import numpy as np
-
-CACHE_PATH = "cache/semantic_cache.json"
-
-def load_semantic_cache():
-    if not os.path.exists(CACHE_PATH):
-        return [], []
-
-    with open(CACHE_PATH, "r") as f:
-        data = json.load(f)
-        questions = [item["question"] for item in data]
-        sqls = [item["sql"] for item in data]
-        return questions, sqls
-
-
-def save_semantic_cache(questions, sqls):
-    data = []
-    for q, s in zip(questions, sqls):
-        data.append({"question": q, "sql": s})
-
-    with open(CACHE_PATH, "w") as f:
-        json.dump(data, f, indent=4)
-
+import logging
+import re
+import threading
 
-def build_faiss_index(questions):
-    if len(questions) == 0:
-        return None
+import numpy as np
 
-    embeddings = model.encode(questions)
-    dim = embeddings.shape[1]
+from cache.embeddings import get_embedder
+from cache.keys import normalize_question, strip_legacy_suffix
+from cache.vector_index import make_index
+from common.telemetry import get_metrics, span
 
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(embeddings))
+logger = logging.getLogger(__name__)
 
-    faiss.write_index(index, INDEX_PATH)
+# Legacy store; entries are copied into each new schema partition whose
+# tables cover the tables their SQL reads from.
+CACHE_PATH = "cache/semantic_cache.json"
+# One sub-directory (partition) per schema fingerprint.
+SEMANTIC_DIR = "cache/semantic_index"
+
+EMBEDDINGS_FILE = "embeddings.f32"
+ENTRIES_FILE = "entries.jsonl"
+META_FILE = "meta.json"
+
+INDEX_BACKEND = os.environ.get("SEMANTIC_INDEX_BACKEND", "auto")
+
+
+class SemanticIndex:
+    """Question embeddings stored once at insert time.
+
+    On disk: a raw float32 matrix (one row per question, append-only and
+    memory-mapped at load), a JSONL file with the matching question/SQL
+    pairs, and a small meta file recording the embedder and its width."""
+
+    def __init__(self, directory=SEMANTIC_DIR, backend=INDEX_BACKEND, embedder=None):
+        self.directory = directory
+        self.backend = backend
+        self.embedder = embedder or get_embedder()
+        self.questions = []
+        self.sqls = []
+        self.dim = None
+        self.index = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        stored_embedder = None
+        if os.path.exists(self._path(META_FILE)):
+            with open(self._path(META_FILE)) as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            stored_embedder = meta.get("embedder")
+
+        ends = []       # byte offset just past each complete entry
+        if os.path.exists(self._path(ENTRIES_FILE)):
+            with open(self._path(ENTRIES_FILE), "rb") as f:
+                offset = 0
+                for line in f:
+                    offset += len(line)
+                    if not line.endswith(b"\n"):
+                        break       # partial write
+                    if not line.strip():
+                        if ends:
+                            ends[-1] = offset
+                        continue
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        break
+                    self.questions.append(item["question"])
+                    self.sqls.append(item["sql"])
+                    ends.append(offset)
+
+        rows = 0
+        if self.dim and os.path.exists(self._path(EMBEDDINGS_FILE)):
+            rows = os.path.getsize(self._path(EMBEDDINGS_FILE)) // (4 * self.dim)
+        # A crash between the two appends can leave one file a row ahead, or
+        # a torn last line. Cut both back to the rows they agree on, so the
+        # next append lines up again.
+        rows = min(rows, len(self.questions))
+        del self.questions[rows:], self.sqls[rows:]
+        self._truncate(ENTRIES_FILE, ends[rows - 1] if rows else 0)
+        self._truncate(EMBEDDINGS_FILE, rows * 4 * (self.dim or 0))
+
+        base = None
+        if rows:
+            base = np.memmap(self._path(EMBEDDINGS_FILE), dtype=np.float32,
+                             mode="r", shape=(rows, self.dim))
+
+        if self.questions and stored_embedder != self.embedder.name:
+            del base
+            self._reembed()
+            return
+
+        if self.dim:
+            self.index = make_index(self.dim, base=base, backend=self.backend)
+
+    def _truncate(self, name, size):
+        path = self._path(name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def _reembed(self):
+        # The embedder changed since these vectors were written, so they are
+        # not comparable with new queries. Rebuild the store once, in batches.
+        pairs = list(zip(self.questions, self.sqls))
+        with span("semantic.reembed", entries=len(pairs)):
+            self._rebuild(pairs)
+
+    def _rebuild(self, pairs):
+        self.questions, self.sqls = [], []
+        self.dim = None
+        self.index = None
+        for name in (EMBEDDINGS_FILE, ENTRIES_FILE, META_FILE):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        for start in range(0, len(pairs), 1024):
+            self.add_many(pairs[start:start + 1024])
+
+    def __len__(self):
+        return len(self.questions)
+
+    def add_many(self, pairs):
+        pairs = list(pairs)
+        if not pairs:
+            return
+
+        vectors = self.embedder.embed([q for q, _ in pairs])
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._path(META_FILE), "w") as f:
+                    json.dump({"dim": self.dim, "embedder": self.embedder.name}, f)
+                self.index = make_index(self.dim, backend=self.backend)
+
+            with open(self._path(EMBEDDINGS_FILE), "ab") as f:
+                f.write(vectors.astype(np.float32).tobytes())
+            with open(self._path(ENTRIES_FILE), "a") as f:
+                for q, s in pairs:
+                    f.write(json.dumps({"question": q, "sql": s}) + "\n")
+
+            self.index.add(vectors)
+            for q, s in pairs:
+                self.questions.append(q)
+                self.sqls.append(s)
+
+    def add(self, question, sql):
+        self.add_many([(question, sql)])
+
+    def search(self, question, k=1):
+        if not self.questions:
+            return []
+        q_embed = self.embedder.embed([question])[0]
+        with self._lock:
+            scores, ids = self.index.search(q_embed, k)
+            return [(float(score), self.questions[i], self.sqls[i]) for score, i in zip(scores, ids)]
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+_TABLE_REF = re.compile(r"\b(?:from|join)\s+[\"`\[]?([A-Za-z_]\w*)", re.IGNORECASE)
+
+
+def _legacy_pairs(tables):
+    if not os.path.exists(CACHE_PATH):
+        return []
+    try:
+        with open(CACHE_PATH, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+
+    known = {t.lower() for t in tables}
+    pairs = []
+    for item in data:
+        if not isinstance(item, dict) or "question" not in item or "sql" not in item:
+            continue
+        referenced = {t.lower() for t in _TABLE_REF.findall(item["sql"])}
+        if referenced and referenced <= known:
+            pairs.append((normalize_question(strip_legacy_suffix(item["question"])), item["sql"]))
+    return pairs
+
+
+def get_semantic_index(partition, tables=None):
+    index = _indexes.get(partition)
+    if index is None:
+        with _index_lock:
+            index = _indexes.get(partition)
+            if index is None:
+                index = SemanticIndex(os.path.join(SEMANTIC_DIR, partition))
+                if len(index) == 0 and tables:
+                    index.add_many(_legacy_pairs(tables))
+                _indexes[partition] = index
     return index
 
 
-def load_index(questions):
-    if os.path.exists(INDEX_PATH):
-        return faiss.read_index(INDEX_PATH)
-    return build_faiss_index(questions)
-
-
-def get_semantic_sql(question, threshold=0.85):
-    questions, sqls = load_semantic_cache()
-
-    if len(questions) == 0:
+def get_semantic_sql(question, partition, threshold=0.85, tables=None, guard=None):
+    # guard(matched_question) can veto a hit that is close but not the same
+    # question, e.g. one asking about a different date range.
+    index = get_semantic_index(partition, tables)
+    with span("semantic.search", entries=len(index)) as current:
+        matches = index.search(normalize_question(question), k=1)
+    if not matches:
         return None
 
-    #index = load_index(questions)
-    store_embeds = model.encode(questions)
-    q_embed = model.encode([question])[0]
-    similarities = store_embeds @ q_embed / (
-        np.linalg.norm(store_embeds,axis=1) * np.linalg.norm(q_embed)
-    )
-    #distances, indices = index.search(np.array(q_embed), k=1)
-    
-    best_match_idx = np.argmax(similarities)
-    best_score = similarities[best_match_idx]
-
-    print("Semantic similarity score:", best_score)
-    
-    #similarity = 1 / (1 + distances[0][0])  # convert L2 → similarity
+    best_score, best_question, best_sql = matches[0]
+    logger.debug("Semantic similarity score: %.4f", best_score)
+    current.set(score=round(float(best_score), 4))
+    get_metrics().incr("semantic_score_buckets_total", bucket=f"{min(int(best_score * 10), 9) / 10:.1f}")
 
     if best_score >= threshold:
-        return sqls[best_match_idx]
+        if guard is not None and not guard(best_question):
+            current.set(rejected=True)
+            return None
+        return best_sql
 
     return None
 
 
-def store_semantic_sql(question, sql):
-    questions, sqls = load_semantic_cache()
-
-    questions.append(question)
-    sqls.append(sql)
-
-    save_semantic_cache(questions, sqls)
-    build_faiss_index(questions)
-
+def store_semantic_sql(question, sql, partition):
+    get_semantic_index(partition).add(normalize_question(question), sql)
@@ -0,0 +1,298 @@
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from cache.keys import normalize_question
+from cache.semantic_cache import get_semantic_index
+from common.sql_tokens import literal_spans
+from common.telemetry import span
+
+# Literals pulled out of a (normalized) question. value: float for numbers,
+# "YYYY-MM-DD" for dates, (n, unit) for intervals, the lower-cased text for
+# column values; columns/original are only set for column values.
+Literal = namedtuple("Literal", ["kind", "value", "start", "end", "columns", "original"],
+                     defaults=(None, None))
+
+INTERVAL_RE = re.compile(r"\b(?:last|past|previous|next)\s+(?:(\d+)\s+)?(day|week|month|quarter|year)s?\b")
+DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+NUMBER_RE = re.compile(r"(?<![\w.])\d+(?:,\d{3})*(?:\.\d+)?(?!\w)")
+
+# Interval modifiers in SQL strings: '-7 day', '-1 year', INTERVAL '30 days'.
+SQL_INTERVAL_RE = re.compile(r"^(\s*[+-]?\s*)(\d+)(\s*)(day|week|month|quarter|year)(s?)(\s*)$", re.IGNORECASE)
+# Units without an SQLite modifier, as multiples of one that has one.
+UNIT_IN = {"week": (7, "day"), "quarter": (3, "month")}
+
+MAX_VALUE_WORDS = 3
+MIN_VALUE_CHARS = 3
+
+
+# ---------------- QUESTION LITERALS ----------------
+
+class ValueLexicon:
+    """Known categorical values (cities, categories, statuses...) from the
+    schema retriever's sample values, looked up by normalized text."""
+
+    def __init__(self, sample_values=None):
+        self.values = {}    # normalized text -> (original, {"table.column", ...})
+        for (table, column), values in (sample_values or {}).items():
+            for value in values:
+                key = normalize_question(value)
+                if len(key) < MIN_VALUE_CHARS or len(key.split()) > MAX_VALUE_WORDS or NUMBER_RE.fullmatch(key):
+                    continue
+                original, columns = self.values.setdefault(key, (value, set()))
+                columns.add(f"{table}.{column}")
+
+    def find(self, question, taken):
+        # Longest phrases first, so "new york" wins over "york".
+        words = [(m.start(), m.end()) for m in re.finditer(r"\S+", question)]
+        found = []
+        for size in range(min(MAX_VALUE_WORDS, len(words)), 0, -1):
+            for i in range(len(words) - size + 1):
+                start, end = words[i][0], words[i + size - 1][1]
+                item = self.values.get(question[start:end])
+                if item is None or _overlaps(start, end, taken):
+                    continue
+                taken.append((start, end))
+                found.append(Literal("value", question[start:end], start, end, item[1], item[0]))
+        return found
+
+
+def _overlaps(start, end, taken):
+    return any(start < t_end and t_start < end for t_start, t_end in taken)
+
+
+def extract_literals(question, lexicon=None):
+    # `question` is already normalized; literals come back in text order.
+    literals, taken = [], []
+
+    for m in INTERVAL_RE.finditer(question):
+        start = m.start(1) if m.group(1) else m.start(2)
+        literals.append(Literal("interval", (int(m.group(1) or 1), m.group(2)), start, m.end()))
+        taken.append((start, m.end()))
+
+    for m in DATE_RE.finditer(question):
+        if not _overlaps(m.start(), m.end(), taken):
+            literals.append(Literal("date", m.group(), m.start(), m.end()))
+            taken.append((m.start(), m.end()))
+
+    for m in NUMBER_RE.finditer(question):
+        if not _overlaps(m.start(), m.end(), taken):
+            literals.append(Literal("number", float(m.group().replace(",", "")), m.start(), m.end()))
+            taken.append((m.start(), m.end()))
+
+    if lexicon is not None:
+        literals.extend(lexicon.find(question, taken))
+    return sorted(literals, key=lambda lit: lit.start)
+
+
+def skeleton(question, literals):
+    # The question with every literal replaced by a placeholder of its kind.
+    parts, last = [], 0
+    for lit in literals:
+        parts.append(question[last:lit.start])
+        parts.append("{" + lit.kind + "}")
+        last = lit.end
+    parts.append(question[last:])
+    return "".join(parts)
+
+
+def literal_key(lit):
+    return lit.kind, lit.value
+
+
+# ---------------- SQL SLOTS ----------------
+
+def _number_text(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _interval_days(n, unit):
+    factor, base = UNIT_IN.get(unit, (1, unit))
+    return n * factor, base
+
+
+def _matches(lit, kind, text):
+    if lit.kind == "number":
+        try:
+            return float(text.strip()) == lit.value
+        except ValueError:
+            return False
+    if kind != "string":
+        return False
+    if lit.kind == "date":
+        return text.startswith(lit.value)
+    if lit.kind == "interval":
+        m = SQL_INTERVAL_RE.match(text)
+        if m is None:
+            return False
+        unit = m.group(4).lower()
+        n, lit_unit = lit.value
+        return (int(m.group(2)), unit) in {(n, lit_unit), _interval_days(n, lit_unit)}
+    return normalize_question(text.strip("%")) == lit.value
+
+
+def _quote(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def render(lit, kind, text):
+    # SQL for the slot that held `text`, rewritten for the new literal `lit`.
+    # None when the literal cannot take the slot's place.
+    if lit.kind == "number":
+        number = _number_text(lit.value)
+        if text.isdigit() and text.startswith("0") and len(text) > 1:
+            # strftime('%m', ...) = '03' stays two digits; 2.5 has no such form.
+            if not number.isdigit():
+                return None
+            number = number.zfill(len(text))
+        return _quote(number) if kind == "string" else number
+
+    if lit.kind == "date":
+        return _quote(lit.value + text[10:])
+
+    if lit.kind == "interval":
+        m = SQL_INTERVAL_RE.match(text)
+        n, unit = lit.value
+        if unit != m.group(4).lower():
+            n, unit = _interval_days(n, unit)
+        if m.group(4).isupper():
+            unit = unit.upper()
+        return _quote(m.group(1) + str(n) + m.group(3) + unit + m.group(5) + m.group(6))
+
+    # Column value: keep the cached SQL's LIKE wildcards and letter case.
+    core = text.strip("%")
+    lead, trail = text[:len(text) - len(text.lstrip("%"))], text[len(text.rstrip("%")):]
+    value = lit.original
+    if core.islower():
+        value = value.lower()
+    elif core.isupper():
+        value = value.upper()
+    return _quote(lead + value + trail)
+
+
+class Template:
+    def __init__(self, sql, literals, slots, fixed):
+        self.sql = sql
+        self.literals = literals    # Literal per placeholder, in question order
+        self.slots = slots          # (literal index, kind, text, start, end) per SQL literal to rewrite
+        self.fixed = fixed          # literal indexes that must repeat as-is (not found in the SQL)
+
+    def bind(self, literals):
+        # The cached SQL with the new question's literals, or None when
+        # they do not fit this template.
+        for i, (old, new) in enumerate(zip(self.literals, literals)):
+            if i in self.fixed and literal_key(old) != literal_key(new):
+                return None
+            if old.kind == "value" and not old.columns & new.columns:
+                return None
+
+        sql = self.sql
+        for i, kind, text, start, end in sorted(self.slots, key=lambda slot: slot[3], reverse=True):
+            value = render(literals[i], kind, text)
+            if value is None:
+                return None
+            sql = sql[:start] + value + sql[end:]
+        return sql
+
+
+def build_template(question, sql, lexicon=None):
+    literals = extract_literals(question, lexicon)
+    if not literals:
+        return None, None
+
+    spans = literal_spans(sql)
+    slots, fixed, used = [], set(), set()
+    for i, lit in enumerate(literals):
+        hits = [(kind, text, start, end) for kind, text, start, end in spans
+                if start not in used and _matches(lit, kind, text)]
+        # A bare number seen more than once in the SQL is ambiguous; the
+        # template only applies to questions repeating it.
+        if not hits or (lit.kind == "number" and len(hits) > 1):
+            fixed.add(i)
+            continue
+        for kind, text, start, end in hits:
+            used.add(start)
+            slots.append((i, kind, text, start, end))
+
+    if not slots:
+        return None, None
+    return skeleton(question, literals), Template(sql, literals, slots, fixed)
+
+
+# ---------------- INDEX ----------------
+
+class TemplateIndex:
+    """Templates of the question/SQL pairs in one semantic cache partition,
+    keyed by question skeleton. Built incrementally as the partition grows."""
+
+    def __init__(self, sample_values=None):
+        self.sample_values = sample_values
+        self.lexicon = ValueLexicon(sample_values)
+        self.templates = defaultdict(list)  # skeleton -> [Template, newest first]
+        self.seen = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(t) for t in self.templates.values())
+
+    def sync(self, questions, sqls):
+        with self._lock:
+            # Appended by another thread in two steps; only complete pairs.
+            end = min(len(questions), len(sqls))
+            for question, sql in zip(questions[self.seen:end], sqls[self.seen:end]):
+                key, template = build_template(normalize_question(question), sql, self.lexicon)
+                if template is not None:
+                    self.templates[key].insert(0, template)
+            self.seen = max(self.seen, end)
+
+    def match(self, question):
+        question = normalize_question(question)
+        literals = extract_literals(question, self.lexicon)
+        if not literals:
+            return None
+        with self._lock:
+            candidates = list(self.templates.get(skeleton(question, literals), ()))
+        for template in candidates:
+            sql = template.bind(literals)
+            if sql is not None:
+                return sql
+        return None
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def _outdated(index, sample_values):
+    # Sample values arrive after the first lookups; rebuild with them.
+    return index is None or (sample_values and index.sample_values is not sample_values)
+
+
+def get_template_index(partition, sample_values=None):
+    index = _indexes.get(partition)
+    if _outdated(index, sample_values):
+        with _index_lock:
+            index = _indexes.get(partition)
+            if _outdated(index, sample_values):
+                index = TemplateIndex(sample_values)
+                _indexes[partition] = index
+    return index
+
+
+def get_template_sql(question, partition, sample_values=None, tables=None):
+    semantic = get_semantic_index(partition, tables)
+    index = get_template_index(partition, sample_values)
+    with span("template.match") as current:
+        index.sync(semantic.questions, semantic.sqls)
+        sql = index.match(question)
+        current.set(templates=len(index))
+    return sql
+
+
+def same_literals(question, other, partition, sample_values=None):
+    # Whether two questions carry the same literals, e.g. to keep a
+    # semantic hit for "last 7 days" from answering "last year".
+    lexicon = get_template_index(partition, sample_values).lexicon
+    a = extract_literals(normalize_question(question), lexicon)
+    b = extract_literals(normalize_question(other), lexicon)
+    return sorted(map(literal_key, a)) == sorted(map(literal_key, b))
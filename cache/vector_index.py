@@ -0,0 +1,107 @@
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyIndex:
+    """Exact inner-product search over pre-normalized rows.
+
+    Rows live in segments: the memory-mapped matrix loaded from disk plus an
+    in-memory tail that grows by doubling, so adds never copy the base."""
+
+    name = "numpy"
+
+    def __init__(self, dim, base=None):
+        self.dim = dim
+        self._base = base if base is not None else np.empty((0, dim), dtype=np.float32)
+        self._tail = np.empty((64, dim), dtype=np.float32)
+        self._tail_size = 0
+
+    def __len__(self):
+        return len(self._base) + self._tail_size
+
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        needed = self._tail_size + len(vectors)
+        if needed > len(self._tail):
+            grown = np.empty((max(needed, 2 * len(self._tail)), self.dim), dtype=np.float32)
+            grown[:self._tail_size] = self._tail[:self._tail_size]
+            self._tail = grown
+        self._tail[self._tail_size:needed] = vectors
+        self._tail_size = needed
+
+    def search(self, query, k=1):
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        scores = []
+        if len(self._base):
+            scores.append(self._base @ query)
+        if self._tail_size:
+            scores.append(self._tail[:self._tail_size] @ query)
+        if not scores:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        scores = np.concatenate(scores) if len(scores) > 1 else scores[0]
+        k = min(k, len(scores))
+        if k == 1:
+            ids = np.array([np.argmax(scores)])
+        else:
+            ids = np.argpartition(-scores, k - 1)[:k]
+            ids = ids[np.argsort(-scores[ids])]
+        return scores[ids], ids
+
+
+class FaissIndex:
+    """Approximate search through faiss HNSW (inner product), used when the
+    optional faiss package is installed."""
+
+    name = "faiss"
+
+    def __init__(self, dim, base=None, m=32):
+        self.dim = dim
+        self._index = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+        if base is not None and len(base):
+            self.add(base)
+
+    def __len__(self):
+        return self._index.ntotal
+
+    def add(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self._index.add(vectors)
+
+    def search(self, query, k=1):
+        query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, self.dim)
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        scores, ids = self._index.search(query, k)
+        keep = ids[0] >= 0
+        return scores[0][keep], ids[0][keep]
+
+
+BACKENDS = {
+    "numpy": NumpyIndex,
+    "faiss": FaissIndex,
+}
+
+
+def make_index(dim, base=None, backend="auto"):
+    if backend == "auto":
+        backend = "faiss" if faiss is not None else "numpy"
+    if backend == "faiss" and faiss is None:
+        raise ImportError("faiss backend requested but faiss is not installed")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported index backend: {backend}")
+    return BACKENDS[backend](dim, base=base)
@@ -0,0 +1,38 @@
+import atexit
+import sqlite3
+import threading
+
+
+class WriteBehind:
+    """Flusher thread for the stores that queue writes in memory: calls
+    `flush` every `interval` seconds, when woken, and once more on close()
+    (registered with atexit). SQLite errors leave the queue for the next
+    round."""
+
+    def __init__(self, flush, interval, name):
+        self._flush = flush
+        self.interval = interval
+        self.closed = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self.closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self._flush()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._wake.set()
+        self._flush()
@@ -0,0 +1,52 @@
+import os
+import sys
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _load_dotenv():
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+def _streamlit_secret(name):
+    # Only consult st.secrets when running under Streamlit; importing it just
+    # to read a setting would pull the whole UI stack into headless jobs.
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        return st.secrets.get(name)
+    except Exception:
+        return None
+
+
+def get_setting(name, default=None):
+    _load_dotenv()
+
+    value = os.environ.get(name)
+    if value is None:
+        value = _streamlit_secret(name)
+    if value is None:
+        return default
+    return value
+
+
+def get_int(name, default):
+    value = get_setting(name)
+    return int(value) if value not in (None, "") else default
+
+
+def get_float(name, default):
+    value = get_setting(name)
+    return float(value) if value not in (None, "") else default
+
+
+def get_bool(name, default=False):
+    value = get_setting(name)
+    if value in (None, ""):
+        return default
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
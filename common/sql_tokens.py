@@ -0,0 +1,106 @@
+import re
+from collections import namedtuple
+
+# kind: keyword | ident | string | number | param | op
+Token = namedtuple("Token", ["kind", "value", "upper"])
+
+KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "GROUP", "BY", "HAVING", "ORDER", "LIMIT", "OFFSET",
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL", "ON", "USING",
+    "AS", "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "ILIKE", "BETWEEN", "EXISTS",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "DISTINCT", "ALL", "UNION", "INTERSECT", "EXCEPT",
+    "WITH", "RECURSIVE", "OVER", "PARTITION", "ASC", "DESC", "NULLS", "FIRST", "LAST",
+    "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "REPLACE", "TRUNCATE",
+    "ATTACH", "DETACH", "PRAGMA", "GRANT", "REVOKE", "MERGE", "VACUUM", "REINDEX",
+    "INTO", "VALUES", "SET", "TRUE", "FALSE", "CAST", "ROWS", "RANGE", "PRECEDING",
+    "FOLLOWING", "UNBOUNDED", "CURRENT", "ROW", "FILTER", "WINDOW", "INTERVAL", "ESCAPE",
+}
+
+AGGREGATES = {
+    "COUNT", "SUM", "AVG", "MIN", "MAX", "TOTAL", "GROUP_CONCAT", "STRING_AGG",
+    "ARRAY_AGG", "STDDEV", "VARIANCE", "MEDIAN",
+}
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<param>\?|:\w+|%\(\w+\)s|\$\d+)
+  | (?P<op><>|!=|>=|<=|\|\||::|[-+*/%=<>(),.;])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize(sql):
+    tokens = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        value = match.group()
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "word":
+            upper = value.upper()
+            kind = "keyword" if upper in KEYWORDS else "ident"
+        elif kind == "qident":
+            value = value[1:-1]
+            upper = value.upper()
+            kind = "ident"
+        elif kind == "other":
+            kind = "op"
+            upper = value
+        else:
+            upper = value.upper()
+        tokens.append(Token(kind, value, upper))
+    return tokens
+
+
+def literal_spans(sql):
+    # (kind, value, start, end) for every string and number literal, with
+    # string values unquoted; offsets are into `sql`.
+    spans = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind == "string":
+            spans.append(("string", match.group()[1:-1].replace("''", "'"), match.start(), match.end()))
+        elif kind == "number":
+            spans.append(("number", match.group(), match.start(), match.end()))
+    return spans
+
+
+def with_depth(tokens):
+    depth = 0
+    for token in tokens:
+        if token.value == ")":
+            depth -= 1
+        yield depth, token
+        if token.value == "(":
+            depth += 1
+
+
+def split_statements(tokens):
+    statements = [[]]
+    for depth, token in with_depth(tokens):
+        if token.value == ";" and depth == 0:
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    return [s for s in statements if s]
+
+
+def canonicalize(sql):
+    # Whitespace, comments, keyword case and a trailing ';' do not change
+    # what a query returns; identifiers and literals are kept verbatim.
+    parts = []
+    for token in tokenize(sql):
+        if token.kind == "keyword":
+            parts.append(token.upper)
+        elif token.kind == "ident" and not token.value.isidentifier():
+            parts.append(f'"{token.value}"')
+        else:
+            parts.append(token.value)
+    while parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts)
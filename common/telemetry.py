@@ -0,0 +1,286 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from common.config import get_int, get_setting
+
+# Samples kept per span name for the rolling p50/p95.
+WINDOW = get_int("METRICS_WINDOW", 1_000)
+# JSONL file that receives every finished span; unset = no span log.
+TRACE_LOG = get_setting("TRACE_LOG")
+PREFIX = "text2sql"
+
+_current = ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+
+
+# ---------------- METRICS ----------------
+
+class Histogram:
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """Process-wide span latencies (rolling window) and labelled counters."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.histograms = {}
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.window)
+            histogram.observe(seconds)
+
+    def incr(self, name, value=1, **labels):
+        with self._lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def latency(self):
+        # -> {span: {"count", "p50_ms", "p95_ms", "mean_ms"}}
+        with self._lock:
+            return {
+                name: {
+                    "count": h.count,
+                    "p50_ms": h.quantile(0.5) * 1000,
+                    "p95_ms": h.quantile(0.95) * 1000,
+                    "mean_ms": h.total / h.count * 1000,
+                }
+                for name, h in sorted(self.histograms.items())
+            }
+
+    def counter_values(self, name):
+        with self._lock:
+            return [(dict(labels), value) for (n, labels), value in sorted(self.counters.items()) if n == name]
+
+    def cache_rates(self, counter="cache_lookups_total", by="tier"):
+        # -> {tier: {"hits", "misses", "hit_rate"}}; by="site" with
+        # counter="llm_cache_lookups_total" for the LLM response cache.
+        rates = defaultdict(lambda: {"hits": 0, "misses": 0})
+        for labels, value in self.counter_values(counter):
+            rates[labels[by]]["hits" if labels["result"] == "hit" else "misses"] += int(value)
+        for tier in rates.values():
+            lookups = tier["hits"] + tier["misses"]
+            tier["hit_rate"] = tier["hits"] / lookups if lookups else 0.0
+        return dict(rates)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+        return {"latency": self.latency(), "counters": counters}
+
+    def prometheus(self):
+        lines = [
+            f"# HELP {PREFIX}_span_seconds Latency of pipeline stages over the last {self.window} samples.",
+            f"# TYPE {PREFIX}_span_seconds summary",
+        ]
+        with self._lock:
+            for name, h in sorted(self.histograms.items()):
+                label = f'span="{_escape(name)}"'
+                for q in (0.5, 0.95):
+                    lines.append(f'{PREFIX}_span_seconds{{{label},quantile="{q}"}} {h.quantile(q):.6f}')
+                lines.append(f"{PREFIX}_span_seconds_sum{{{label}}} {h.total:.6f}")
+                lines.append(f"{PREFIX}_span_seconds_count{{{label}}} {h.count}")
+
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {PREFIX}_{name} counter")
+                rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{PREFIX}_{name}{{{rendered}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def write_prometheus(path):
+    # Atomic rewrite, for node_exporter's textfile collector.
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(_metrics.prometheus())
+    os.replace(tmp, path)
+
+
+# ---------------- SPANS ----------------
+
+class Span:
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.parent = parent
+        self.span_id = next(_ids)
+        self.trace_id = parent.trace_id if parent is not None else f"{os.getpid():x}-{self.span_id:x}"
+        self.attrs = dict(attrs)
+        self.stages = {}            # child span name -> seconds
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def _finish(current):
+    current.duration = time.perf_counter() - current.started
+    if current.parent is not None:
+        stages = current.parent.stages
+        stages[current.name] = stages.get(current.name, 0.0) + current.duration
+    _metrics.observe(current.name, current.duration)
+    _log_span(current)
+
+
+@contextmanager
+def span(name, **attrs):
+    # Not for use across a yield: see traced().
+    current = Span(name, _current.get(), attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        _finish(current)
+
+
+def traced(name, iterator, **attrs):
+    """A span around consuming `iterator` (e.g. LLM tokens), parented where
+    traced() is called. It is current only while the iterator runs, never
+    across a yield, so a consumer in another context or one that stops
+    early does not inherit it."""
+    current = Span(name, _current.get(), attrs)
+
+    def run():
+        try:
+            while True:
+                token = _current.set(current)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield item
+        except GeneratorExit:
+            current.attrs["abandoned"] = True
+            raise
+        except BaseException as e:
+            current.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                token = _current.set(current)
+                try:
+                    close()
+                finally:
+                    _current.reset(token)
+            _finish(current)
+
+    return run()
+
+
+def current_span():
+    return _current.get()
+
+
+def _site():
+    # Nearest enclosing span that is not an LLM call itself.
+    node = _current.get()
+    while node is not None and node.name.startswith("llm"):
+        node = node.parent
+    return node.name if node is not None else "other"
+
+
+def record_cache(tier, hit):
+    _metrics.incr("cache_lookups_total", tier=tier, result="hit" if hit else "miss")
+    current = _current.get()
+    if current is not None:
+        current.attrs[f"cache_{tier}"] = "hit" if hit else "miss"
+
+
+def record_llm_cache(hit):
+    _metrics.incr("llm_cache_lookups_total", site=_site(), result="hit" if hit else "miss")
+    current = _current.get()
+    if current is not None:
+        current.attrs["cached"] = hit
+
+
+def record_llm(usage):
+    site = _site()
+    _metrics.incr("llm_calls_total", site=site)
+    if usage is None:
+        return
+    tokens = {kind: getattr(usage, f"{kind}_tokens", 0) or 0 for kind in ("prompt", "completion")}
+    for kind, value in tokens.items():
+        _metrics.incr("llm_tokens_total", value, site=site, kind=kind)
+    current = _current.get()
+    if current is not None:
+        current.set(prompt_tokens=tokens["prompt"], completion_tokens=tokens["completion"])
+
+
+# ---------------- SPAN LOG ----------------
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def _log_span(finished):
+    global _log
+    if not TRACE_LOG:
+        return
+    record = {
+        "trace": finished.trace_id,
+        "span": finished.span_id,
+        "parent": finished.parent.span_id if finished.parent is not None else None,
+        "name": finished.name,
+        "start": round(finished.start_time, 6),
+        "duration_ms": round(finished.duration * 1000, 3),
+        "attrs": finished.attrs,
+    }
+    line = json.dumps(record, default=str) + "\n"
+    with _log_lock:
+        if _log is None:
+            _log = open(TRACE_LOG, "a", encoding="utf-8", buffering=1)
+        _log.write(line)
@@ -1,12 +1,57 @@
+import argparse
+import os
+import random
 import sqlite3
+import time
 from datetime import datetime, timedelta
-import random
+
+import numpy as np
 
 DB_NAME = "database/data.db"
 
 # Make dataset reproducible
 random.seed(42)
 
+# Scaled datasets: SF1 = 1M orders, ~3M order items.
+ORDERS_PER_SF = 1_000_000
+ORDERS_PER_CUSTOMER = 10
+ORDERS_PER_PRODUCT = 1_000
+MAX_ITEMS_PER_ORDER = 5
+BATCH_ROWS = 100_000
+
+CITIES = [
+    "Mumbai", "Delhi", "Bangalore", "Hyderabad", "Chennai", "Kolkata", "Pune", "Ahmedabad",
+    "Jaipur", "Surat", "Lucknow", "Kanpur", "Nagpur", "Indore", "Bhopal", "Patna",
+    "Vadodara", "Coimbatore", "Kochi", "Chandigarh",
+]
+CATEGORIES = [
+    "Electronics", "Fashion", "Accessories", "Home", "Beauty", "Sports", "Books", "Toys",
+    "Grocery", "Furniture",
+]
+
+START_DATE = np.datetime64("2021-01-01T00:00:00")
+DATE_RANGE_DAYS = 3 * 365
+
+# Settings for a one-shot load into a fresh file: no rollback journal, no
+# fsyncs and a large page cache. The finished file is switched back to a
+# normal journal before it is closed.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+]
+
+INDEXES = [
+    "CREATE INDEX idx_orders_customer_id ON orders(customer_id)",
+    "CREATE INDEX idx_orders_order_date ON orders(order_date)",
+    "CREATE INDEX idx_order_items_order_id ON order_items(order_id)",
+    "CREATE INDEX idx_order_items_product_id ON order_items(product_id)",
+    "CREATE INDEX idx_customers_city ON customers(city)",
+    "CREATE INDEX idx_products_category ON products(category)",
+]
+
 
 # ===============================
 # TABLE CREATION
@@ -59,22 +104,45 @@ def create_tables(cursor):
     """)
 
 
+def update_order_totals(cursor):
+    # One set-based pass instead of a price lookup and UPDATE per item.
+    cursor.execute("""
+    UPDATE orders
+    SET total_amount = totals.amount
+    FROM (
+        SELECT oi.order_id, SUM(oi.quantity * p.price) AS amount
+        FROM order_items oi
+        JOIN products p ON p.product_id = oi.product_id
+        GROUP BY oi.order_id
+    ) AS totals
+    WHERE orders.order_id = totals.order_id
+    """)
+
+
+def create_indexes(cursor):
+    for statement in INDEXES:
+        cursor.execute(statement)
+    cursor.execute("ANALYZE")
+
+
 # ===============================
-# SEED DATA
+# SEED DATA (demo dataset)
 # ===============================
 
 def seed_customers(cursor):
     cities = ["Chennai", "Hyderabad", "Bangalore", "Mumbai", "Delhi"]
 
-    for i in range(50):
-        cursor.execute("""
-        INSERT INTO customers (name, city, signup_date)
-        VALUES (?, ?, ?)
-        """, (
+    cursor.executemany("""
+    INSERT INTO customers (name, city, signup_date)
+    VALUES (?, ?, ?)
+    """, (
+        (
             f"Customer_{i+1}",
             cities[i % len(cities)],
-            datetime(2022, 1, 1) + timedelta(days=i * 5)
-        ))
+            str(datetime(2022, 1, 1) + timedelta(days=i * 5))
+        )
+        for i in range(50)
+    ))
 
 
 def seed_products(cursor):
@@ -96,72 +164,171 @@ def seed_products(cursor):
 
 
 def seed_orders_and_items(cursor):
+    orders = []
+    items = []
 
     for order_index in range(200):
-
+        order_id = order_index + 1
         customer_id = (order_index % 50) + 1
         order_date = datetime(2023, 1, 1) + timedelta(days=order_index)
-
-        # Insert order first with dummy total
-        cursor.execute("""
-        INSERT INTO orders (customer_id, order_date, total_amount)
-        VALUES (?, ?, ?)
-        """, (customer_id, order_date, 0))
-
-        order_id = cursor.lastrowid
-
-        total_amount = 0
+        orders.append((order_id, customer_id, str(order_date), 0))
 
         # Add 1–3 items per order
         for _ in range((order_index % 3) + 1):
-
             product_id = random.randint(1, 8)
             quantity = random.randint(1, 4)
+            items.append((order_id, product_id, quantity))
+
+    cursor.executemany("""
+    INSERT INTO orders (order_id, customer_id, order_date, total_amount)
+    VALUES (?, ?, ?, ?)
+    """, orders)
 
-            cursor.execute("""
-            INSERT INTO order_items (order_id, product_id, quantity)
-            VALUES (?, ?, ?)
-            """, (order_id, product_id, quantity))
+    cursor.executemany("""
+    INSERT INTO order_items (order_id, product_id, quantity)
+    VALUES (?, ?, ?)
+    """, items)
 
-            # Fetch product price
-            cursor.execute("SELECT price FROM products WHERE product_id = ?", (product_id,))
-            price = cursor.fetchone()[0]
+    update_order_totals(cursor)
 
-            total_amount += price * quantity
 
-        # Update total_amount properly
-        cursor.execute("""
-        UPDATE orders
-        SET total_amount = ?
-        WHERE order_id = ?
-        """, (total_amount, order_id))
+# ===============================
+# SCALED DATA
+# ===============================
+
+def zipf_choice(rng, n, size, skew):
+    # Bounded Zipf over n ids: rank r is drawn with weight 1 / r**skew. Ranks
+    # are shuffled onto ids so the hot keys are not simply the lowest ids.
+    if skew <= 0:
+        return rng.integers(1, n + 1, size=size)
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    ranks = rng.choice(n, size=size, p=weights / weights.sum())
+    return rng.permutation(n)[ranks] + 1
+
+
+def format_timestamps(values):
+    return np.char.replace(np.datetime_as_string(values, unit="s"), "T", " ")
+
+
+def insert_batches(cursor, statement, columns):
+    total = len(columns[0])
+    for start in range(0, total, BATCH_ROWS):
+        chunk = [column[start:start + BATCH_ROWS].tolist() for column in columns]
+        cursor.executemany(statement, zip(*chunk))
+
+
+def seed_scaled(cursor, scale_factor, seed=42, skew=1.0):
+    rng = np.random.default_rng(seed)
+    n_orders = max(1, int(scale_factor * ORDERS_PER_SF))
+    n_customers = max(1, n_orders // ORDERS_PER_CUSTOMER)
+    n_products = max(len(CATEGORIES), n_orders // ORDERS_PER_PRODUCT)
+
+    print(f"Seeding {n_customers:,} customers...")
+    customer_ids = np.arange(1, n_customers + 1)
+    cities = np.array(CITIES)[zipf_choice(rng, len(CITIES), n_customers, 1.0) - 1]
+    signup_days = rng.integers(0, DATE_RANGE_DAYS, size=n_customers).astype("timedelta64[D]")
+    insert_batches(cursor, "INSERT INTO customers (customer_id, name, city, signup_date) VALUES (?, ?, ?, ?)", [
+        customer_ids,
+        np.char.add("Customer_", customer_ids.astype(str)),
+        cities,
+        format_timestamps(START_DATE + signup_days),
+    ])
+
+    print(f"Seeding {n_products:,} products...")
+    product_ids = np.arange(1, n_products + 1)
+    categories = np.array(CATEGORIES)[zipf_choice(rng, len(CATEGORIES), n_products, 1.0) - 1]
+    prices = np.round(np.clip(rng.lognormal(8.0, 1.2, size=n_products), 99, 250_000), -1)
+    insert_batches(cursor, "INSERT INTO products (product_id, product_name, category, price) VALUES (?, ?, ?, ?)", [
+        product_ids,
+        np.char.add(np.char.add(categories, " Item "), product_ids.astype(str)),
+        categories,
+        prices,
+    ])
+
+    print(f"Seeding {n_orders:,} orders...")
+    order_ids = np.arange(1, n_orders + 1)
+    # Sorted so order_id grows with order_date, as in a real system.
+    order_seconds = np.sort(rng.integers(0, DATE_RANGE_DAYS * 86_400, size=n_orders)).astype("timedelta64[s]")
+    insert_batches(cursor, "INSERT INTO orders (order_id, customer_id, order_date, total_amount) VALUES (?, ?, ?, ?)", [
+        order_ids,
+        zipf_choice(rng, n_customers, n_orders, skew),
+        format_timestamps(START_DATE + order_seconds),
+        np.zeros(n_orders),
+    ])
+
+    item_counts = rng.integers(1, MAX_ITEMS_PER_ORDER + 1, size=n_orders)
+    n_items = int(item_counts.sum())
+    print(f"Seeding {n_items:,} order items...")
+    insert_batches(cursor, "INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, ?)", [
+        np.repeat(order_ids, item_counts),
+        zipf_choice(rng, n_products, n_items, skew),
+        rng.integers(1, 5, size=n_items),
+    ])
+
+    print("Computing order totals...")
+    update_order_totals(cursor)
 
 
 # ===============================
 # INIT DB
 # ===============================
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+def init_db(db_name=DB_NAME, scale_factor=None, seed=42, skew=1.0, indexes=False):
+    # Build next to the target and swap it in, so readers never see a
+    # half-loaded file.
+    building = db_name + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(building)
     cursor = conn.cursor()
+    for pragma in BULK_LOAD_PRAGMAS:
+        cursor.execute(pragma)
 
     print("Creating tables...")
     create_tables(cursor)
 
-    print("Seeding customers...")
-    seed_customers(cursor)
+    if scale_factor is None:
+        print("Seeding customers...")
+        seed_customers(cursor)
 
-    print("Seeding products...")
-    seed_products(cursor)
+        print("Seeding products...")
+        seed_products(cursor)
 
-    print("Seeding orders and order items...")
-    seed_orders_and_items(cursor)
+        print("Seeding orders and order items...")
+        seed_orders_and_items(cursor)
+    else:
+        seed_scaled(cursor, scale_factor, seed=seed, skew=skew)
+
+    if indexes:
+        print("Creating indexes...")
+        create_indexes(cursor)
 
     conn.commit()
+    cursor.execute("PRAGMA journal_mode = DELETE")
     conn.close()
+    os.replace(building, db_name)
+
+    print(f"Database '{db_name}' created successfully in {time.perf_counter() - started:.1f}s!")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and seed the sample SQLite database.")
+    parser.add_argument("--scale-factor", "--sf", type=float,
+                        help="synthetic dataset size; SF1 = 1M orders (default: the small demo dataset)")
+    parser.add_argument("-o", "--output", help="database path (default: database/data.db, or database/data_sf<N>.db when scaled)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for scaled datasets")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent for customer/product popularity; 0 = uniform")
+    parser.add_argument("--indexes", action="store_true", help="create foreign-key and filter indexes, then ANALYZE")
+    args = parser.parse_args(argv)
+
+    db_name = args.output
+    if db_name is None:
+        db_name = DB_NAME if args.scale_factor is None else f"database/data_sf{args.scale_factor:g}.db"
 
-    print(f"Database '{DB_NAME}' created successfully!")
+    init_db(db_name, scale_factor=args.scale_factor, seed=args.seed, skew=args.skew, indexes=args.indexes)
 
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    main()